@@ -1,5 +1,29 @@
-from db import get_db, get_databases, get_habit_tasks, get_tracking_data, get_creation_date, get_periodicity
+from db import get_readonly_db, get_databases, advance_streaks, get_habit_stats, get_profile_path, \
+    get_check_off_periods, get_all_habit_stats, get_streaks_sql, get_grouped_check_off_days, \
+    is_consolidated, get_store_longest_streak, get_period, get_creation_date, get_habit_bits, get_all_habit_bits
+from bitset import get_streaks as get_bit_streaks, count_periods
+from habit import load_habits
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import date, timedelta
+from itertools import repeat
+from functools import lru_cache
+import json
+import os
+
+
+@lru_cache(maxsize=None)
+def import_numpy():
+    """
+    Import NumPy on first use of the "numpy" streak backend, so that importing the analysis module stays fast.
+
+    return: the numpy module, or None if NumPy is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 
 
 def print_currently_tracked_habits(db, periodicity=None):
@@ -13,109 +37,209 @@ def print_currently_tracked_habits(db, periodicity=None):
     param periodicity: periodicity of the habit task
     return:
     """
-    habit_tasks = get_habit_tasks(db)
-    i = 1
+    habits = load_habits(db, periodicity)
 
     if periodicity is None:
         print("Your currently tracked habits:")
-        for x in habit_tasks:
-            print(str(i) + ". " + x + " (" + get_periodicity(db, x) +
-                  ", since " + get_creation_date(db, x) + ")")
-            i += 1
+    else:
+        print(f"Your currently tracked {periodicity} habits:")
+    for i, x in enumerate(habits, start=1):
+        print(str(i) + ". " + x.task + " (" + x.periodicity + ", since " + str(x.creation_date) + ")")
+
 
-    elif periodicity == "daily":
-        print("Your currently tracked daily habits:")
-        for x in habit_tasks:
-            if get_periodicity(db, x) == "daily":
-                print(str(i) + ". " + x + " (" + get_periodicity(db, x) +
-                      ", since " + get_creation_date(db, x) + ")")
-                i += 1
+def calculate_streaks(periods):
+    """
+    Calculate the last and longest run streak of an ascending sequence of period ordinals (day or week ordinals) in
+    a single pass. Two periods belong to the same run streak if their ordinals differ by exactly one. Multiple
+    check-offs within the same period are counted only once.
+
+    param periods: ascending period ordinals of the check-offs
+    return: last and longest run streak
+    """
+    return advance_streaks(periods)[:2]
 
-    elif periodicity == "weekly":
-        print("Your currently tracked weekly habits:")
-        for x in habit_tasks:
-            if get_periodicity(db, x) == "weekly":
-                print(str(i) + ". " + x + " (" + get_periodicity(db, x) +
-                      ", since " + get_creation_date(db, x) + ")")
-                i += 1
 
+# Backends for the streak calculation:
+# "stats" -> read the streaks kept up to date in the "habit_stats" table
+# "python" -> recompute the streaks from the tracking data in a single pass in Python
+# "sql" -> recompute the streaks from the tracking data with a single SQL statement (window functions)
+# "numpy" -> recompute the streaks of all habits at once with vectorized NumPy operations (falls back to "python"
+# if NumPy is not installed)
+# "snapshot" -> recompute the streaks from the memory-mapped columnar snapshot of the profile, which is updated
+# incrementally when the profile changes (see snapshot.py)
+# "bitset" -> recompute the streaks with a run-length scan over the bitsets of the habits, which are kept up to date on
+# every check-off (see bitset.py)
+STREAK_BACKENDS = ("stats", "python", "sql", "numpy", "snapshot", "bitset")
+streak_backend = "stats"
 
-def get_last_and_longest_streak(db, task):
+
+def set_streak_backend(backend):
     """
-    Calculate the last and longest run streak for the given habit, represented by its task.
+    Select the backend that is used for the streak calculation by default.
+
+    param backend: one of STREAK_BACKENDS
+    return:
+    """
+    global streak_backend
+    if backend not in STREAK_BACKENDS:
+        raise ValueError(f"Unknown streak backend \"{backend}\". Choose one of {STREAK_BACKENDS}.")
+    streak_backend = backend
+
+
+def get_last_and_longest_streak(db, task, backend=None):
+    """
+    Return the last and longest run streak for the given habit, represented by its task. By default the streaks are
+    read from the "habit_stats" table, which is kept up to date on every check-off.
 
     param db: an initialized sqlite3 database connection
     param task: habit task
+    param backend: streak backend (None -> backend chosen with set_streak_backend)
     return: last and longest run streak for given habit
     """
+    backend = backend or streak_backend
+    if backend == "python":
+        return calculate_streaks(get_check_off_periods(db, task)[1])
+    elif backend == "sql":
+        return get_streaks_sql(db, task).get(task, (0, 0))
+    elif backend == "numpy":
+        periods = get_check_off_periods(db, task)[1]
+        if import_numpy() is None:
+            return calculate_streaks(periods)
+        return calculate_streaks_numpy([0] * len(periods), periods, 1)[0]
+    elif backend == "snapshot":
+        from snapshot import get_snapshot_streaks
+        return get_snapshot_streaks(db, task).get(task, (0, 0))
+    elif backend == "bitset":
+        return get_bit_streaks(get_habit_bits(db, task)[2])
+    return get_habit_stats(db, task)
 
-    def get_first_weekday_object(date_object):
-        """
-        Returns the first day of a specific week of the year as a date object, where the week
-        is extracted from the given date object.
 
-        param date_object: date object that holds the week of interest
-        return: date object of the first day of a specific week of the year
-        """
-        while date_object.weekday() > 0:
-            date_object = date_object - timedelta(1)
-        return date_object
+def get_all_streaks(db, backend=None):
+    """
+    Return the last and longest run streak of all habits stored in a given database.
 
-    tracking_data = get_tracking_data(db, task)
-    streak_counter = 1
-    highest_count_yet = 0
+    param db: an initialized sqlite3 database connection
+    param backend: streak backend (None -> backend chosen with set_streak_backend)
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    backend = backend or streak_backend
+    if backend == "python":
+        return {x.task: calculate_streaks(get_check_off_periods(db, x.task)[1]) for x in load_habits(db)}
+    elif backend == "sql":
+        return get_streaks_sql(db)
+    elif backend == "numpy":
+        if import_numpy() is None:
+            return get_all_streaks(db, "python")
+        return get_streaks_numpy(db)
+    elif backend == "snapshot":
+        from snapshot import get_snapshot_streaks
+        return get_snapshot_streaks(db)
+    elif backend == "bitset":
+        return {x: get_bit_streaks(y[2]) for x, y in get_all_habit_bits(db).items()}
+    return get_all_habit_stats(db)
 
-    if not tracking_data:
-        streak_counter = 0
-    else:
-        starting_date = date.fromisoformat(tracking_data[0][2])
-        for idx, x in enumerate(tracking_data):
-            if get_periodicity(db, task) == "daily":
-                check_off_date = date.fromisoformat(x[2])
-                time_delta = 1
-                if idx == 0:
-                    starting_date = date.fromisoformat(tracking_data[0][2])
-            else:
-                check_off_date = get_first_weekday_object(date.fromisoformat(x[2]))
-                time_delta = 7
-                if idx == 0:
-                    starting_date = get_first_weekday_object(date.fromisoformat(tracking_data[0][2]))
-            if (check_off_date - timedelta(time_delta)) == starting_date:
-                streak_counter += 1
-                starting_date = check_off_date
-            else:
-                if streak_counter > highest_count_yet:
-                    highest_count_yet = streak_counter
-                starting_date = check_off_date
-                streak_counter = 1
 
-    # when leaving the loop, streak_counter carries the last run streak
-    last_streak = streak_counter
+def count_check_offs(db, task, start_date=None, end_date=None):
+    """
+    Return the number of periods (days or weeks) in which the given habit, represented by its task, has been
+    checked-off, optionally only within a date range. The periods are counted in the bitset of the habit.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param start_date: first date of the range (date or "YYYY-MM-DD", None -> from the first check-off)
+    param end_date: last date of the range (date or "YYYY-MM-DD", None -> up to the last check-off)
+    return: number of checked-off periods
+    """
+    periodicity, first_period, bits = get_habit_bits(db, task)
+    if periodicity is None:
+        return 0
+    first, last = (None if x is None else get_period(to_date(x).toordinal(), periodicity)
+                   for x in (start_date, end_date))
+    return count_periods(bits, first_period, first, last)
+
+
+def calculate_streaks_numpy(habit_indices, periods, number_of_habits):
+    """
+    Calculate the last and longest run streak of many habits at once with vectorized NumPy operations. The check-offs
+    of all habits are passed in a grouped layout: the habit index and period ordinal of every check-off, sorted by
+    habit index and period.
+
+    param habit_indices: habit index (0 ... number_of_habits - 1) of every check-off
+    param periods: period ordinal of every check-off
+    param number_of_habits: number of habits
+    return: list of (last run streak, longest run streak) for every habit index
+    """
+    np = import_numpy()
+    habit_indices = np.asarray(habit_indices, dtype=np.int64)
+    periods = np.asarray(periods, dtype=np.int64)
+    last_streaks = np.zeros(number_of_habits, dtype=np.int64)
+    longest_streaks = np.zeros(number_of_habits, dtype=np.int64)
+    if periods.size:
+        # multiple check-offs within the same period are counted only once
+        new_habit = np.diff(habit_indices) != 0
+        unique = np.concatenate(([True], new_habit | (np.diff(periods) != 0)))
+        habit_indices, periods = habit_indices[unique], periods[unique]
+
+        # a run streak starts with the first period of a habit and after every gap between two periods
+        run_starts = np.flatnonzero(np.concatenate(([True], (np.diff(habit_indices) != 0) | (np.diff(periods) != 1))))
+        run_lengths = np.diff(np.append(run_starts, periods.size))
+        run_habits = habit_indices[run_starts]
+        np.maximum.at(longest_streaks, run_habits, run_lengths)
+        last_runs = np.flatnonzero(np.append(np.diff(run_habits) != 0, True))
+        last_streaks[run_habits[last_runs]] = run_lengths[last_runs]
+    return list(zip(last_streaks.tolist(), longest_streaks.tolist()))
+
 
-    if streak_counter > highest_count_yet:
-        highest_count_yet = streak_counter
+def get_streaks_numpy(db):
+    """
+    Calculate the last and longest run streak of all habits stored in a given database with NumPy. The check-off
+    days are loaded as a datetime64[D] array, weekly habits are mapped onto the Monday of their week.
 
-    return last_streak, highest_count_yet
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    np = import_numpy()
+    habits = get_grouped_check_off_days(db)
+    days = [np.fromstring(x[2], dtype=np.int64, sep=",") for x in habits]
+    counts = np.array([len(x) for x in days], dtype=np.int64)
+    days = np.concatenate(days) if days else np.zeros(0, dtype=np.int64)
+    # day ordinal 719163 is 1970-01-01, the epoch of datetime64
+    dates = (days - 719163).astype("datetime64[D]")
+    # 1970-01-01 is a Thursday, so (days since epoch + 3) % 7 is the number of days since Monday
+    epoch_days = dates.astype(np.int64)
+    week_starts = dates - ((epoch_days + 3) % 7).astype("timedelta64[D]")
+    weekly = np.repeat(np.array([x[1] == "weekly" for x in habits], dtype=bool), counts)
+    periods = np.where(weekly, (week_starts.astype(np.int64) + 3) // 7, epoch_days)
+    habit_indices = np.repeat(np.arange(len(habits)), counts)
+    order = np.lexsort((periods, habit_indices))
 
+    streaks = calculate_streaks_numpy(habit_indices[order], periods[order], len(habits))
+    return {x[0]: y for x, y in zip(habits, streaks)}
 
-def get_overall_longest_streak(db):
+
+def get_overall_longest_streak(db, backend=None):
     """
     Calculate the longest run streak over all habits stored in a given database.
 
     param db: an initialized sqlite3 database connection
+    param backend: streak backend (None -> backend chosen with set_streak_backend)
     return: longest run streak over all habits together with the respective habit(s) holding that streak
     """
 
-    habits_streaks = {}
+    return get_longest_streak_habits({x: y[1] for x, y in get_all_streaks(db, backend).items()})
+
+
+def get_longest_streak_habits(habits_streaks):
+    """
+    Return the longest of the given run streaks together with the habit(s) holding it.
+
+    param habits_streaks: dictionary habit task -> longest run streak
+    return: longest run streak (0 if there are no habits) and list of the habit(s) holding that streak
+    """
     habits_with_longest_streaks = []
-    habit_tasks = get_habit_tasks(db)
-    if not habit_tasks:
+    if not habits_streaks:
         overall_longest_streak = 0
-        habits_with_longest_streaks = []
     else:
-        for x in habit_tasks:
-            longest_streak = get_last_and_longest_streak(db, x)[1]
-            habits_streaks.update({x: longest_streak})
         overall_longest_streak = max(habits_streaks.values())
         for x in habits_streaks:
             if habits_streaks.get(x) == overall_longest_streak:
@@ -124,26 +248,405 @@ def get_overall_longest_streak(db):
     return overall_longest_streak, habits_with_longest_streaks
 
 
-def get_overall_longest_streak_all_databases(directory="habit profiles"):
+def to_date(value):
     """
-    Calculate the longest run streak over all habits and all databases.
+    Convert a date given as datetime.date or as "YYYY-MM-DD" string to a datetime.date.
 
-    param directory: directory with the databases of interest
-    return: longest run streak over all habits and all profiles together with the respective habit(s) holding
-    that streak
+    param value: date or ISO date string
+    return: datetime.date
+    """
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+class PeriodIndex:
+    # one index per habit is kept by dashboards, so it is kept as compact as possible
+    __slots__ = ("periodicity", "first_period", "prefix", "run_starts", "run_ends", "run_maxima")
+
+    def __init__(self, periods, periodicity="daily", creation_date=None):
+        """
+        Precomputed index of the check-offs of one habit, which answers range queries (check-offs, completion rate
+        and longest run streak within a date range) without going through the tracking data again:
+        - prefix sums over the period ordinals (see db.get_check_off_periods) from the first check-off period (or
+        the creation period of the habit) up to the last check-off period, so that the number of checked-off periods
+        in a range is a difference of two prefix sums (O(1))
+        - the run streaks as sorted start and end periods together with a sparse table of the maximal run lengths,
+        so that the longest run streak in a range is found with two binary searches and one table lookup (O(log n))
+
+        param periods: ascending period ordinals of the check-offs (duplicates are counted once)
+        param periodicity: periodicity of the habit
+        param creation_date: creation date of the habit (None -> date of the first check-off); periods before it
+        are not counted for completion rates
+        """
+        self.periodicity = periodicity
+        unique_periods = sorted(set(periods))
+        if creation_date is not None:
+            self.first_period = get_period(to_date(creation_date).toordinal(), periodicity)
+        else:
+            self.first_period = unique_periods[0] if unique_periods else None
+        if unique_periods and (self.first_period is None or unique_periods[0] < self.first_period):
+            # back-dated check-offs before the creation date
+            self.first_period = unique_periods[0]
+
+        # prefix[i] -> number of checked-off periods before first_period + i
+        length = unique_periods[-1] - self.first_period + 2 if unique_periods else 1
+        self.prefix = array("i", [0]) * length
+        for x in unique_periods:
+            self.prefix[x - self.first_period + 1] = 1
+        for i in range(1, length):
+            self.prefix[i] += self.prefix[i - 1]
+
+        self.run_starts = array("i")
+        self.run_ends = array("i")
+        for x in unique_periods:
+            if self.run_ends and self.run_ends[-1] == x - 1:
+                self.run_ends[-1] = x
+            else:
+                self.run_starts.append(x)
+                self.run_ends.append(x)
+        # run_maxima[k][i] -> longest run among the runs i to i + 2**k - 1
+        self.run_maxima = [array("i", (y - x + 1 for x, y in zip(self.run_starts, self.run_ends)))]
+        k = 1
+        while 2 ** k <= len(self.run_starts):
+            previous = self.run_maxima[-1]
+            half = 2 ** (k - 1)
+            self.run_maxima.append(array("i", (max(previous[i], previous[i + half])
+                                               for i in range(len(previous) - half))))
+            k += 1
+
+    def get_periods(self, start_date, end_date):
+        """
+        Return the first and last period ordinal of a date range.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        return: first and last period ordinal
+        """
+        return (get_period(to_date(start_date).toordinal(), self.periodicity),
+                get_period(to_date(end_date).toordinal(), self.periodicity))
+
+    def count_periods(self, first, last):
+        """
+        Return the number of checked-off periods between two period ordinals (both included).
+
+        param first: first period ordinal
+        param last: last period ordinal
+        return: number of checked-off periods
+        """
+        if self.first_period is None or last < first:
+            return 0
+        end = len(self.prefix) - 1
+        return (self.prefix[min(max(last - self.first_period + 1, 0), end)]
+                - self.prefix[min(max(first - self.first_period, 0), end)])
+
+    def count_check_offs(self, start_date, end_date):
+        """
+        Return the number of checked-off periods (days or weeks) in a date range.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        return: number of checked-off periods
+        """
+        return self.count_periods(*self.get_periods(start_date, end_date))
+
+    def get_completion_rate(self, start_date, end_date):
+        """
+        Return the share of the periods of a date range in which the habit has been checked-off. Periods before the
+        creation of the habit are left out.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        return: completion rate between 0 and 1 (None if the range ends before the creation of the habit)
+        """
+        first, last = self.get_periods(start_date, end_date)
+        if self.first_period is not None:
+            first = max(first, self.first_period)
+        if last < first or self.first_period is None:
+            return None
+        return self.count_periods(first, last) / (last - first + 1)
+
+    def get_longest_streak(self, start_date, end_date):
+        """
+        Return the longest run streak within a date range. Runs reaching over the bounds of the range are cut off
+        at the bounds.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        return: longest run streak within the range
+        """
+        first, last = self.get_periods(start_date, end_date)
+        # runs i to j overlap the range
+        i = bisect_left(self.run_ends, first)
+        j = bisect_right(self.run_starts, last) - 1
+        if i > j or last < first:
+            return 0
+        longest_streak = max(min(self.run_ends[x], last) - max(self.run_starts[x], first) + 1 for x in (i, j))
+        if j - i > 1:
+            # runs i + 1 to j - 1 lie completely within the range
+            k = (j - i - 1).bit_length() - 1
+            longest_streak = max(longest_streak, self.run_maxima[k][i + 1], self.run_maxima[k][j - 2 ** k])
+        return longest_streak
+
+    def get_streak_at(self, day):
+        """
+        Return the run streak reaching up to the period of a date, i.e. the last run streak as it was at that date.
+
+        param day: date (date or "YYYY-MM-DD")
+        return: run streak up to the period of the date (0 if the habit was not checked-off in that period)
+        """
+        period = get_period(to_date(day).toordinal(), self.periodicity)
+        i = bisect_right(self.run_starts, period) - 1
+        if i < 0 or self.run_ends[i] < period:
+            return 0
+        return period - self.run_starts[i] + 1
+
+    def get_rolling_consistency(self, end_date, window=30):
+        """
+        Return the completion rate of the window of days ending at the given date (e.g. the consistency of the last
+        30 days). For weekly habits the rate is taken over the weeks that overlap the window.
+
+        param end_date: last date of the window (date or "YYYY-MM-DD")
+        param window: length of the window in days
+        return: completion rate between 0 and 1 (None if the window ends before the creation of the habit)
+        """
+        end_date = to_date(end_date)
+        return self.get_completion_rate(end_date - timedelta(days=window - 1), end_date)
+
+    def get_rolling_consistencies(self, start_date, end_date, window=30):
+        """
+        Return the rolling consistency (see get_rolling_consistency) for every day of a date range.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        param window: length of the window in days
+        return: list of (date, completion rate) tuples
+        """
+        start_date = to_date(start_date)
+        return [(x, self.get_rolling_consistency(x, window))
+                for x in (start_date + timedelta(days=i) for i in range((to_date(end_date) - start_date).days + 1))]
+
+    def get_completion_rates(self, start_date, end_date, by="week"):
+        """
+        Return the completion rate of every calendar week (starting on Monday) or calendar month of a date range.
+        The first and last week or month are cut off at the bounds of the range.
+
+        param start_date: first date of the range (date or "YYYY-MM-DD")
+        param end_date: last date of the range (date or "YYYY-MM-DD")
+        param by: "week" or "month"
+        return: list of (first date of the week or month, completion rate) tuples
+        """
+        if by not in ("week", "month"):
+            raise ValueError(f"Unknown interval \"{by}\". Choose \"week\" or \"month\".")
+        start_date, end_date = to_date(start_date), to_date(end_date)
+        rates = []
+        if by == "week":
+            interval_start = start_date - timedelta(days=start_date.weekday())
+        else:
+            interval_start = start_date.replace(day=1)
+        while interval_start <= end_date:
+            if by == "week":
+                next_start = interval_start + timedelta(days=7)
+            else:
+                next_start = (interval_start + timedelta(days=31)).replace(day=1)
+            rates.append((interval_start, self.get_completion_rate(max(interval_start, start_date),
+                                                                  min(next_start - timedelta(days=1), end_date))))
+            interval_start = next_start
+        return rates
+
+
+def get_period_index(db, task):
+    """
+    Build the PeriodIndex of the given habit, represented by its task, from its tracking data.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: PeriodIndex of given habit (None if the habit does not exist)
+    """
+    periodicity, periods = get_check_off_periods(db, task)
+    if periodicity is None:
+        return None
+    return PeriodIndex(periods, periodicity, get_creation_date(db, task))
+
+
+def get_period_indices(db):
+    """
+    Build the PeriodIndex of all habits stored in a given database with two queries.
+
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> PeriodIndex
+    """
+    creation_dates = {x.task: x.creation_date for x in load_habits(db)}
+    indices = {}
+    for task, periodicity, days in get_grouped_check_off_days(db):
+        periods = [get_period(int(x), periodicity) for x in days.split(",")] if days else []
+        indices[task] = PeriodIndex(periods, periodicity, creation_dates.get(task))
+    return indices
+
+
+def get_profile_longest_streak(db_file, directory="habit profiles"):
+    """
+    Calculate the longest run streak over all habits of a single profile. The profile is opened read-only.
+
+    param db_file: name of the profile (without ".db")
+    param directory: directory of the profile
+    return: list of longest run streak, habit(s) holding that streak and profile name
+    """
+    db = get_readonly_db(db_file + ".db", directory)
+    try:
+        return [*get_overall_longest_streak(db), db_file]
+    finally:
+        db.close()
+
+
+def get_habit_range_longest_streak(db_file, directory="habit profiles", first_task=None, end_task=None):
+    """
+    Recompute the longest run streak over the habits of a profile whose tasks lie in the range from first_task up to,
+    but not including, end_task from their tracking data. The profile is opened read-only, so that the function can
+    run in a worker process (see get_overall_longest_streak_parallel).
+
+    param db_file: name of the profile (without ".db")
+    param directory: directory of the profile
+    param first_task: first habit task of the range (None -> from the first habit)
+    param end_task: habit task after the range (None -> up to the last habit)
+    return: longest run streak over the habits of the range together with the habit(s) holding that streak
+    """
+    db = get_readonly_db(db_file + ".db", directory)
+    try:
+        habits_streaks = {}
+        for task, periodicity, days in get_grouped_check_off_days(db, first_task, end_task):
+            periods = sorted(get_period(int(x), periodicity) for x in days.split(",")) if days else []
+            habits_streaks[task] = calculate_streaks(periods)[1]
+    finally:
+        db.close()
+    return get_longest_streak_habits(habits_streaks)
+
+
+def get_overall_longest_streak_parallel(db_file, directory="habit profiles", workers=None, chunks_per_worker=4):
+    """
+    Recompute the longest run streak over all habits of a single (large) profile on several cores. The habits are
+    partitioned into ranges of habit tasks (the primary key of the habits), which are analyzed by a process pool.
+    Every worker opens its own read-only connection (see get_habit_range_longest_streak). Each worker gets several
+    ranges, so that habits with long histories do not keep one worker busy while the others are idle.
+
+    param db_file: name of the profile (without ".db")
+    param directory: directory of the profile
+    param workers: number of worker processes (None -> number of CPUs)
+    param chunks_per_worker: number of habit ranges per worker
+    return: longest run streak over all habits together with the respective habit(s) holding that streak, like
+    get_overall_longest_streak()
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    db = get_readonly_db(db_file + ".db", directory)
+    try:
+        tasks = [x[0] for x in db.execute("SELECT task FROM habit ORDER BY task")]
+    finally:
+        db.close()
+    if not tasks:
+        return 0, []
+    workers = workers or os.cpu_count() or 1
+    number_of_ranges = min(len(tasks), workers * chunks_per_worker)
+    bounds = [tasks[len(tasks) * i // number_of_ranges] for i in range(number_of_ranges)] + [None]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(get_habit_range_longest_streak, repeat(db_file, number_of_ranges),
+                                repeat(directory, number_of_ranges), bounds[:-1], bounds[1:]))
+    longest_streak = max(x[0] for x in results)
+    return longest_streak, [y for x in results if x[0] == longest_streak for y in x[1]]
+
+
+def get_profile_signature(path):
+    """
+    Return the modification time and size of a profile file and of its write-ahead log (if there is one).
+    A profile whose signature did not change since its last analysis does not need to be analyzed again. An empty
+    write-ahead log counts as missing, since it is created by merely opening the profile.
+
+    param path: path of the profile file
+    return: list of modification times (in ns) and sizes
+    """
+    signature = []
+    for x in (path, path + "-wal"):
+        try:
+            stat = os.stat(x)
+            signature += [stat.st_mtime_ns, stat.st_size] if stat.st_size or x == path else [None, None]
+        except FileNotFoundError:
+            signature += [None, None]
+    return signature
+
+
+# in-memory cache of get_profile_streaks(): profile path -> [signature, [longest run streak, habit(s)]]
+profile_streak_cache = {}
+# name of the optional on-disk cache of get_profile_streaks() in the profile directory
+PROFILE_STREAK_CACHE_FILE = "leaderboard_cache.json"
+
+
+def get_profile_streaks(directory="habit profiles", workers=None, use_processes=False, use_disk_cache=False):
     """
+    Return the longest run streak over all habits of every profile in the given directory. Results are cached in
+    memory (and optionally on disk, in a summary file in the profile directory), keyed by the path, modification
+    time and size of each profile file. Only profiles that changed since their last analysis are analyzed again,
+    in parallel (see get_overall_longest_streak_all_databases).
 
+    param directory: directory with the databases of interest
+    param workers: maximum number of worker threads or processes (None -> default of concurrent.futures)
+    param use_processes: use a process pool instead of a thread pool
+    param use_disk_cache: load and store the results in the summary file of the profile directory
+    return: list of [longest run streak, habit(s) holding that streak, profile name] for every profile
+    """
     db_files = get_databases(directory)
+    cache_path = get_profile_path(PROFILE_STREAK_CACHE_FILE, directory)
+    disk_cache = {}
+    if use_disk_cache and os.path.exists(cache_path):
+        with open(cache_path) as infile:
+            disk_cache = json.load(infile)
+
+    signatures = {}
+    stale_db_files = []
+    for x in db_files:
+        path = os.path.abspath(get_profile_path(x + ".db", directory))
+        signatures[x] = get_profile_signature(path)
+        if profile_streak_cache.get(path, [None])[0] != signatures[x]:
+            if disk_cache.get(x, [None])[0] == signatures[x]:
+                profile_streak_cache[path] = disk_cache[x]
+            else:
+                stale_db_files.append(x)
+
+    if stale_db_files:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            results = pool.map(get_profile_longest_streak, stale_db_files, repeat(directory, len(stale_db_files)))
+            for x, result in zip(stale_db_files, results):
+                path = os.path.abspath(get_profile_path(x + ".db", directory))
+                profile_streak_cache[path] = [signatures[x], result[0:2]]
+
     streak_data = []
-    streaks = []
     for x in db_files:
-        db_file = x + ".db"
-        next_db = get_db(db_file, directory)
-        overall_longest_streak = list(get_overall_longest_streak(next_db))
-        streaks.append(overall_longest_streak[0])
-        overall_longest_streak.append(x)
-        streak_data.append(overall_longest_streak)
-        next_db.close()
+        path = os.path.abspath(get_profile_path(x + ".db", directory))
+        streak_data.append([*profile_streak_cache[path][1], x])
+
+    if use_disk_cache and (stale_db_files or set(disk_cache) != set(db_files)):
+        with open(cache_path, "w") as outfile:
+            json.dump({x[2]: [signatures[x[2]], x[0:2]] for x in streak_data}, outfile)
+    return streak_data
+
+
+def get_overall_longest_streak_all_databases(directory="habit profiles", workers=None, use_processes=False,
+                                             use_disk_cache=False):
+    """
+    Calculate the longest run streak over all habits and all databases. The profiles are opened read-only and
+    analyzed in parallel by a thread pool (or a process pool). Results of unchanged profiles are taken from the
+    cache of get_profile_streaks(). Profiles of a consolidated store are analyzed with a single query instead.
+
+    param directory: directory with the databases of interest
+    param workers: maximum number of worker threads or processes (None -> default of concurrent.futures)
+    param use_processes: use a process pool instead of a thread pool
+    param use_disk_cache: load and store the per-profile results in a summary file of the profile directory
+    return: longest run streak over all habits and all profiles together with the respective habit(s) holding
+    that streak
+    """
+
+    if is_consolidated(directory):
+        return get_store_longest_streak(directory)
+    streak_data = get_profile_streaks(directory, workers, use_processes, use_disk_cache)
+    streaks = [x[0] for x in streak_data]
 
     longest_streak = max(streaks)
     longest_streak_habits_dbs = []
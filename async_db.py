@@ -0,0 +1,268 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+import db
+import analysis
+from habit import load_habits
+
+
+class AsyncProfile:
+
+    def __init__(self, name, directory="habit profiles", max_pending=64):
+        """
+        Asyncio facade of the db and analysis functions for one habit profile, for services that run an event loop.
+        All calls run on a dedicated executor of the profile (one thread with its own connection), so the event loop
+        is never blocked by sqlite3 and the calls of one profile never contend for its database.
+        At most max_pending calls are queued or running at a time: further calls wait for a free slot (or are
+        rejected with asyncio.QueueFull, see call()). A cancelled call is dropped if it has not started yet, a
+        running query is interrupted (see sqlite3.Connection.interrupt) and its open transaction is rolled back.
+
+        param name: name of the db-file
+        param directory: directory of the database
+        param max_pending: maximum number of queued and running calls
+        """
+        self.name = name
+        self.directory = directory
+        self.max_pending = max_pending
+        self.slots = None
+        self.number_of_pending = 0
+        self.pending = queue.Queue()
+        self.db = None
+        self.error = None
+        self.opened = threading.Event()
+        # future of the running call, guarded by the lock, so that only the running call is interrupted
+        self.running = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name=f"habtrack-async-{name}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Main loop of the executor thread: run the queued calls one after another.
+
+        return:
+        """
+        try:
+            self.db = db.open_db(self.name, self.directory)
+        except Exception as error:
+            # every call fails with the error of the connection
+            self.error = error
+        finally:
+            self.opened.set()
+        try:
+            while True:
+                call = self.pending.get()
+                if call is None:
+                    break
+                function, args, future = call
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if self.error is not None:
+                    future.set_exception(self.error)
+                    continue
+                with self.lock:
+                    self.running = future
+                try:
+                    result = function(self.db, *args)
+                except BaseException as error:
+                    if self.db.in_transaction:
+                        self.db.rollback()
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+                finally:
+                    with self.lock:
+                        self.running = None
+        finally:
+            if self.db is not None:
+                self.db.close()
+
+    def interrupt(self, future):
+        """
+        Interrupt the running query of a call, if the call is still running.
+
+        param future: concurrent.futures.Future of the call
+        return:
+        """
+        self.opened.wait()
+        with self.lock:
+            if self.running is future:
+                self.db.interrupt()
+
+    async def call(self, function, *args, wait=True):
+        """
+        Run function(db, *args) on the executor of the profile.
+
+        param function: function to run (e.g. a function of the db module)
+        param args: further arguments of the function
+        param wait: False -> raise asyncio.QueueFull instead of waiting when max_pending calls are pending
+        return: result of the function
+        """
+        if self.closed:
+            raise RuntimeError(f"The profile \"{self.name}\" has been closed.")
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        if not wait and self.number_of_pending >= self.max_pending:
+            raise asyncio.QueueFull(f"{self.max_pending} calls are pending for the profile \"{self.name}\".")
+        async with self.slots:
+            self.number_of_pending += 1
+            future = Future()
+            self.pending.put((function, args, future))
+            try:
+                # cancelling the wrapping future cancels calls that have not started yet
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                self.interrupt(future)
+                raise
+            finally:
+                self.number_of_pending -= 1
+
+    async def add_habit(self, task, periodicity, creation_date):
+        """
+        Add a new habit (see db.add_habit).
+
+        return:
+        """
+        return await self.call(db.add_habit, task, periodicity, creation_date)
+
+    async def delete_habit(self, task):
+        """
+        Delete a habit together with its tracking data (see db.delete_habit).
+
+        return:
+        """
+        return await self.call(db.delete_habit, task)
+
+    async def check_off_task(self, task, check_off_date=None, check_off_week=None, check_off_time=None):
+        """
+        Check-off a habit task (see db.check_off_task).
+
+        return:
+        """
+        return await self.call(db.check_off_task, task, check_off_date, check_off_week, check_off_time)
+
+    async def check_off_task_today(self, task):
+        """
+        Check-off a habit task in the current period (see db.check_off_task_today).
+
+        return: CheckOffResult
+        """
+        return await self.call(db.check_off_task_today, task)
+
+    async def delete_check_off(self, task, check_off_date):
+        """
+        Delete the check-offs of a habit task on the given date (see db.delete_check_off).
+
+        return: number of deleted check-offs
+        """
+        return await self.call(db.delete_check_off, task, check_off_date)
+
+    async def get_habit_tasks(self):
+        """
+        Return the tasks of all habits (see db.get_habit_tasks).
+
+        return: list of habit tasks
+        """
+        return await self.call(db.get_habit_tasks)
+
+    async def load_habits(self, periodicity=None):
+        """
+        Load all habits, optionally only the ones with the given periodicity (see habit.load_habits).
+
+        return: list of DBHabit objects
+        """
+        return await self.call(load_habits, periodicity)
+
+    async def get_tracking_data(self, task=None):
+        """
+        Return the tracking data of all habits or of the given habit (see db.get_tracking_data).
+
+        return: list of tracking rows
+        """
+        return await self.call(db.get_tracking_data, task)
+
+    async def get_last_and_longest_streak(self, task, backend=None):
+        """
+        Return the last and longest run streak of a habit (see analysis.get_last_and_longest_streak).
+
+        return: last and longest run streak
+        """
+        return await self.call(analysis.get_last_and_longest_streak, task, backend)
+
+    async def get_all_streaks(self, backend=None):
+        """
+        Return the last and longest run streak of all habits (see analysis.get_all_streaks).
+
+        return: dictionary habit task -> (last run streak, longest run streak)
+        """
+        return await self.call(analysis.get_all_streaks, backend)
+
+    async def get_overall_longest_streak(self, backend=None):
+        """
+        Return the longest run streak over all habits (see analysis.get_overall_longest_streak).
+
+        return: longest run streak and the habit(s) holding that streak
+        """
+        return await self.call(analysis.get_overall_longest_streak, backend)
+
+    async def close(self):
+        """
+        Finish the pending calls and stop the executor of the profile.
+
+        return:
+        """
+        if not self.closed:
+            self.closed = True
+            self.pending.put(None)
+            await asyncio.get_running_loop().run_in_executor(None, self.thread.join)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+# AsyncProfiles opened by get_async_profile(), one per profile path
+async_profiles = {}
+
+
+def get_async_profile(name="main.db", directory="habit profiles", max_pending=64):
+    """
+    Return the AsyncProfile of a profile, which is created on first use and shared by all later calls.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    param max_pending: maximum number of queued and running calls (only used when the AsyncProfile is created)
+    return: AsyncProfile
+    """
+    path = db.get_profile_path(name, directory)
+    if path not in async_profiles or async_profiles[path].closed:
+        async_profiles[path] = AsyncProfile(name, directory, max_pending)
+    return async_profiles[path]
+
+
+async def close_async_profiles():
+    """
+    Close all AsyncProfiles opened by get_async_profile().
+
+    return:
+    """
+    profiles = list(async_profiles.values())
+    async_profiles.clear()
+    for x in profiles:
+        await x.close()
+
+
+async def get_overall_longest_streak_all_databases(directory="habit profiles", workers=None, use_processes=False,
+                                                   use_disk_cache=False):
+    """
+    Return the longest run streak over all profiles (see analysis.get_overall_longest_streak_all_databases). It opens
+    its own read-only connections, so it runs in the default executor of the event loop instead of a profile executor.
+
+    return: longest run streak over all habits and all profiles together with the respective habit(s) and profile(s)
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None, analysis.get_overall_longest_streak_all_databases, directory, workers, use_processes, use_disk_cache)
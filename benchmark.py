@@ -0,0 +1,897 @@
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from db import get_db, close_all_dbs, create_tables, add_habit, get_tracking_data, get_periodicity, check_off_task, \
+    check_off_many, check_off_task_today, open_db, consolidate_profiles, import_tracking_data, export_tracking_data, \
+    get_period
+from analysis import get_last_and_longest_streak, STREAK_BACKENDS, get_all_streaks, import_numpy, \
+    get_overall_longest_streak, get_overall_longest_streak_all_databases, \
+    profile_streak_cache, get_period_index, calculate_streaks, count_check_offs, get_overall_longest_streak_parallel, \
+    get_habit_range_longest_streak
+from leaderboard import update_leaderboard_index, get_top_habits, get_top_profiles, LEADERBOARD_METRICS
+
+
+def legacy_get_last_and_longest_streak(db, task):
+    """
+    Original implementation of analysis.get_last_and_longest_streak, kept as a baseline for the benchmarks.
+    It queries the periodicity once per tracking row and walks back day by day to find the Monday of each week.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: last and longest run streak for given habit
+    """
+
+    def get_first_weekday_object(date_object):
+        while date_object.weekday() > 0:
+            date_object = date_object - timedelta(1)
+        return date_object
+
+    tracking_data = get_tracking_data(db, task)
+    streak_counter = 1
+    highest_count_yet = 0
+
+    if not tracking_data:
+        streak_counter = 0
+    else:
+        starting_date = date.fromisoformat(tracking_data[0][2])
+        for idx, x in enumerate(tracking_data):
+            if get_periodicity(db, task) == "daily":
+                check_off_date = date.fromisoformat(x[2])
+                time_delta = 1
+                if idx == 0:
+                    starting_date = date.fromisoformat(tracking_data[0][2])
+            else:
+                check_off_date = get_first_weekday_object(date.fromisoformat(x[2]))
+                time_delta = 7
+                if idx == 0:
+                    starting_date = get_first_weekday_object(date.fromisoformat(tracking_data[0][2]))
+            if (check_off_date - timedelta(time_delta)) == starting_date:
+                streak_counter += 1
+                starting_date = check_off_date
+            else:
+                if streak_counter > highest_count_yet:
+                    highest_count_yet = streak_counter
+                starting_date = check_off_date
+                streak_counter = 1
+
+    last_streak = streak_counter
+    if streak_counter > highest_count_yet:
+        highest_count_yet = streak_counter
+
+    return last_streak, highest_count_yet
+
+
+def create_benchmark_profile(name, directory, number_of_check_offs, periodicity="daily", chance_of_checkoff=90,
+                             seed=0, first_date=date(2000, 1, 1)):
+    """
+    Create a profile with one habit holding the given number of randomized check-offs.
+
+    param name: name of the .db-file
+    param directory: directory of the database
+    param number_of_check_offs: number of tracking rows to create
+    param periodicity: periodicity of the habit ("daily" or "weekly")
+    param chance_of_checkoff: probability (in %) that a period is checked-off
+    param seed: seed for the random number generator
+    param first_date: date of the first period
+    return: task of the created habit
+    """
+    rng = random.Random(seed)
+    task = "Benchmark habit"
+    db = sqlite3.connect(os.path.join(directory, name))
+    create_tables(db)
+    add_habit(db, task, periodicity, str(first_date))
+    time_delta = timedelta(1) if periodicity == "daily" else timedelta(7)
+    rows = []
+    period_date = first_date
+    while len(rows) < number_of_check_offs:
+        if rng.randint(1, 100) <= chance_of_checkoff:
+            rows.append((task, period_date, None, "12:00:00"))
+        period_date += time_delta
+    check_off_many(db, rows)
+    db.close()
+    return task
+
+
+def time_call(function, *args, repeat=3):
+    """
+    Return the best wall time (in seconds) of several calls of the given function.
+
+    param function: function to be timed
+    param args: arguments of the function
+    param repeat: number of calls
+    return: best wall time in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_streak_engine(sizes=(10_000, 100_000, 1_000_000), periodicity="daily"):
+    """
+    Compare the original streak implementation with the streak backends of the analysis module ("python" single
+    pass recompute, "sql" window functions and "stats" stored streaks) on profiles of different sizes.
+
+    param sizes: numbers of check-offs of the benchmarked profiles
+    param periodicity: periodicity of the benchmarked habit
+    return: list of (size, legacy seconds, {backend: seconds}) tuples
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            name = f"benchmark_{size}.db"
+            task = create_benchmark_profile(name, directory, size, periodicity)
+            db = sqlite3.connect(os.path.join(directory, name))
+            expected = legacy_get_last_and_longest_streak(db, task)
+            legacy = time_call(legacy_get_last_and_longest_streak, db, task, repeat=1)
+            timings = {}
+            for backend in STREAK_BACKENDS:
+                assert get_last_and_longest_streak(db, task, backend) == expected
+                timings[backend] = time_call(get_last_and_longest_streak, db, task, backend)
+            db.close()
+            results.append((size, legacy, timings))
+            print(f"{size:>9} check-offs: legacy {legacy:8.3f}s, "
+                  + ", ".join(f"{x} {y * 1000:9.3f}ms ({legacy / y:8.1f}x)" for x, y in timings.items()))
+    return results
+
+
+def benchmark_bulk_import(number_of_habits=50, number_of_days=3650, chunk_size=None):
+    """
+    Compare importing daily check-offs with one check_off_task() call per row against check_off_many().
+    The row-by-row import is only timed for the first habit and extrapolated, since it commits every single row.
+
+    param number_of_habits: number of imported habits
+    param number_of_days: number of check-offs per habit
+    param chunk_size: chunk size passed to check_off_many()
+    return: extrapolated row-by-row seconds and bulk seconds
+    """
+    first_day = date(2000, 1, 1)
+    tasks = [f"Habit {x}" for x in range(number_of_habits)]
+    with tempfile.TemporaryDirectory() as directory:
+        db = sqlite3.connect(os.path.join(directory, "import.db"))
+        create_tables(db)
+        for task in tasks:
+            add_habit(db, task, "daily", str(first_day))
+
+        start = time.perf_counter()
+        for y in range(number_of_days):
+            check_off_date = first_day + timedelta(y)
+            check_off_task(db, tasks[0], str(check_off_date), check_off_date.isocalendar()[1], "12:00:00")
+        row_by_row = (time.perf_counter() - start) * number_of_habits
+
+        rows = [(task, first_day + timedelta(y), None, "12:00:00") for task in tasks[1:] for y in range(number_of_days)]
+        start = time.perf_counter()
+        check_off_many(db, rows, chunk_size)
+        bulk = (time.perf_counter() - start) * number_of_habits / (number_of_habits - 1)
+        db.close()
+    print(f"{number_of_habits * number_of_days:>9} check-offs: row by row {row_by_row:8.3f}s (extrapolated), "
+          f"check_off_many {bulk:8.3f}s")
+    return row_by_row, bulk
+
+
+def benchmark_check_off_today(sizes=(1_000, 10_000, 100_000)):
+    """
+    Measure the latency of check_off_task_today() for habits with tracking histories of different lengths.
+    The histories end before today, so the habit is checked-off once and every further call only runs the
+    "already checked-off" test.
+
+    param sizes: numbers of check-offs of the benchmarked habits
+    return: list of (size, seconds) tuples
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            name = f"check_off_{size}.db"
+            # with a check-off chance of 90%, size check-offs need at most 1.2 * size days in practice
+            first_date = date.today() - timedelta(int(size * 1.2))
+            task = create_benchmark_profile(name, directory, size, first_date=first_date)
+            db = sqlite3.connect(os.path.join(directory, name))
+            assert check_off_task_today(db, task).checked_off
+            seconds = time_call(check_off_task_today, db, task, repeat=100)
+            db.close()
+            results.append((size, seconds))
+            print(f"{size:>9} check-offs: check_off_task_today {seconds * 1000:8.3f}ms")
+    return results
+
+
+def benchmark_group_commit(number_of_writers=(1, 8, 32), number_of_check_offs=200):
+    """
+    Compare concurrent check-offs with one connection and one commit per check-off against a ProfileWriter,
+    which commits concurrent check-offs together.
+
+    param number_of_writers: numbers of concurrent writer threads
+    param number_of_check_offs: number of check-offs per writer thread
+    return: list of (writers, seconds per commit, seconds with group commit) tuples
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from write_queue import ProfileWriter
+    first_day = date(2000, 1, 1)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for writers in number_of_writers:
+            tasks = [f"Habit {x}" for x in range(writers)]
+            for name in ("per_commit.db", "group_commit.db"):
+                db = open_db(name, directory)
+                for task in tasks:
+                    add_habit(db, task, "daily", str(first_day))
+                db.close()
+
+            def per_commit(task):
+                db = open_db("per_commit.db", directory)
+                for y in range(number_of_check_offs):
+                    check_off_task(db, task, str(first_day + timedelta(y)), None, "12:00:00")
+                db.close()
+
+            writer = ProfileWriter("group_commit.db", directory)
+
+            def group_commit(task):
+                for y in range(number_of_check_offs):
+                    # every thread waits for its check-off like a caller of check_off_task() would
+                    writer.check_off(task, str(first_day + timedelta(y)), None, "12:00:00").result()
+
+            timings = []
+            for function in (per_commit, group_commit):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(writers) as executor:
+                    list(executor.map(function, tasks))
+                timings.append(time.perf_counter() - start)
+            writer.close()
+            results.append((writers, *timings))
+            print(f"{writers:>3} writers x {number_of_check_offs} check-offs: commit per check-off "
+                  f"{timings[0]:8.3f}s, group commit {timings[1]:8.3f}s ({writer.batches} commits)")
+    return results
+
+
+def benchmark_async_facade(numbers_of_clients=(1, 10, 100), calls_per_client=50, number_of_habits=50,
+                           number_of_days=365, write_ratio=0.2, seed=0):
+    """
+    Measure the latency of db and analysis calls from concurrent asyncio clients: once called directly in the event
+    loop (blocking it) and once through an AsyncProfile (see async_db.py). Besides the call latencies, the lag of a
+    heartbeat task, which should wake up every millisecond, shows how long the event loop is blocked.
+
+    param numbers_of_clients: numbers of concurrent clients
+    param calls_per_client: number of calls per client
+    param number_of_habits: number of habits of the profile
+    param number_of_days: number of tracked days per habit
+    param write_ratio: share of check-offs (check_off_task_today), the other calls are streak queries
+    param seed: seed for the random number generator
+    return: list of (clients, mode, {"p50_ms", "p95_ms", "p99_ms", "max_loop_lag_ms"}) tuples
+    """
+    import asyncio
+    from async_db import AsyncProfile
+
+    def percentile(values, p):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 3)
+
+    async def run(clients, profile, db):
+        rng = random.Random(seed)
+        latencies = []
+        lags = []
+        running = True
+
+        async def heartbeat():
+            while running:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - start - 0.001)
+
+        async def client():
+            for _ in range(calls_per_client):
+                task = f"Habit {rng.randrange(number_of_habits)}"
+                write = rng.random() < write_ratio
+                start = time.perf_counter()
+                if profile is None:
+                    check_off_task_today(db, task) if write else get_last_and_longest_streak(db, task, "python")
+                    # give the other clients a chance to run, like an awaited call would
+                    await asyncio.sleep(0)
+                elif write:
+                    await profile.check_off_task_today(task)
+                else:
+                    await profile.get_last_and_longest_streak(task, "python")
+                latencies.append(time.perf_counter() - start)
+
+        monitor = asyncio.ensure_future(heartbeat())
+        await asyncio.gather(*(client() for _ in range(clients)))
+        running = False
+        await monitor
+        return {"p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99), "max_loop_lag_ms": round(max(lags or [0]) * 1000, 3)}
+
+    async def run_facade(clients, directory):
+        async with AsyncProfile("async.db", directory, max_pending=clients) as profile:
+            return await run(clients, profile, None)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        generate_profile("async.db", directory, number_of_habits, number_of_days, seed=seed)
+        for clients in numbers_of_clients:
+            db = open_db("async.db", directory)
+            blocking = asyncio.run(run(clients, None, db))
+            db.close()
+            facade = asyncio.run(run_facade(clients, directory))
+            for mode, x in (("blocking", blocking), ("async facade", facade)):
+                results.append((clients, mode, x))
+                print(f"{clients:>4} clients, {mode:<12}: p50 {x['p50_ms']:8.3f}ms, p95 {x['p95_ms']:8.3f}ms, "
+                      f"p99 {x['p99_ms']:8.3f}ms, max event loop lag {x['max_loop_lag_ms']:8.3f}ms")
+    return results
+
+
+# Gap patterns of generate_profile(): "random" -> every period is checked-off independently, "bursty" -> streaks and
+# gaps come in runs (gaps of mean_gap periods on average), "weekends" -> daily habits are never checked-off on
+# Saturdays and Sundays (weekly habits are checked-off like with "random")
+GAP_PATTERNS = ("random", "bursty", "weekends")
+
+
+def generate_check_offs(rng, number_of_periods, chance_of_checkoff=90, gap_pattern="random", mean_gap=3,
+                        first_date=date(2000, 1, 1), periodicity="daily"):
+    """
+    Generate the checked-off periods of one habit.
+
+    param rng: random.Random instance
+    param number_of_periods: number of tracked periods (days or weeks)
+    param chance_of_checkoff: probability (in %) that a period is checked-off
+    param gap_pattern: one of GAP_PATTERNS
+    param mean_gap: mean length of a gap (in periods) for the "bursty" pattern
+    param first_date: date of the first period
+    param periodicity: periodicity of the habit ("daily" or "weekly")
+    return: generator of the check-off dates
+    """
+    if gap_pattern not in GAP_PATTERNS:
+        raise ValueError(f"Unknown gap pattern \"{gap_pattern}\", choose one of {', '.join(GAP_PATTERNS)}.")
+    chance = chance_of_checkoff / 100
+    days_per_period = 1 if periodicity == "daily" else 7
+    # "bursty": two-state Markov chain, which ends a gap with probability 1 / mean_gap and ends a streak with the
+    # probability that keeps the overall share of checked-off periods at chance_of_checkoff
+    end_gap = 1 / mean_gap
+    end_streak = min(1.0, (1 - chance) / (chance * mean_gap)) if chance else 1.0
+    checked_off = rng.random() < chance
+    for x in range(number_of_periods):
+        check_off_date = first_date + timedelta(x * days_per_period)
+        if gap_pattern == "bursty":
+            checked_off = rng.random() >= end_streak if checked_off else rng.random() < end_gap
+        else:
+            checked_off = rng.random() < chance
+            if gap_pattern == "weekends" and periodicity == "daily" and check_off_date.weekday() >= 5:
+                checked_off = False
+        if checked_off:
+            yield check_off_date
+
+
+def generate_profile(name, directory, number_of_habits=1000, number_of_days=3650, chance_of_checkoff=90,
+                     gap_pattern="random", mean_gap=3, weekly_share=0.2, seed=0, first_date=date(2000, 1, 1)):
+    """
+    Create a reproducible synthetic profile: the same arguments always create the same habits and check-offs.
+    Habits are daily or (with the probability weekly_share) weekly and tracked from first_date for number_of_days
+    days. The check-offs are inserted in chunks, so millions of check-offs are generated with bounded memory.
+
+    param name: name of the .db-file
+    param directory: directory of the database
+    param number_of_habits: number of habits
+    param number_of_days: number of tracked days per habit
+    param chance_of_checkoff: probability (in %) that a period is checked-off
+    param gap_pattern: one of GAP_PATTERNS
+    param mean_gap: mean length of a gap (in periods) for the "bursty" pattern
+    param weekly_share: share of weekly habits
+    param seed: seed for the random number generator (combined with the profile name)
+    param first_date: date of the first period
+    return: number of generated check-offs
+    """
+    rng = random.Random(f"{seed}:{name}")
+    db = sqlite3.connect(os.path.join(directory, name))
+    create_tables(db)
+    habits = [(f"Habit {x}", "weekly" if rng.random() < weekly_share else "daily") for x in range(number_of_habits)]
+    for task, periodicity in habits:
+        add_habit(db, task, periodicity, str(first_date), commit=False)
+    db.commit()
+
+    def rows():
+        for task, periodicity in habits:
+            number_of_periods = number_of_days if periodicity == "daily" else number_of_days // 7
+            for check_off_date in generate_check_offs(rng, number_of_periods, chance_of_checkoff, gap_pattern,
+                                                      mean_gap, first_date, periodicity):
+                yield task, check_off_date, None, "12:00:00"
+
+    number_of_check_offs = check_off_many(db, rows(), chunk_size=100_000)
+    db.close()
+    return number_of_check_offs
+
+
+def generate_profiles(directory, number_of_profiles, number_of_habits=20, number_of_days=365, chance_of_checkoff=90,
+                      gap_pattern="random", mean_gap=3, weekly_share=0.2, seed=0, workers=None):
+    """
+    Create reproducible synthetic profiles "profile_0.db", "profile_1.db", ... (see generate_profile), in parallel
+    by a process pool if workers is given.
+
+    param directory: directory of the profiles
+    param number_of_profiles: number of profiles to create
+    param number_of_habits: number of habits per profile
+    param number_of_days: number of tracked days per habit
+    param chance_of_checkoff: probability (in %) that a period is checked-off
+    param gap_pattern: one of GAP_PATTERNS
+    param mean_gap: mean length of a gap (in periods) for the "bursty" pattern
+    param weekly_share: share of weekly habits
+    param seed: seed for the random number generator
+    param workers: number of worker processes (None -> create the profiles one after another)
+    return: total number of generated check-offs
+    """
+    arguments = [(f"profile_{x}.db", directory, number_of_habits, number_of_days, chance_of_checkoff, gap_pattern,
+                  mean_gap, weekly_share, seed) for x in range(number_of_profiles)]
+    if workers is None:
+        return sum(generate_profile(*x) for x in arguments)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(generate_profile, *zip(*arguments)))
+
+
+def create_benchmark_profiles(directory, number_of_profiles, number_of_habits=20, number_of_days=365, seed=0):
+    """
+    Create profiles with several daily habits holding randomized check-offs (90% check-off chance).
+
+    param directory: directory of the profiles
+    param number_of_profiles: number of profiles to create
+    param number_of_habits: number of habits per profile
+    param number_of_days: number of tracked days per habit
+    param seed: seed for the random number generator
+    return:
+    """
+    generate_profiles(directory, number_of_profiles, number_of_habits, number_of_days, weekly_share=0, seed=seed)
+
+
+def benchmark_all_habits(number_of_habits=100, number_of_days=12000):
+    """
+    Compare the streak backends when calculating the streaks of all habits of one large profile at once
+    (100 habits with 12000 days each are about 1.1M check-offs).
+
+    param number_of_habits: number of daily habits of the profile
+    param number_of_days: number of tracked days per habit
+    return: dictionary backend -> seconds
+    """
+    if import_numpy() is None:
+        print("NumPy is not installed, the \"numpy\" backend falls back to the \"python\" backend.")
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        create_benchmark_profiles(directory, 1, number_of_habits, number_of_days)
+        db = sqlite3.connect(os.path.join(directory, "profile_0.db"))
+        expected = get_all_streaks(db, "python")
+        for backend in STREAK_BACKENDS:
+            assert get_all_streaks(db, backend) == expected
+            timings[backend] = time_call(get_all_streaks, db, backend)
+        number_of_rows = db.execute("SELECT COUNT(*) FROM tracking").fetchone()[0]
+        db.close()
+    print(f"{number_of_rows:>9} check-offs in {number_of_habits} habits: "
+          + ", ".join(f"{x} {y:8.3f}s" for x, y in timings.items()))
+    return timings
+
+
+def benchmark_parallel_analysis(number_of_habits=2000, number_of_days=3650, workers=(1, 2, 4, 8)):
+    """
+    Measure the speedup of get_overall_longest_streak_parallel() over the sequential recompute of all habits of one
+    large profile (the same recompute of all habits in the calling process) for different numbers of worker
+    processes.
+
+    param number_of_habits: number of habits of the profile
+    param number_of_days: number of tracked days per habit
+    param workers: numbers of worker processes to benchmark
+    return: sequential seconds and list of (workers, seconds, speedup) tuples
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        number_of_check_offs = generate_profile("team.db", directory, number_of_habits, number_of_days)
+        db = get_db("team.db", directory)
+        expected = get_overall_longest_streak(db, "python")
+        close_all_dbs()
+        assert get_habit_range_longest_streak("team", directory) == expected
+        sequential = time_call(get_habit_range_longest_streak, "team", directory)
+        print(f"{number_of_check_offs} check-offs in {number_of_habits} habits on {os.cpu_count()} CPUs: "
+              f"sequential {sequential:8.3f}s")
+        for number_of_workers in workers:
+            assert get_overall_longest_streak_parallel("team", directory, number_of_workers) == expected
+            seconds = time_call(get_overall_longest_streak_parallel, "team", directory, number_of_workers)
+            results.append((number_of_workers, seconds, sequential / seconds))
+            print(f"{number_of_workers:>3} workers: {seconds:8.3f}s ({sequential / seconds:5.2f}x)")
+    return sequential, results
+
+
+def row_based_streaks(db):
+    """
+    Row-based path of the analytics: read the tracking rows of all habits, turn their dates into date objects and
+    calculate the streaks from them, kept as a baseline for benchmark_bitset().
+
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    periodicities = {x[0]: x[1] for x in db.execute("SELECT task, periodicity FROM habit")}
+    check_off_dates = {x: [] for x in periodicities}
+    for task, _, check_off_date, _ in get_tracking_data(db):
+        check_off_dates[task].append(date.fromisoformat(check_off_date))
+    return {x: calculate_streaks(sorted(get_period(y.toordinal(), periodicities[x]) for y in check_off_dates[x]))
+            for x in periodicities}
+
+
+def bitset_streaks(db):
+    """
+    Bitset path of the analytics (see bitset.py), the counterpart of row_based_streaks().
+
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    return get_all_streaks(db, "bitset")
+
+
+def benchmark_bitset(number_of_habits=20, numbers_of_days=(365, 3650, 36500)):
+    """
+    Compare the row-based analytics (tracking rows and date objects) with the bitsets of the habits: peak memory and
+    wall time of the streaks of all habits, the time of a completion count and the stored bytes.
+
+    param number_of_habits: number of habits
+    param numbers_of_days: numbers of tracked days per habit
+    return: list of (number of days, {measure: (row-based, bitset)}) tuples
+    """
+    import tracemalloc
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for number_of_days in numbers_of_days:
+            name = f"bitset_{number_of_days}.db"
+            generate_profile(name, directory, number_of_habits, number_of_days)
+            db = sqlite3.connect(os.path.join(directory, name))
+            assert row_based_streaks(db) == bitset_streaks(db)
+            measures = {}
+            memory = []
+            for function in (row_based_streaks, bitset_streaks):
+                tracemalloc.start()
+                function(db)
+                memory.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            measures["peak memory (bytes)"] = tuple(memory)
+            measures["streaks (s)"] = (time_call(row_based_streaks, db), time_call(bitset_streaks, db))
+            measures["completion count (s)"] = (
+                time_call(lambda: db.execute("SELECT COUNT(DISTINCT day) FROM tracking WHERE habitTask = 'Habit 0'")
+                          .fetchone()),
+                time_call(count_check_offs, db, "Habit 0"))
+            measures["stored bytes"] = db.execute("""SELECT
+                (SELECT SUM(LENGTH(habitTask) + LENGTH(week) + LENGTH(date) + LENGTH(time) + 8) FROM tracking),
+                (SELECT SUM(LENGTH(bits) + 8) FROM habit_bits)""").fetchone()
+            db.close()
+            results.append((number_of_days, measures))
+            print(f"{number_of_days:>6} days x {number_of_habits} habits: "
+                  + ", ".join(f"{x} {y:.6g} vs {z:.6g} ({y / z:.1f}x)" for x, (y, z) in measures.items()))
+    return results
+
+
+def legacy_open_and_query(directory, name):
+    """
+    Open a profile like the original get_db() (new connection, DDL and commit on every open), read its habits and
+    close the connection again.
+
+    param directory: directory of the profile
+    param name: name of the .db-file
+    return:
+    """
+    db = sqlite3.connect(os.path.join(directory, name))
+    db.execute("PRAGMA foreign_keys = ON;")
+    db.execute("CREATE TABLE IF NOT EXISTS habit (task TEXT PRIMARY KEY, periodicity TEXT, creation_date TEXT)")
+    db.execute("""CREATE TABLE IF NOT EXISTS tracking (habitTask TEXT, week TEXT, date TEXT, time TEXT,
+        FOREIGN KEY (habitTask) REFERENCES habit(task) ON DELETE CASCADE)""")
+    db.commit()
+    get_overall_longest_streak(db)
+    db.close()
+
+
+def open_and_query(directory, name, cached=True):
+    """
+    Open a profile with get_db() and read its habits.
+
+    param directory: directory of the profile
+    param name: name of the .db-file
+    param cached: reuse the cached connection (False -> close all cached connections first)
+    return:
+    """
+    if not cached:
+        close_all_dbs()
+    get_overall_longest_streak(get_db(name, directory))
+
+
+def benchmark_open_and_query(repeat=200):
+    """
+    Compare the latency of opening a profile and querying its longest run streak: original get_db() behaviour,
+    get_db() with a new connection (pragmas, schema version check) and get_db() with a cached connection.
+
+    param repeat: number of timed calls (the best one is reported)
+    return: legacy, uncached and cached seconds
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        create_benchmark_profiles(directory, 1)
+        legacy = time_call(legacy_open_and_query, directory, "profile_0.db", repeat=repeat)
+        uncached = time_call(open_and_query, directory, "profile_0.db", False, repeat=repeat)
+        cached = time_call(open_and_query, directory, "profile_0.db", True, repeat=repeat)
+        close_all_dbs()
+    print(f"open and query: legacy {legacy * 1000:8.3f}ms, new connection {uncached * 1000:8.3f}ms, "
+          f"cached connection {cached * 1000:8.3f}ms")
+    return legacy, uncached, cached
+
+
+def uncached_leaderboard(directory, workers, use_processes=False):
+    """
+    Run get_overall_longest_streak_all_databases() with an empty in-memory cache.
+
+    param directory: directory of the profiles
+    param workers: number of workers
+    param use_processes: use a process pool instead of a thread pool
+    return:
+    """
+    profile_streak_cache.clear()
+    get_overall_longest_streak_all_databases(directory, workers, use_processes)
+
+
+def benchmark_leaderboard(numbers_of_profiles=(10, 100, 500), workers=(1, 2, 4, 8)):
+    """
+    Measure how get_overall_longest_streak_all_databases() scales with the number of profiles and workers,
+    both with a thread pool and a process pool, and how long a repeated (cached) query takes.
+
+    param numbers_of_profiles: numbers of profiles to benchmark
+    param workers: numbers of workers to benchmark
+    return: list of (number of profiles, workers, thread seconds, process seconds, cached seconds) tuples
+    """
+    results = []
+    for number_of_profiles in numbers_of_profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            create_benchmark_profiles(directory, number_of_profiles)
+            for number_of_workers in workers:
+                threads = time_call(uncached_leaderboard, directory, number_of_workers)
+                processes = time_call(uncached_leaderboard, directory, number_of_workers, True)
+                cached = time_call(get_overall_longest_streak_all_databases, directory, number_of_workers)
+                results.append((number_of_profiles, number_of_workers, threads, processes, cached))
+                print(f"{number_of_profiles:>5} profiles, {number_of_workers:>2} workers: threads {threads:8.3f}s, "
+                      f"processes {processes:8.3f}s, cached {cached:8.3f}s")
+    return results
+
+
+def benchmark_consolidated_store(numbers_of_profiles=(10, 100, 500), workers=8):
+    """
+    Compare the leaderboard over one .db-file per profile (uncached, with a thread pool) against the leaderboard
+    of the same profiles in a consolidated store.
+
+    param numbers_of_profiles: numbers of profiles to benchmark
+    param workers: number of worker threads for the .db-files
+    return: list of (number of profiles, seconds with files, seconds with store) tuples
+    """
+    results = []
+    for number_of_profiles in numbers_of_profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            create_benchmark_profiles(directory, number_of_profiles)
+            files = time_call(uncached_leaderboard, directory, workers)
+            expected = get_overall_longest_streak_all_databases(directory)
+            consolidate_profiles(directory)
+            store = time_call(get_overall_longest_streak_all_databases, directory)
+            assert sorted(map(str, get_overall_longest_streak_all_databases(directory)[1])) == \
+                sorted(map(str, expected[1]))
+            results.append((number_of_profiles, files, store))
+            print(f"{number_of_profiles:>5} profiles: one file per profile {files:8.3f}s, "
+                  f"consolidated store {store:8.3f}s")
+    return results
+
+
+def benchmark_leaderboard_index(numbers_of_profiles=(100, 1000, 3000), number_of_habits=10, number_of_days=60, k=10):
+    """
+    Measure the leaderboard index: building it, updating it without and after a change of one profile, and the top-K
+    queries of all metrics, both over habits and over profiles.
+
+    param numbers_of_profiles: numbers of profiles to benchmark
+    param number_of_habits: number of habits per profile
+    param number_of_days: number of tracked days per habit
+    param k: number of ranked habits and profiles
+    return: list of (number of profiles, build seconds, no-change update seconds, one-profile update seconds,
+    slowest top-K query seconds) tuples
+    """
+    results = []
+    for number_of_profiles in numbers_of_profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_profiles(directory, number_of_profiles, number_of_habits, number_of_days)
+            start = time.perf_counter()
+            update_leaderboard_index(directory)
+            build = time.perf_counter() - start
+            unchanged = time_call(update_leaderboard_index, directory)
+            db = get_db("profile_0.db", directory)
+            check_off_task(db, get_tracking_data(db)[0][0], str(date.today()))
+            close_all_dbs()
+            start = time.perf_counter()
+            assert update_leaderboard_index(directory) == ["profile_0"]
+            changed = time.perf_counter() - start
+            query = max(time_call(x, directory, y, k, None, False)
+                        for x in (get_top_habits, get_top_profiles) for y in LEADERBOARD_METRICS)
+            results.append((number_of_profiles, build, unchanged, changed, query))
+            print(f"{number_of_profiles:>5} profiles: build {build:8.3f}s, no-change update {unchanged * 1000:8.3f}ms, "
+                  f"one-profile update {changed * 1000:8.3f}ms, slowest top-{k} query {query * 1000:8.3f}ms")
+    return results
+
+
+# Sizes of the benchmark suite: one large profile (habits x days) and many small profiles (profiles x habits x days)
+SUITE_SCALES = {
+    "tiny": {"habits": 10, "days": 100, "profiles": 3, "profile_habits": 5, "profile_days": 30},
+    "small": {"habits": 100, "days": 1000, "profiles": 50, "profile_habits": 20, "profile_days": 365},
+    "medium": {"habits": 1000, "days": 1000, "profiles": 200, "profile_habits": 20, "profile_days": 365},
+    "large": {"habits": 2000, "days": 3650, "profiles": 500, "profile_habits": 50, "profile_days": 365},
+}
+
+
+def run_benchmark_suite(scale="small", output=None, gap_pattern="random", chance_of_checkoff=90, seed=0):
+    """
+    Run the benchmark suite on reproducible synthetic profiles (see generate_profile) and return the timings
+    together with the parameters and the environment of the run, e.g. to save them as JSON and compare them with
+    the results of a later run (see compare_benchmark_results).
+
+    param scale: key of SUITE_SCALES
+    param output: path of a .json-file to save the results in (None -> results are not saved)
+    param gap_pattern: one of GAP_PATTERNS
+    param chance_of_checkoff: probability (in %) that a period is checked-off
+    param seed: seed for the random number generator
+    return: dictionary with "environment", "parameters" and "results" (benchmark name -> best time in seconds)
+    """
+    import json
+    import platform
+    from datetime import datetime
+    parameters = {"scale": scale, **SUITE_SCALES[scale], "gap_pattern": gap_pattern,
+                  "chance_of_checkoff": chance_of_checkoff, "seed": seed}
+    results = {}
+
+    def measure(benchmark, function, *args, repeat=3):
+        results[benchmark] = time_call(function, *args, repeat=repeat)
+        print(f"{benchmark:<50} {results[benchmark] * 1000:12.3f}ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        check_offs = generate_profile("large.db", directory, parameters["habits"], parameters["days"],
+                                      chance_of_checkoff, gap_pattern, seed=seed)
+        results["generate_profile"] = time.perf_counter() - start
+        parameters["check_offs"] = check_offs
+        print(f"{'generate_profile':<50} {results['generate_profile'] * 1000:12.3f}ms ({check_offs} check-offs)")
+
+        db = sqlite3.connect(os.path.join(directory, "large.db"))
+        # the habit with the most check-offs
+        task = db.execute("""SELECT habitTask FROM tracking GROUP BY habitTask ORDER BY COUNT(*) DESC, habitTask
+            LIMIT 1""").fetchone()[0]
+        for backend in STREAK_BACKENDS:
+            measure(f"get_last_and_longest_streak[{backend}]", get_last_and_longest_streak, db, task, backend)
+        for backend in STREAK_BACKENDS:
+            measure(f"get_overall_longest_streak[{backend}]", get_overall_longest_streak, db, backend, repeat=1)
+        index = get_period_index(db, task)
+        measure("get_period_index", get_period_index, db, task)
+        last_day = date.fromordinal(db.execute("SELECT MAX(day) FROM tracking").fetchone()[0])
+        measure("PeriodIndex.get_longest_streak[365 days]", index.get_longest_streak,
+                last_day - timedelta(days=364), last_day, repeat=100)
+        measure("PeriodIndex.get_rolling_consistencies[365 days]", index.get_rolling_consistencies,
+                last_day - timedelta(days=364), last_day, repeat=10)
+        assert check_off_task_today(db, task).checked_off
+        measure("check_off_task_today", check_off_task_today, db, task, repeat=100)
+
+        export_path = os.path.join(directory, "export.csv")
+        measure("export_tracking_data", export_tracking_data, db, export_path, repeat=1)
+        db.close()
+        imported = sqlite3.connect(os.path.join(directory, "import.db"))
+        create_tables(imported)
+        measure("import_tracking_data", import_tracking_data, imported, export_path, repeat=1)
+        imported.close()
+
+        profiles = os.path.join(directory, "profiles")
+        os.mkdir(profiles)
+        start = time.perf_counter()
+        generate_profiles(profiles, parameters["profiles"], parameters["profile_habits"], parameters["profile_days"],
+                          chance_of_checkoff, gap_pattern, seed=seed)
+        results["generate_profiles"] = time.perf_counter() - start
+        print(f"{'generate_profiles':<50} {results['generate_profiles'] * 1000:12.3f}ms")
+        measure("get_overall_longest_streak_all_databases", uncached_leaderboard, profiles, None)
+        measure("get_overall_longest_streak_all_databases[cached]", get_overall_longest_streak_all_databases,
+                profiles)
+        measure("update_leaderboard_index", update_leaderboard_index, profiles, repeat=1)
+        for metric in LEADERBOARD_METRICS:
+            measure(f"get_top_habits[{metric}]", get_top_habits, profiles, metric, 10, None, False)
+
+    for module in STARTUP_BUDGET_MS:
+        results[f"import[{module}]"] = min(get_import_times(module)[module] for _ in range(3)) / 1000
+        print(f"{f'import[{module}]':<50} {results[f'import[{module}]'] * 1000:12.3f}ms")
+
+    suite = {"environment": {"time": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                             "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                             "numpy": import_numpy() is not None},
+             "parameters": parameters, "results": results}
+    if output is not None:
+        with open(output, "w") as outfile:
+            json.dump(suite, outfile, indent=2)
+    return suite
+
+
+def compare_benchmark_results(baseline, current, tolerance=0.2):
+    """
+    Compare two results of run_benchmark_suite (or paths of .json-files holding them).
+
+    param baseline: results of the baseline run
+    param current: results of the current run
+    param tolerance: relative slowdown that is not reported as regression (0.2 -> 20%)
+    return: dictionary benchmark name -> (baseline seconds, current seconds) of all regressions
+    """
+    import json
+    suites = []
+    for x in (baseline, current):
+        if isinstance(x, str):
+            with open(x) as infile:
+                x = json.load(infile)
+        suites.append(x)
+    if suites[0]["parameters"] != suites[1]["parameters"]:
+        raise ValueError("Only results of runs with the same parameters can be compared.")
+    baseline, current = suites[0]["results"], suites[1]["results"]
+    return {x: (baseline[x], y) for x, y in current.items() if x in baseline and y > baseline[x] * (1 + tolerance)}
+
+
+# Regression budget for the startup of HabTrack: cumulative import time (-X importtime) of the given modules in ms
+STARTUP_BUDGET_MS = {"main": 20, "headless": 150}
+# Modules that must not be imported at startup (UI libraries and optional dependencies)
+LAZY_MODULES = ("questionary", "prettytable", "numpy", "concurrent.futures")
+
+
+def get_import_times(module):
+    """
+    Import a module in a fresh interpreter with "-X importtime" and return the cumulative import time of every
+    imported module.
+
+    param module: name of the module to import
+    return: dictionary module name -> cumulative import time in ms
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # e.g. "import time:       298 |       5851 |   sqlite3"
+        fields = line.split("|")
+        if line.startswith("import time:") and fields[1].strip().isdigit():
+            import_times[fields[2].strip()] = int(fields[1]) / 1000
+    return import_times
+
+
+def benchmark_startup(repeat=5):
+    """
+    Measure the startup of HabTrack: the cumulative import time of main.py (interactive menus) and headless.py
+    (non-interactive commands), compared with STARTUP_BUDGET_MS.
+
+    param repeat: number of measurements per module (the best one is reported)
+    return: dictionary module name -> best import time in ms
+    """
+    results = {}
+    for module in STARTUP_BUDGET_MS:
+        results[module] = min(get_import_times(module)[module] for _ in range(repeat))
+        print(f"import {module}: {results[module]:8.3f}ms (budget {STARTUP_BUDGET_MS[module]}ms)")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks of HabTrack.")
+    parser.add_argument("sizes", nargs="*", type=int, help="numbers of check-offs for benchmark_streak_engine()")
+    parser.add_argument("--suite", choices=SUITE_SCALES, help="run the benchmark suite with the given scale instead")
+    parser.add_argument("--gap-pattern", choices=GAP_PATTERNS, default="random")
+    parser.add_argument("--output", help="save the results of the suite as .json-file")
+    parser.add_argument("--compare", help="report regressions against the results of a .json-file")
+    arguments = parser.parse_args()
+    if arguments.suite is None:
+        benchmark_streak_engine(arguments.sizes or (10_000, 100_000, 1_000_000))
+    else:
+        suite = run_benchmark_suite(arguments.suite, arguments.output, arguments.gap_pattern)
+        if arguments.compare:
+            regressions = compare_benchmark_results(arguments.compare, suite)
+            for x, (y, z) in regressions.items():
+                print(f"REGRESSION {x}: {y * 1000:.3f}ms -> {z * 1000:.3f}ms")
+        else:
+            regressions = {}
+        # the startup budgets are only checked here, wall-clock import times are too noisy for the unit tests
+        over_budget = [x for x, y in STARTUP_BUDGET_MS.items() if suite["results"][f"import[{x}]"] * 1000 >= y]
+        for x in over_budget:
+            print(f"OVER BUDGET import {x}: {suite['results'][f'import[{x}]'] * 1000:.3f}ms "
+                  f"(budget {STARTUP_BUDGET_MS[x]}ms)")
+        sys.exit(1 if regressions or over_budget else 0)
@@ -0,0 +1,120 @@
+# The check-off history of a habit as a bitset: bit i of a Python integer is set if the habit has been checked-off in
+# period first_period + i (see db.get_period), so a decade of a daily habit fits into about 460 bytes. In the database,
+# the bitset is stored as little-endian BLOB in the table "habit_bits" (see db.update_habit_bits).
+
+
+def to_blob(bits):
+    """
+    Convert a bitset to the BLOB stored in the database.
+
+    param bits: bitset
+    return: little-endian bytes of the bitset (empty for no check-offs)
+    """
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def from_blob(blob):
+    """
+    Convert a BLOB stored in the database to a bitset.
+
+    param blob: little-endian bytes of the bitset (None -> no check-offs)
+    return: bitset
+    """
+    return int.from_bytes(blob or b"", "little")
+
+
+def set_periods(bits, first_period, periods):
+    """
+    Set the bits of the given periods. Periods before first_period move the first period of the bitset back.
+
+    param bits: bitset
+    param first_period: period ordinal of bit 0
+    param periods: period ordinals of new check-offs
+    return: updated bitset and period ordinal of its bit 0
+    """
+    periods = list(periods)
+    if not periods:
+        return bits, first_period
+    earliest = min(periods)
+    if first_period is None:
+        first_period = earliest
+    elif earliest < first_period:
+        bits <<= first_period - earliest
+        first_period = earliest
+    for x in periods:
+        bits |= 1 << (x - first_period)
+    return bits, first_period
+
+
+def clear_period(bits, first_period, period):
+    """
+    Clear the bit of the given period.
+
+    param bits: bitset
+    param first_period: period ordinal of bit 0
+    param period: period ordinal
+    return: updated bitset
+    """
+    if first_period is None or period < first_period:
+        return bits
+    return bits & ~(1 << (period - first_period))
+
+
+def has_period(bits, first_period, period):
+    """
+    Return whether the bit of the given period is set, i.e. whether the habit has been checked-off in that period.
+
+    param bits: bitset
+    param first_period: period ordinal of bit 0
+    param period: period ordinal
+    return: True if the period has been checked-off
+    """
+    return first_period is not None and period >= first_period and bool(bits >> (period - first_period) & 1)
+
+
+def count_periods(bits, first_period, first=None, last=None):
+    """
+    Return the number of checked-off periods, optionally only between two period ordinals (both included).
+
+    param bits: bitset
+    param first_period: period ordinal of bit 0
+    param first: first period ordinal (None -> from the first check-off)
+    param last: last period ordinal (None -> up to the last check-off)
+    return: number of checked-off periods
+    """
+    if first_period is None or not bits:
+        return 0
+    if last is not None:
+        if last < first_period:
+            return 0
+        bits &= (1 << (last - first_period + 1)) - 1
+    if first is not None and first > first_period:
+        bits >>= first - first_period
+    return bin(bits).count("1")
+
+
+def get_periods(bits, first_period):
+    """
+    Return the period ordinals of all set bits.
+
+    param bits: bitset
+    param first_period: period ordinal of bit 0
+    return: ascending period ordinals
+    """
+    binary = bin(bits)[:1:-1]
+    return [first_period + i for i, x in enumerate(binary) if x == "1"]
+
+
+def get_streaks(bits):
+    """
+    Return the last and longest run streak of a bitset with a run-length scan: the binary representation of the
+    bitset starts with the latest period, so splitting it at the unset bits yields all run streaks from the latest to
+    the earliest.
+
+    param bits: bitset
+    return: last and longest run streak
+    """
+    if not bits:
+        return 0, 0
+    runs = bin(bits)[2:].split("0")
+    return len(runs[0]), len(max(runs, key=len))
@@ -1,21 +1,192 @@
+import os
 import sqlite3
-import random
+from collections import namedtuple, OrderedDict
 from datetime import date, datetime, timedelta
+from bitset import to_blob, from_blob, set_periods, clear_period, has_period, get_periods
 
 
-def get_db(name="main.db", directory="habit profiles"):
+# Version of the database schema, stored in "PRAGMA user_version" of every profile. Databases with an older version
+# are migrated by create_tables() when they are opened.
+SCHEMA_VERSION = 3
+
+
+def get_profile_path(name="main.db", directory="habit profiles"):
     """
-    Initialize a sqlite3 database connection.
+    Return the path of a database file. Both "\\" and "/" are accepted as path separators in name and directory.
 
     param name: name of the db-file
     param directory: directory of the database
+    return: path of the database file
+    """
+    return os.path.normpath((directory + "/" + name).replace("\\", "/"))
+
+
+# Class of the connections opened by this module. instrumentation.enable() replaces it with a subclass which records
+# the executed statements and fetched rows.
+connection_factory = sqlite3.Connection
+
+
+def connect(database, **kwargs):
+    """
+    Open a sqlite3 database connection of the class connection_factory.
+
+    param database: path or URI of the database file
+    param kwargs: further arguments of sqlite3.connect()
+    return: sqlite3 database connection
+    """
+    return sqlite3.connect(database, factory=connection_factory, **kwargs)
+
+
+# Connections opened by get_db(), one per profile path, in least recently used order. When more than
+# MAX_CACHED_CONNECTIONS profiles are open, the least recently used connection is dropped from the cache without
+# closing it, since callers may still hold it: it is closed by its last holder (or when it is garbage-collected).
+MAX_CACHED_CONNECTIONS = 8
+cached_connections = OrderedDict()
+
+
+def configure_connection(db, readonly=False):
+    """
+    Apply the connection settings of HabTrack: foreign keys, write-ahead logging (WAL) with synchronous=NORMAL,
+    a 16 MB page cache and 64 MB of memory-mapped I/O.
+
+    param db: an initialized sqlite3 database connection
+    param readonly: True for read-only connections, which can not change the journal mode
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("PRAGMA foreign_keys = ON;")
+    if not readonly:
+        cur.execute("PRAGMA journal_mode = WAL;")
+        cur.execute("PRAGMA synchronous = NORMAL;")
+    cur.execute("PRAGMA cache_size = -16000;")
+    cur.execute("PRAGMA mmap_size = 67108864;")
+
+
+def is_open(db):
+    """
+    Return whether a sqlite3 database connection is still open.
+
+    param db: a sqlite3 database connection
+    return: True if the connection is open
+    """
+    try:
+        db.total_changes
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+
+def open_db(name="main.db", directory="habit profiles", check_same_thread=True):
+    """
+    Open a new (not cached) sqlite3 database connection with the settings of configure_connection(). The tables are
+    only created or migrated if the schema version of the database does not match SCHEMA_VERSION. If the directory
+    of the profile holds a consolidated store (see consolidate_profiles), the connection is opened on the store and
+    scoped to the profile, which is created if it does not exist yet.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    param check_same_thread: False -> the connection may be used by several threads (one at a time)
     return: newly created sqlite3 database connection
     """
-    db = sqlite3.connect(directory + "\\" + name)
-    create_tables(db)
+    store = get_store_profile(name, directory)
+    if store is not None:
+        db = connect(store[0], check_same_thread=check_same_thread)
+        configure_connection(db)
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            create_store_tables(db)
+        db.execute("INSERT OR IGNORE INTO profile VALUES (?)", (store[1],))
+        db.commit()
+        add_profile_views(db, store[1])
+        return db
+    db = connect(get_profile_path(name, directory), check_same_thread=check_same_thread)
+    configure_connection(db)
+    if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        create_tables(db)
     return db
 
 
+def get_db(name="main.db", directory="habit profiles"):
+    """
+    Initialize a sqlite3 database connection. Connections are cached per profile, so opening the same profile again
+    returns the cached connection (unless it has been closed). The tables are only created or migrated if the schema
+    version of the database does not match SCHEMA_VERSION.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    return: (cached) sqlite3 database connection
+    """
+    path = os.path.abspath(get_profile_path(name, directory))
+    db = cached_connections.get(path)
+    if db is not None and is_open(db):
+        cached_connections.move_to_end(path)
+        return db
+    db = open_db(name, directory)
+    cached_connections[path] = db
+    while len(cached_connections) > MAX_CACHED_CONNECTIONS:
+        cached_connections.popitem(last=False)
+    return db
+
+
+def close_db(name="main.db", directory="habit profiles"):
+    """
+    Close the cached connection of a profile, e.g. before the profile file is deleted.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    return:
+    """
+    db = cached_connections.pop(os.path.abspath(get_profile_path(name, directory)), None)
+    if db is not None:
+        db.close()
+
+
+def close_all_dbs():
+    """
+    Close all cached connections.
+
+    return:
+    """
+    while cached_connections:
+        cached_connections.popitem()[1].close()
+
+
+def get_readonly_db(name="main.db", directory="habit profiles", check_same_thread=True):
+    """
+    Initialize a read-only sqlite3 database connection ("mode=ro" URI). Databases with an outdated schema
+    version are migrated once with a writable connection before they are opened read-only. Profiles of a
+    consolidated store are opened like in open_db().
+
+    param name: name of the db-file
+    param directory: directory of the database
+    param check_same_thread: False -> the connection may be used by several threads (one at a time)
+    return: newly created read-only sqlite3 database connection
+    """
+    store = get_store_profile(name, directory)
+    uri = get_readonly_uri(get_profile_path(name, directory) if store is None else store[0])
+    db = connect(uri, uri=True, check_same_thread=check_same_thread)
+    if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        db.close()
+        # not get_db(): read-only connections may be opened in worker threads, cached connections may not be shared
+        open_db(name, directory).close()
+        db = connect(uri, uri=True, check_same_thread=check_same_thread)
+    configure_connection(db, readonly=True)
+    if store is not None:
+        # the temporary views live in the (writable) temp schema of the connection
+        add_profile_views(db, store[1])
+    return db
+
+
+def get_readonly_uri(path):
+    """
+    Return the URI which opens a database file read-only.
+
+    param path: path of the database file
+    return: "file:" URI with "mode=ro"
+    """
+    from urllib.request import pathname2url
+    return "file:" + pathname2url(os.path.abspath(path)) + "?mode=ro"
+
+
 def get_db_name(db):
     """
     Return the name of the database file which belongs to the database connection "db".
@@ -24,28 +195,28 @@ def get_db_name(db):
     return: name of database file
     """
     cur = db.cursor()
+    row = cur.execute("SELECT sql FROM sqlite_temp_master WHERE name = 'current_profile'").fetchone()
+    if row is not None:
+        return cur.execute("SELECT name FROM current_profile").fetchone()[0] + ".db"
     cur.execute("PRAGMA database_list;")
     db_dir = cur.fetchall()[0][2]
-    i = len(db_dir) - 1
-    db_name = ""
-    while True:
-        if db_dir[i] != "\\" and i >= 0:
-            db_name = db_name + db_dir[i]
-            i -= 1
-        else:
-            break
-    db_name = db_name[::-1]
-    return db_name
+    return os.path.basename(db_dir)
 
 
 def get_databases(directory='habit profiles'):
     """
-    Return all names of the database files present in the "habit profiles" folder.
+    Return all names of the database files present in the "habit profiles" folder, or the names of all profiles
+    of the consolidated store if the folder holds one.
 
     return: names of database files
     """
-    import os
-    files = [f for f in os.listdir(directory)]
+    if is_consolidated(directory):
+        db = connect(get_readonly_uri(get_profile_path(STORE_FILE, directory)), uri=True)
+        try:
+            return [x[0] for x in db.execute("SELECT name FROM profile ORDER BY name")]
+        finally:
+            db.close()
+    files = [f for f in os.listdir(get_profile_path("", directory))]
     databases = []
     for f in files:
         if f[(len(f) - 3):len(f)] == ".db":
@@ -53,9 +224,321 @@ def get_databases(directory='habit profiles'):
     return databases
 
 
+# Name of the consolidated store. A profile directory holding this file keeps all its profiles in one database
+# (see consolidate_profiles) instead of one .db-file per profile.
+STORE_FILE = "profiles.sqlite"
+
+
+def is_consolidated(directory="habit profiles"):
+    """
+    Return whether a profile directory uses a consolidated store.
+
+    param directory: directory of the profiles
+    return: True if all profiles of the directory are kept in the consolidated store
+    """
+    return os.path.exists(get_profile_path(STORE_FILE, directory))
+
+
+def get_store_profile(name="main.db", directory="habit profiles"):
+    """
+    Return the consolidated store holding a profile together with the name of the profile in the store.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    return: path of the store and profile name (without ".db"), or None if the directory of the profile keeps one
+    .db-file per profile
+    """
+    path = get_profile_path(name, directory)
+    store_path = os.path.join(os.path.dirname(path), STORE_FILE)
+    if not os.path.exists(store_path):
+        return None
+    return store_path, os.path.basename(path)[:-3]
+
+
+def create_store_tables(db):
+    """
+    Create the tables of a consolidated store (schema version SCHEMA_VERSION), but only if they don't exist yet.
+    The tables of a profile database are prefixed with "store_" and get an additional "profile" column, which leads
+    every primary key and index.
+
+    param db: an initialized sqlite3 database connection of the store
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS profile (name TEXT PRIMARY KEY)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS store_habit (
+        profile TEXT,
+        task TEXT,
+        periodicity TEXT,
+        creation_date TEXT,
+        PRIMARY KEY (profile, task),
+        FOREIGN KEY (profile) REFERENCES profile(name) ON DELETE CASCADE)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS store_tracking (
+        profile TEXT,
+        habitTask TEXT,
+        week TEXT,
+        date TEXT,
+        time TEXT,
+        day INTEGER,
+        FOREIGN KEY (profile, habitTask) REFERENCES store_habit(profile, task) ON DELETE CASCADE)""")
+    cur.execute("CREATE INDEX IF NOT EXISTS store_tracking_habit_day ON store_tracking (profile, habitTask, day, time)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS store_habit_stats (
+        profile TEXT,
+        task TEXT,
+        last_streak INTEGER,
+        longest_streak INTEGER,
+        last_period INTEGER,
+        PRIMARY KEY (profile, task),
+        FOREIGN KEY (profile, task) REFERENCES store_habit(profile, task) ON DELETE CASCADE)""")
+    # the leaderboard over all profiles is read from this index
+    cur.execute("CREATE INDEX IF NOT EXISTS store_habit_stats_longest_streak ON store_habit_stats (longest_streak)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS store_habit_bits (
+        profile TEXT,
+        task TEXT,
+        first_period INTEGER,
+        bits BLOB,
+        PRIMARY KEY (profile, task),
+        FOREIGN KEY (profile, task) REFERENCES store_habit(profile, task) ON DELETE CASCADE)""")
+    # stores of an older schema version get the bitsets of their habits
+    cur.execute("""SELECT store_habit.profile, store_habit.task, store_habit.periodicity, store_habit.creation_date,
+        COALESCE(group_concat(store_tracking.day), '')
+        FROM store_habit LEFT JOIN store_tracking
+            ON store_tracking.profile = store_habit.profile AND store_tracking.habitTask = store_habit.task
+        WHERE NOT EXISTS (SELECT 1 FROM store_habit_bits
+            WHERE store_habit_bits.profile = store_habit.profile AND store_habit_bits.task = store_habit.task)
+        GROUP BY store_habit.profile, store_habit.task""")
+    cur.executemany("INSERT INTO store_habit_bits VALUES (?, ?, ?, ?)",
+                    [(x[0], x[1], *build_habit_bits(x[2], x[3], [int(y) for y in x[4].split(",") if y]))
+                     for x in cur.fetchall()])
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.commit()
+
+
+def add_profile_views(db, profile):
+    """
+    Scope a connection of the consolidated store to one profile. Temporary views named like the tables of a profile
+    database ("habit", "tracking", "habit_stats" and "habit_bits") show only the rows of the profile in the store
+    tables, and INSTEAD OF triggers write through them. So all functions of this module work on both storage layouts.
+
+    param db: an initialized sqlite3 database connection of the store
+    param profile: profile name (without ".db")
+    return:
+    """
+    # views and triggers can not hold parameters, so the profile name is embedded as quoted literal
+    name = "'" + profile.replace("'", "''") + "'"
+    cur = db.cursor()
+    cur.executescript(f"""
+        CREATE TEMP VIEW current_profile AS SELECT {name} AS name;
+        CREATE TEMP VIEW habit AS SELECT task, periodicity, creation_date FROM store_habit WHERE profile = {name};
+        CREATE TEMP VIEW tracking AS SELECT rowid AS rowid, habitTask, week, date, time, day FROM store_tracking
+            WHERE profile = {name};
+        CREATE TEMP VIEW habit_stats AS SELECT task, last_streak, longest_streak, last_period FROM store_habit_stats
+            WHERE profile = {name};
+        CREATE TEMP TRIGGER habit_insert INSTEAD OF INSERT ON habit BEGIN
+            INSERT INTO store_habit VALUES ({name}, NEW.task, NEW.periodicity, NEW.creation_date);
+        END;
+        CREATE TEMP TRIGGER habit_delete INSTEAD OF DELETE ON habit BEGIN
+            DELETE FROM store_habit WHERE profile = {name} AND task = OLD.task;
+        END;
+        CREATE TEMP TRIGGER tracking_insert INSTEAD OF INSERT ON tracking BEGIN
+            INSERT INTO store_tracking VALUES ({name}, NEW.habitTask, NEW.week, NEW.date, NEW.time, NEW.day);
+        END;
+        CREATE TEMP TRIGGER tracking_delete INSTEAD OF DELETE ON tracking BEGIN
+            DELETE FROM store_tracking WHERE profile = {name} AND habitTask = OLD.habitTask AND day = OLD.day;
+        END;
+        CREATE TEMP TRIGGER habit_stats_insert INSTEAD OF INSERT ON habit_stats BEGIN
+            INSERT INTO store_habit_stats VALUES ({name}, NEW.task, NEW.last_streak, NEW.longest_streak,
+                NEW.last_period);
+        END;
+        CREATE TEMP VIEW habit_bits AS SELECT task, first_period, bits FROM store_habit_bits
+            WHERE profile = {name};
+        CREATE TEMP TRIGGER habit_bits_insert INSTEAD OF INSERT ON habit_bits BEGIN
+            INSERT INTO store_habit_bits VALUES ({name}, NEW.task, NEW.first_period, NEW.bits);
+        END;""")
+
+
+def consolidate_profiles(directory="habit profiles"):
+    """
+    Move all profiles of a directory into a consolidated store. The .db-files of the profiles are removed once the
+    store has been written.
+
+    param directory: directory of the profiles
+    return: names of the consolidated profiles
+    """
+    if is_consolidated(directory):
+        raise ValueError(f"The profiles of \"{directory}\" are already consolidated.")
+    close_all_dbs()
+    profiles = get_databases(directory)
+    for x in profiles:
+        # profiles with an outdated schema version are migrated first
+        open_db(x + ".db", directory).close()
+
+    store_path = get_profile_path(STORE_FILE, directory)
+    db = connect(store_path + ".tmp")
+    try:
+        create_store_tables(db)
+        cur = db.cursor()
+        for x in profiles:
+            cur.execute("ATTACH DATABASE ? AS profile_db", (get_profile_path(x + ".db", directory),))
+            cur.execute("INSERT INTO profile VALUES (?)", (x,))
+            cur.execute("INSERT INTO store_habit SELECT ?, task, periodicity, creation_date FROM profile_db.habit",
+                        (x,))
+            cur.execute("""INSERT INTO store_tracking SELECT ?, habitTask, week, date, time, day
+                FROM profile_db.tracking ORDER BY habitTask, day, time""", (x,))
+            cur.execute("""INSERT INTO store_habit_stats SELECT ?, task, last_streak, longest_streak, last_period
+                FROM profile_db.habit_stats""", (x,))
+            cur.execute("INSERT INTO store_habit_bits SELECT ?, task, first_period, bits FROM profile_db.habit_bits",
+                        (x,))
+            db.commit()
+            cur.execute("DETACH DATABASE profile_db")
+    finally:
+        db.close()
+    os.replace(store_path + ".tmp", store_path)
+    for x in profiles:
+        os.remove(get_profile_path(x + ".db", directory))
+    return profiles
+
+
+def split_profiles(directory="habit profiles"):
+    """
+    Move all profiles of a consolidated store back into one .db-file per profile. The store is removed once all
+    files have been written.
+
+    param directory: directory of the profiles
+    return: names of the split profiles
+    """
+    if not is_consolidated(directory):
+        raise ValueError(f"The profiles of \"{directory}\" are not consolidated.")
+    close_all_dbs()
+    store_path = get_profile_path(STORE_FILE, directory)
+    profiles = get_databases(directory)
+    existing = [x for x in profiles if os.path.exists(get_profile_path(x + ".db", directory))]
+    if existing:
+        raise ValueError(f"The profile file(s) {', '.join(existing)} already exist.")
+
+    for x in profiles:
+        db = connect(get_profile_path(x + ".db", directory))
+        try:
+            create_tables(db)
+            configure_connection(db)
+            cur = db.cursor()
+            cur.execute("ATTACH DATABASE ? AS store", (store_path,))
+            cur.execute("""INSERT INTO main.habit SELECT task, periodicity, creation_date FROM store.store_habit
+                WHERE profile=?""", (x,))
+            cur.execute("""INSERT INTO main.tracking (habitTask, week, date, time, day)
+                SELECT habitTask, week, date, time, day FROM store.store_tracking WHERE profile=?
+                ORDER BY habitTask, day, time""", (x,))
+            cur.execute("""INSERT INTO main.habit_stats SELECT task, last_streak, longest_streak, last_period
+                FROM store.store_habit_stats WHERE profile=?""", (x,))
+            cur.execute("""INSERT INTO main.habit_bits SELECT task, first_period, bits FROM store.store_habit_bits
+                WHERE profile=?""", (x,))
+            db.commit()
+            cur.execute("DETACH DATABASE store")
+        finally:
+            db.close()
+    for x in ("", "-wal", "-shm"):
+        if os.path.exists(store_path + x):
+            os.remove(store_path + x)
+    return profiles
+
+
+def profile_exists(name="main.db", directory="habit profiles"):
+    """
+    Return whether a profile exists, in either storage layout.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    return: True if the profile exists
+    """
+    store = get_store_profile(name, directory)
+    if store is None:
+        return os.path.exists(get_profile_path(name, directory))
+    db = connect(get_readonly_uri(store[0]), uri=True)
+    try:
+        return db.execute("SELECT 1 FROM profile WHERE name=?", (store[1],)).fetchone() is not None
+    finally:
+        db.close()
+
+
+def delete_profile(name="main.db", directory="habit profiles"):
+    """
+    Delete a profile together with all its habits and tracking data, in either storage layout.
+
+    param name: name of the db-file
+    param directory: directory of the database
+    return:
+    """
+    close_db(name, directory)
+    store = get_store_profile(name, directory)
+    if store is None:
+        os.remove(get_profile_path(name, directory))
+        return
+    db = connect(store[0])
+    try:
+        configure_connection(db)
+        db.execute("DELETE FROM profile WHERE name=?", (store[1],))
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_store_longest_streak(directory="habit profiles"):
+    """
+    Return the longest run streak over all habits of all profiles of a consolidated store, read with one query from
+    the index on the stored longest run streaks.
+
+    param directory: directory of the profiles
+    return: longest run streak over all habits and all profiles together with the respective habit(s) and profile(s)
+    holding that streak (see analysis.get_overall_longest_streak_all_databases)
+    """
+    db = connect(get_readonly_uri(get_profile_path(STORE_FILE, directory)), uri=True)
+    try:
+        rows = db.execute("""SELECT profile, task, longest_streak FROM store_habit_stats
+            WHERE longest_streak = (SELECT MAX(longest_streak) FROM store_habit_stats)
+            ORDER BY profile, task""").fetchall()
+        longest_streak = rows[0][2] if rows else 0
+        holders = {}
+        if longest_streak == 0:
+            # like with one file per profile, profiles without habits hold a longest streak of 0
+            holders = {x[0]: [] for x in db.execute("SELECT name FROM profile ORDER BY name")}
+    finally:
+        db.close()
+    for profile, task, _ in rows:
+        holders.setdefault(profile, []).append(task)
+    return longest_streak, [[y, x] for x, y in holders.items()]
+
+
+def get_store_habit_summaries(directory="habit profiles"):
+    """
+    Return the stored streak statistics and bitsets of all habits of all profiles of a consolidated store with one
+    query (see get_habit_summaries).
+
+    param directory: directory of the profiles
+    return: dictionary profile name -> list of habit summaries (empty for profiles without habits)
+    """
+    db = connect(get_readonly_uri(get_profile_path(STORE_FILE, directory)), uri=True)
+    try:
+        summaries = {x[0]: [] for x in db.execute("SELECT name FROM profile ORDER BY name")}
+        rows = db.execute("""SELECT store_habit.profile, store_habit.task, store_habit.periodicity,
+            COALESCE(store_habit_stats.last_streak, 0), COALESCE(store_habit_stats.longest_streak, 0),
+            store_habit_stats.last_period, store_habit_bits.first_period, store_habit_bits.bits
+            FROM store_habit
+            LEFT JOIN store_habit_stats
+                ON store_habit_stats.profile = store_habit.profile AND store_habit_stats.task = store_habit.task
+            LEFT JOIN store_habit_bits
+                ON store_habit_bits.profile = store_habit.profile AND store_habit_bits.task = store_habit.task
+            ORDER BY store_habit.profile, store_habit.task""").fetchall()
+    finally:
+        db.close()
+    for x in rows:
+        summaries.setdefault(x[0], []).append((*x[1:7], from_blob(x[7])))
+    return summaries
+
+
 def create_tables(db):
     """
-    Create tables for a database, but only if they don't exist yet.
+    Create tables for a database, but only if they don't exist yet. Tables of databases created with an older
+    schema version are migrated to the current version.
 
     param db: an initialized sqlite3 database connection
     return:
@@ -72,10 +555,87 @@ def create_tables(db):
         date TEXT,
         time TEXT,
         FOREIGN KEY (habitTask) REFERENCES habit(task) ON DELETE CASCADE)""")
+    migrate_tables(db)
+    db.commit()
+
+
+def add_day_ordinals(db):
+    """
+    Schema version 1: store the check-off date as day ordinal (see date.toordinal()) and index the tracking data by
+    habit task and day, so that the tracking data of a habit can be read in chronological order with an index range
+    scan.
+
+    param db: an initialized sqlite3 database connection
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("ALTER TABLE tracking ADD COLUMN day INTEGER")
+    cur.execute("UPDATE tracking SET day = CAST(julianday(date) - 1721424.5 AS INTEGER)")
+    cur.execute("CREATE INDEX IF NOT EXISTS tracking_habit_day ON tracking (habitTask, day, time)")
+
+
+def add_habit_stats(db):
+    """
+    Schema version 2: store the last and longest run streak and the last checked-off period of every habit in the
+    table "habit_stats". The table is filled with a full recompute of the streaks of all habits.
+
+    param db: an initialized sqlite3 database connection
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS habit_stats (
+        task TEXT PRIMARY KEY,
+        last_streak INTEGER,
+        longest_streak INTEGER,
+        last_period INTEGER,
+        FOREIGN KEY (task) REFERENCES habit(task) ON DELETE CASCADE)""")
+    for task in get_habit_tasks(db):
+        rebuild_habit_stats(db, task)
+
+
+def add_habit_bits(db):
+    """
+    Schema version 3: store the check-off history of every habit as bitset (see bitset.py) in the table
+    "habit_bits", one bit per day or week since the creation of the habit. The table is filled from the tracking data.
+
+    param db: an initialized sqlite3 database connection
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS habit_bits (
+        task TEXT PRIMARY KEY,
+        first_period INTEGER,
+        bits BLOB,
+        FOREIGN KEY (task) REFERENCES habit(task) ON DELETE CASCADE)""")
+    for task in get_habit_tasks(db):
+        rebuild_habit_bits(db, task)
+
+
+# migrations[i] migrates a database from schema version i to version i + 1
+migrations = [add_day_ordinals, add_habit_stats, add_habit_bits]
+
+
+def migrate_tables(db):
+    """
+    Migrate the tables of a database to the current schema version in a single transaction.
+    The schema version of a database is stored in "PRAGMA user_version".
+
+    param db: an initialized sqlite3 database connection
+    return:
+    """
+    cur = db.cursor()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    if not db.in_transaction:
+        cur.execute("BEGIN")
+    for migration in migrations[version:SCHEMA_VERSION]:
+        migration(db)
+    cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     db.commit()
 
 
-def add_habit(db, task, periodicity, creation_date):
+def add_habit(db, task, periodicity, creation_date, commit=True):
     """
     Add a new habit to a database.
 
@@ -83,37 +643,46 @@ def add_habit(db, task, periodicity, creation_date):
     param task: habit task
     param periodicity: habit periodicity
     param creation_date: habit creation date
+    param commit: False -> leave the transaction open, e.g. to commit a batch of writes together
     return:
     """
     cur = db.cursor()
     cur.execute("INSERT OR IGNORE INTO habit VALUES (?, ?, ?)", (task, periodicity, creation_date))
-    db.commit()
+    cur.execute("INSERT OR IGNORE INTO habit_stats VALUES (?, 0, 0, NULL)", (task,))
+    cur.execute("INSERT OR IGNORE INTO habit_bits VALUES (?, ?, ?)",
+                (task, *build_habit_bits(periodicity, creation_date, [])))
+    if commit:
+        db.commit()
 
 
-def delete_habit(db, task):
+def delete_habit(db, task, commit=True):
     """
     Delete a habit from a database. The data record with given task is deleted from the "habit" table
     and all the referencing data records in the tracking table are deleted, too.
 
     param db: an initialized sqlite3 database connection
     param task: habit task of the habit to be deleted
+    param commit: False -> leave the transaction open, e.g. to commit a batch of writes together
     return:
     """
     cur = db.cursor()
     cur.execute("DELETE FROM habit WHERE task=?", (task,))
-    db.commit()
+    if commit:
+        db.commit()
 
 
-def check_off_task(db, task, check_off_date=None, check_off_week=None, check_off_time=None):
+def check_off_task(db, task, check_off_date=None, check_off_week=None, check_off_time=None, commit=True):
     """
     "Check-off" a habit task. Check-off week, date and time is either NOW or the ones given
-    as attributes if check_off_date is not None.
+    as attributes if check_off_date is not None. A missing week is derived from the check-off date and a missing
+    time is the current time.
 
     param db: an initialized sqlite3 database connection
     param task: habit task to be checked-off
     param check_off_date: date of check-off
-    param check_off_week: week of check-off
-    param check_off_time: time of check-off
+    param check_off_week: week of check-off (None -> ISO week of the check-off date)
+    param check_off_time: time of check-off (None -> current time)
+    param commit: False -> leave the transaction open, e.g. to commit a batch of writes together
     return:
     """
     cur = db.cursor()
@@ -121,42 +690,215 @@ def check_off_task(db, task, check_off_date=None, check_off_week=None, check_off
         check_off_date = str(date.today())
         check_off_week = date.today().isocalendar()[1]
         check_off_time = datetime.now().strftime("%H:%M:%S")
-    cur.execute("INSERT INTO tracking VALUES (?, ?, ?, ?)",
-                (task, check_off_week, check_off_date, check_off_time))
+    check_off_date = str(check_off_date)
+    date_object = date.fromisoformat(check_off_date)
+    if check_off_week is None:
+        check_off_week = date_object.isocalendar()[1]
+    if check_off_time is None:
+        check_off_time = datetime.now().strftime("%H:%M:%S")
+    check_off_day = date_object.toordinal()
+    cur.execute("INSERT INTO tracking (habitTask, week, date, time, day) VALUES (?, ?, ?, ?, ?)",
+                (task, check_off_week, check_off_date, check_off_time, check_off_day))
+    update_habit_stats(db, task, [check_off_day])
+    update_habit_bits(db, task, [check_off_day])
+    if commit:
+        db.commit()
+
+
+def check_off_many(db, rows, chunk_size=None):
+    """
+    "Check-off" many habit tasks at once, e.g. to import tracking data. Every row is a tuple
+    (task, check_off_date, check_off_week, check_off_time), where week and time are optional. A missing week is
+    derived from the check-off date and a missing time is the current time, as in check_off_task(). The rows are
+    inserted with executemany() in a single transaction, or in one transaction per chunk of rows if a chunk size is
+    given.
+
+    param db: an initialized sqlite3 database connection
+    param rows: iterable of check-off tuples
+    param chunk_size: number of rows to insert per transaction (None -> all rows in one transaction)
+    return: number of inserted rows
+    """
+
+    new_days = {}
+    current_time = datetime.now().strftime("%H:%M:%S")
+
+    def tracking_rows():
+        for row in rows:
+            task, check_off_date = row[0], str(row[1])
+            check_off_week = row[2] if len(row) > 2 else None
+            check_off_time = (row[3] if len(row) > 3 else None) or current_time
+            date_object = date.fromisoformat(check_off_date)
+            if check_off_week is None:
+                check_off_week = date_object.isocalendar()[1]
+            new_days.setdefault(task, []).append(date_object.toordinal())
+            yield task, check_off_week, check_off_date, check_off_time, date_object.toordinal()
+
+    def commit():
+        # the streak statistics and bitsets are updated in the same transaction as the inserted rows
+        for task, days in new_days.items():
+            update_habit_stats(db, task, days)
+            update_habit_bits(db, task, days)
+        new_days.clear()
+        db.commit()
+
+    cur = db.cursor()
+    sql = "INSERT INTO tracking (habitTask, week, date, time, day) VALUES (?, ?, ?, ?, ?)"
+    number_of_rows = 0
+    if chunk_size is None:
+        # counted while the rows are generated, since the rowcount of an INSERT through the view of a consolidated
+        # store is 0
+        cur.executemany(sql, tracking_rows())
+        number_of_rows = sum(len(x) for x in new_days.values())
+        commit()
+    else:
+        chunk = []
+        for row in tracking_rows():
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                cur.executemany(sql, chunk)
+                commit()
+                number_of_rows += len(chunk)
+                chunk = []
+        if chunk:
+            cur.executemany(sql, chunk)
+            commit()
+            number_of_rows += len(chunk)
+    return number_of_rows
+
+
+def delete_check_off(db, task, check_off_date):
+    """
+    Delete all check-offs of a habit task on the given date, rebuild the streak statistics of the habit and clear
+    the bit of the period in its bitset (unless the period still holds other check-offs).
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param check_off_date: date of the check-off(s) to be deleted
+    return: number of deleted check-offs
+    """
+    cur = db.cursor()
+    day = date.fromisoformat(str(check_off_date)).toordinal()
+    # counted beforehand, since the rowcount of a DELETE through the view of a consolidated store is 0
+    cur.execute("SELECT COUNT(*) FROM tracking WHERE habitTask=? AND day=?", (task, day))
+    number_of_rows = cur.fetchone()[0]
+    cur.execute("DELETE FROM tracking WHERE habitTask=? AND day=?", (task, day))
+    rebuild_habit_stats(db, task)
+    periodicity, first_period, bits = get_habit_bits(db, task)
+    if first_period is None:
+        rebuild_habit_bits(db, task)
+    elif number_of_rows:
+        period = get_period(day, periodicity)
+        first_day = period * 7 + 1 if periodicity == "weekly" else day
+        last_day = first_day + 6 if periodicity == "weekly" else day
+        cur.execute("SELECT 1 FROM tracking WHERE habitTask=? AND day BETWEEN ? AND ? LIMIT 1",
+                    (task, first_day, last_day))
+        if cur.fetchone() is None:
+            cur.execute("INSERT OR REPLACE INTO habit_bits VALUES (?, ?, ?)",
+                        (task, first_period, to_blob(clear_period(bits, first_period, period))))
     db.commit()
+    return number_of_rows
+
+
+def import_tracking_data(db, file_path, chunk_size=10000):
+    """
+    Import tracking data from a .csv, .json or .ndjson file. Every record holds the keys "task" and "date" and
+    optionally "week", "time" and "periodicity". A .csv-file needs a header line with these keys, a .json-file holds
+    a list of objects and a .ndjson-file one object per line. Habits that do not exist yet are created with the given
+    periodicity (default "daily") and the date of their first check-off as creation date.
+
+    param db: an initialized sqlite3 database connection
+    param file_path: path of the .csv, .json or .ndjson file
+    param chunk_size: number of rows to insert per transaction
+    return: number of imported check-offs
+    """
+    import csv
+    import json
+    with open(file_path, newline="") as infile:
+        if file_path.endswith(".json"):
+            records = json.load(infile)
+        elif file_path.endswith((".ndjson", ".jsonl")):
+            records = [json.loads(x) for x in infile if x.strip()]
+        else:
+            records = list(csv.DictReader(infile))
+
+    # all records are checked before anything is written, so that a malformed record does not leave new habits behind
+    new_habits = {}
+    rows = []
+    for i, x in enumerate(records):
+        if not isinstance(x, dict) or not x.get("task") or not x.get("date"):
+            raise ValueError(f"Record {i + 1} of \"{file_path}\" needs a \"task\" and a \"date\".")
+        task, periodicity = x["task"], x.get("periodicity") or "daily"
+        if periodicity not in ("daily", "weekly"):
+            raise ValueError(f"Record {i + 1} of \"{file_path}\" has an invalid periodicity \"{periodicity}\".")
+        try:
+            check_off_date = date.fromisoformat(x["date"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Record {i + 1} of \"{file_path}\" has an invalid date \"{x['date']}\".") from None
+        if task not in new_habits:
+            new_habits[task] = [periodicity, check_off_date]
+        elif check_off_date < new_habits[task][1]:
+            new_habits[task][1] = check_off_date
+        rows.append((task, str(check_off_date), x.get("week") or None, x.get("time") or None))
+
+    # the new habits are committed together with the first chunk of check-offs
+    try:
+        for task, (periodicity, creation_date) in new_habits.items():
+            add_habit(db, task, periodicity, str(creation_date), commit=False)
+        return check_off_many(db, rows, chunk_size)
+    except BaseException:
+        db.rollback()
+        raise
+
+
+# Result of check_off_task_today(): periodicity of the habit and whether the task has been checked-off (False if it
+# had already been checked-off in the current period)
+CheckOffResult = namedtuple("CheckOffResult", ["task", "periodicity", "checked_off"])
 
 
-def check_off_task_today(db, task):
+def get_last_check_off(db, task):
+    """
+    Return the periodicity of the given habit, represented by its task, together with the day ordinal of its latest
+    check-off. The latest check-off is read from the end of the (habitTask, day) index, so the cost of the lookup
+    does not depend on the length of the tracking history.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: periodicity of given habit (None if the habit does not exist) and day ordinal of its latest check-off
+    (None if the habit has not been checked-off yet)
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT periodicity,
+        (SELECT day FROM tracking WHERE habitTask = habit.task ORDER BY day DESC LIMIT 1)
+        FROM habit WHERE task=?""", (task,))
+    row = cur.fetchone()
+    if row is None:
+        return None, None
+    return row[0], row[1]
+
+
+def check_off_task_today(db, task, commit=True):
     """
     Check-off habit task if the task has not been checked off in the current period (day or week,
-    depending on the periodicity of the given habit task).
+    depending on the periodicity of the given habit task). The current period is looked up in the bitset of the habit.
 
     param db: an initialized sqlite3 database connection
     param task: habit task to be checked-off
-    return:
+    param commit: False -> leave the transaction open, e.g. to commit a batch of writes together
+    return: CheckOffResult with the periodicity of the habit and whether the task has been checked-off
     """
-    tracking_data = get_tracking_data(db, task)
-    if not tracking_data:
-        check_off_task(db, task)
-        if get_periodicity(db, task) == "daily":
-            print(f"\"{task}\" has been checked-off for today. Good job!")
-        else:
-            print(f"\"{task}\" has been checked-off for this week. Good job!")
+    periodicity, first_period, bits = get_habit_bits(db, task)
+    today = date.today().toordinal()
+    if first_period is not None:
+        already_checked_off = has_period(bits, first_period, get_period(today, periodicity))
     else:
-        if get_periodicity(db, task) == "daily":
-            if tracking_data[len(tracking_data) - 1][2] == str(date.today()):
-                print("You already checked-off this task today.")
-            else:
-                check_off_task(db, task)
-                print(f"\"{task}\" has been checked-off for today. Good job!")
-        elif get_periodicity(db, task) == "weekly":
-            # check if week number AND year of last tracking entry equals the ones of today
-            if (tracking_data[len(tracking_data) - 1][1] == str(date.today().isocalendar()[1]))\
-                    and (tracking_data[len(tracking_data) - 1][2][0:4] == str(date.today())[0:4]):
-                print("You already checked-off this task for this week.")
-            else:
-                check_off_task(db, task)
-                print(f"\"{task}\" has been checked-off for this week. Good job!")
+        # habits without a bitset (e.g. not existing habits)
+        periodicity, last_day = get_last_check_off(db, task)
+        already_checked_off = last_day is not None and get_period(last_day, periodicity) == get_period(today,
+                                                                                                       periodicity)
+    if already_checked_off:
+        return CheckOffResult(task, periodicity, False)
+    check_off_task(db, task, commit=commit)
+    return CheckOffResult(task, periodicity, True)
 
 
 def get_creation_date(db, task):
@@ -185,6 +927,346 @@ def get_periodicity(db, task):
     return cur.fetchall()[0][0]
 
 
+def get_check_off_periods(db, task):
+    """
+    Return the periodicity of the given habit, represented by its task, together with the periods (day or week
+    ordinals, depending on the periodicity) of all its check-offs in ascending order. Both are fetched with one query.
+    Day ordinals follow date.toordinal(), week ordinals count the weeks (starting on Monday) since 0001-01-01.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: periodicity of given habit (None if the habit does not exist) and list of check-off periods
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.periodicity, tracking.day
+        FROM habit LEFT JOIN tracking ON tracking.habitTask = habit.task
+        WHERE habit.task=? ORDER BY tracking.day""", (task,))
+    rows = cur.fetchall()
+    if not rows:
+        return None, []
+    periodicity = rows[0][0]
+    if rows[0][1] is None:
+        return periodicity, []
+    if periodicity == "weekly":
+        # 0001-01-01 is a Monday, so integer division by 7 maps every day of a week onto the same ordinal
+        return periodicity, [(x[1] - 1) // 7 for x in rows]
+    return periodicity, [x[1] for x in rows]
+
+
+def get_period(day, periodicity):
+    """
+    Return the period ordinal of a check-off day: the day ordinal itself for daily habits, the week ordinal for
+    weekly habits (see get_check_off_periods).
+
+    param day: day ordinal of the check-off
+    param periodicity: periodicity of the habit
+    return: period ordinal
+    """
+    if periodicity == "weekly":
+        return (day - 1) // 7
+    return day
+
+
+def advance_streaks(periods, last_streak=0, longest_streak=0, last_period=None):
+    """
+    Advance the streak state of a habit by an ascending sequence of period ordinals in a single pass. Two periods
+    belong to the same run streak if their ordinals differ by exactly one. Multiple check-offs within the same
+    period are counted only once.
+
+    param periods: ascending period ordinals of new check-offs, none of them before last_period
+    param last_streak: last run streak before the new check-offs
+    param longest_streak: longest run streak before the new check-offs
+    param last_period: last checked-off period before the new check-offs (None -> no check-offs yet)
+    return: last run streak, longest run streak and last checked-off period
+    """
+    for period in periods:
+        if period == last_period:
+            continue
+        if last_period is not None and period == last_period + 1:
+            last_streak += 1
+        else:
+            last_streak = 1
+        if last_streak > longest_streak:
+            longest_streak = last_streak
+        last_period = period
+    return last_streak, longest_streak, last_period
+
+
+def rebuild_habit_stats(db, task):
+    """
+    Recompute the streak statistics of a habit from its full tracking history. The changes are not committed.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("INSERT OR REPLACE INTO habit_stats VALUES (?, ?, ?, ?)",
+                (task, *advance_streaks(get_check_off_periods(db, task)[1])))
+
+
+def update_habit_stats(db, task, days):
+    """
+    Update the streak statistics of a habit after new check-offs on the given days. Check-offs in or after the last
+    checked-off period advance the stored streaks, back-dated check-offs trigger a full rebuild of the statistics of
+    the habit. The changes are not committed, so they end up in the same transaction as the check-offs.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param days: day ordinals of the new check-offs
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.periodicity, habit_stats.last_streak, habit_stats.longest_streak,
+        habit_stats.last_period FROM habit LEFT JOIN habit_stats ON habit_stats.task = habit.task
+        WHERE habit.task=?""", (task,))
+    row = cur.fetchone()
+    if row is None:
+        return
+    periodicity, last_streak, longest_streak, last_period = row
+    periods = sorted(get_period(x, periodicity) for x in days)
+    if last_streak is None or (last_period is not None and periods[0] < last_period):
+        rebuild_habit_stats(db, task)
+    else:
+        cur.execute("INSERT OR REPLACE INTO habit_stats VALUES (?, ?, ?, ?)",
+                    (task, *advance_streaks(periods, last_streak, longest_streak, last_period)))
+
+
+def build_habit_bits(periodicity, creation_date, days):
+    """
+    Build the bitset of a habit from the day ordinals of its check-offs. Bit 0 is the period of the creation date, or
+    the period of the first check-off if that is earlier.
+
+    param periodicity: periodicity of the habit
+    param creation_date: creation date of the habit (None -> period of the first check-off)
+    param days: day ordinals of the check-offs
+    return: period ordinal of bit 0 (None if there is neither a creation date nor a check-off) and bitset as BLOB
+    """
+    first_period = None
+    if creation_date is not None:
+        first_period = get_period(date.fromisoformat(str(creation_date)).toordinal(), periodicity)
+    bits, first_period = set_periods(0, first_period, [get_period(x, periodicity) for x in days])
+    return first_period, to_blob(bits)
+
+
+def rebuild_habit_bits(db, task):
+    """
+    Rebuild the bitset of a habit from its full tracking history. The changes are not committed.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return:
+    """
+    cur = db.cursor()
+    cur.execute("SELECT periodicity, creation_date FROM habit WHERE task=?", (task,))
+    row = cur.fetchone()
+    if row is None:
+        return
+    days = [x[0] for x in cur.execute("SELECT day FROM tracking WHERE habitTask=?", (task,))]
+    cur.execute("INSERT OR REPLACE INTO habit_bits VALUES (?, ?, ?)", (task, *build_habit_bits(*row, days)))
+
+
+def update_habit_bits(db, task, days):
+    """
+    Set the bits of new check-offs on the given days in the bitset of a habit. The changes are not committed, so they
+    end up in the same transaction as the check-offs.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param days: day ordinals of the new check-offs
+    return:
+    """
+    periodicity, first_period, bits = get_habit_bits(db, task)
+    if periodicity is None:
+        return
+    if first_period is None:
+        # habits without a row in "habit_bits"
+        rebuild_habit_bits(db, task)
+        return
+    bits, first_period = set_periods(bits, first_period, [get_period(x, periodicity) for x in days])
+    db.execute("INSERT OR REPLACE INTO habit_bits VALUES (?, ?, ?)", (task, first_period, to_blob(bits)))
+
+
+def get_habit_bits(db, task):
+    """
+    Return the periodicity of the given habit, represented by its task, together with its bitset.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: periodicity (None if the habit does not exist), period ordinal of bit 0 (None if the habit has no bitset)
+    and bitset
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.periodicity, habit_bits.first_period, habit_bits.bits
+        FROM habit LEFT JOIN habit_bits ON habit_bits.task = habit.task WHERE habit.task=?""", (task,))
+    row = cur.fetchone()
+    if row is None:
+        return None, None, 0
+    return row[0], row[1], from_blob(row[2])
+
+
+def get_all_habit_bits(db):
+    """
+    Return the periodicity and bitset of all habits with a single query.
+
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> (periodicity, period ordinal of bit 0, bitset)
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.task, habit.periodicity, habit_bits.first_period, habit_bits.bits
+        FROM habit LEFT JOIN habit_bits ON habit_bits.task = habit.task ORDER BY habit.task""")
+    return {x[0]: (x[1], x[2], from_blob(x[3])) for x in cur.fetchall()}
+
+
+def get_habit_summaries(db):
+    """
+    Return the stored streak statistics and bitsets of all habits with a single query, so that habits can be ranked
+    without reading their tracking data (see leaderboard.py).
+
+    param db: an initialized sqlite3 database connection
+    return: list of (task, periodicity, last run streak, longest run streak, last checked-off period, period ordinal
+    of bit 0, bitset) tuples, ordered by habit task
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.task, habit.periodicity, COALESCE(habit_stats.last_streak, 0),
+        COALESCE(habit_stats.longest_streak, 0), habit_stats.last_period, habit_bits.first_period, habit_bits.bits
+        FROM habit LEFT JOIN habit_stats ON habit_stats.task = habit.task
+        LEFT JOIN habit_bits ON habit_bits.task = habit.task ORDER BY habit.task""")
+    return [(*x[:6], from_blob(x[6])) for x in cur.fetchall()]
+
+
+def get_habit_stats(db, task):
+    """
+    Return the stored last and longest run streak of the given habit, represented by its task.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return: last and longest run streak for given habit
+    """
+    cur = db.cursor()
+    cur.execute("SELECT last_streak, longest_streak FROM habit_stats WHERE task=?", (task,))
+    row = cur.fetchone()
+    if row is None:
+        return 0, 0
+    return row
+
+
+def get_all_habit_stats(db):
+    """
+    Return the stored last and longest run streak of all habits with a single query.
+
+    param db: an initialized sqlite3 database connection
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    cur = db.cursor()
+    cur.execute("""SELECT habit.task, COALESCE(habit_stats.last_streak, 0), COALESCE(habit_stats.longest_streak, 0)
+        FROM habit LEFT JOIN habit_stats ON habit_stats.task = habit.task ORDER BY habit.task""")
+    return {x[0]: (x[1], x[2]) for x in cur.fetchall()}
+
+
+def get_streaks_sql(db, task=None):
+    """
+    Calculate the last and longest run streak of all habits (or only of the given habit) with a single set-based
+    SQL statement ("gaps and islands"): within a habit, consecutive periods minus their row number form a constant
+    island id, so every island is one run streak. The last run streak is the island with the latest period.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task (None -> all habits)
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    cur = db.cursor()
+    cur.execute("""WITH periods AS (
+            SELECT DISTINCT tracking.habitTask AS task,
+                CASE WHEN habit.periodicity = 'weekly' THEN (tracking.day - 1) / 7 ELSE tracking.day END AS period
+            FROM tracking JOIN habit ON habit.task = tracking.habitTask
+            WHERE ?1 IS NULL OR tracking.habitTask = ?1),
+        islands AS (
+            SELECT task, period, period - ROW_NUMBER() OVER (PARTITION BY task ORDER BY period) AS island
+            FROM periods),
+        runs AS (
+            SELECT task, COUNT(*) AS length,
+                ROW_NUMBER() OVER (PARTITION BY task ORDER BY MAX(period) DESC) AS recency
+            FROM islands GROUP BY task, island)
+        SELECT habit.task, COALESCE(MAX(CASE WHEN runs.recency = 1 THEN runs.length END), 0),
+            COALESCE(MAX(runs.length), 0)
+        FROM habit LEFT JOIN runs ON runs.task = habit.task
+        WHERE ?1 IS NULL OR habit.task = ?1
+        GROUP BY habit.task ORDER BY habit.task""", (task,))
+    return {x[0]: (x[1], x[2]) for x in cur.fetchall()}
+
+
+def get_grouped_check_off_days(db, first_task=None, end_task=None):
+    """
+    Return all habits (or only the habits whose tasks lie in the range from first_task up to, but not including,
+    end_task) together with their periodicity and the day ordinals of all their check-offs, ordered by habit task.
+    The day ordinals of a habit are concatenated to one comma-separated string (in no particular order), which is
+    much faster to fetch and parse in bulk than one row per check-off.
+
+    param db: an initialized sqlite3 database connection
+    param first_task: first habit task of the range (None -> from the first habit)
+    param end_task: habit task after the range (None -> up to the last habit)
+    return: list of (task, periodicity, comma-separated day ordinals) tuples
+    """
+    conditions = []
+    parameters = []
+    if first_task is not None:
+        conditions.append("habit.task >= ?")
+        parameters.append(first_task)
+    if end_task is not None:
+        conditions.append("habit.task < ?")
+        parameters.append(end_task)
+    cur = db.cursor()
+    cur.execute(f"""SELECT habit.task, habit.periodicity, COALESCE(group_concat(tracking.day), '')
+        FROM habit LEFT JOIN tracking ON tracking.habitTask = habit.task
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        GROUP BY habit.task ORDER BY habit.task""", parameters)
+    return cur.fetchall()
+
+
+def verify_habit_stats(db, repair=False):
+    """
+    Compare the stored streak statistics and bitsets of all habits with a full recompute from the tracking data.
+
+    param db: an initialized sqlite3 database connection
+    param repair: rebuild the statistics and bitsets of the habits that do not match
+    return: habit tasks whose stored statistics or bitsets do not match the recompute
+    """
+    cur = db.cursor()
+    stored = {x[0]: tuple(x[1:]) for x in cur.execute("SELECT * FROM habit_stats")}
+    bitsets = get_all_habit_bits(db)
+    mismatches = []
+    for task in get_habit_tasks(db):
+        periods = get_check_off_periods(db, task)[1]
+        _, first_period, bits = bitsets[task]
+        if (stored.get(task) != advance_streaks(periods)
+                or (get_periods(bits, first_period) if first_period is not None else []) != sorted(set(periods))):
+            mismatches.append(task)
+    if repair:
+        for task in mismatches:
+            rebuild_habit_stats(db, task)
+            rebuild_habit_bits(db, task)
+        db.commit()
+    return mismatches
+
+
+def get_habits(db, periodicity=None):
+    """
+    Return task, periodicity and creation date of all habits, or only of the habits with the given periodicity,
+    with a single query.
+
+    param db: an initialized sqlite3 database connection
+    param periodicity: periodicity of the habits (None -> all habits)
+    return: list of (task, periodicity, creation date) tuples, ordered by habit task
+    """
+    cur = db.cursor()
+    if periodicity is None:
+        cur.execute("SELECT task, periodicity, creation_date FROM habit ORDER BY task")
+    else:
+        cur.execute("SELECT task, periodicity, creation_date FROM habit WHERE periodicity=? ORDER BY task",
+                    (periodicity,))
+    return cur.fetchall()
+
+
 def get_habit_tasks(db):
     cur = db.cursor()
     habit_tasks = cur.execute("SELECT task FROM habit")
@@ -197,7 +1279,7 @@ def get_habit_tasks(db):
 def get_tracking_data(db, task=None):
     """
     Return tracking data of a database, either all the data or only the one belonging to the given habit,
-    represented by its task.
+    represented by its task. The tracking data is ordered by check-off date and time.
 
     param db: an initialized sqlite3 database connection
     param task: habit task
@@ -205,12 +1287,80 @@ def get_tracking_data(db, task=None):
     """
     cur = db.cursor()
     if task is None:
-        cur.execute("SELECT * FROM tracking")
+        cur.execute("SELECT habitTask, week, date, time FROM tracking ORDER BY day, time")
     else:
-        cur.execute("SELECT * FROM tracking WHERE habitTask=?", (task,))
+        cur.execute("SELECT habitTask, week, date, time FROM tracking WHERE habitTask=? ORDER BY day, time",
+                    (task,))
     return cur.fetchall()
 
 
+def iter_tracking_data(db, task=None, start_date=None, end_date=None, batch_size=1000):
+    """
+    Yield tracking data of a database batch by batch (fetchmany), so that memory use does not grow with the amount
+    of tracking data. The data can be filtered by habit task and date range and is ordered by habit task, check-off
+    date and time, which is the order of the (habitTask, day, time) index.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task (None -> all habits)
+    param start_date: first check-off date to include (None -> no lower bound)
+    param end_date: last check-off date to include (None -> no upper bound)
+    param batch_size: number of rows fetched at once
+    return: generator of (task, week, date, time) tuples
+    """
+    conditions = []
+    parameters = []
+    if task is not None:
+        conditions.append("habitTask = ?")
+        parameters.append(task)
+    if start_date is not None:
+        conditions.append("day >= ?")
+        parameters.append(date.fromisoformat(str(start_date)).toordinal())
+    if end_date is not None:
+        conditions.append("day <= ?")
+        parameters.append(date.fromisoformat(str(end_date)).toordinal())
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    cur = db.cursor()
+    cur.execute("SELECT habitTask, week, date, time FROM tracking" + where + " ORDER BY habitTask, day, time",
+                parameters)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def export_tracking_data(db, file_path, task=None, start_date=None, end_date=None):
+    """
+    Stream tracking data into a .csv or .ndjson file (one JSON object per line), with constant memory use.
+    The exported records have the keys "task", "week", "date" and "time" and can be imported again with
+    import_tracking_data().
+
+    param db: an initialized sqlite3 database connection
+    param file_path: path of the .csv or .ndjson file
+    param task: habit task (None -> all habits)
+    param start_date: first check-off date to export (None -> no lower bound)
+    param end_date: last check-off date to export (None -> no upper bound)
+    return: number of exported check-offs
+    """
+    import csv
+    import json
+    keys = ["task", "week", "date", "time"]
+    number_of_rows = 0
+    with open(file_path, "w", newline="") as outfile:
+        rows = iter_tracking_data(db, task, start_date, end_date)
+        if file_path.endswith((".ndjson", ".jsonl")):
+            for x in rows:
+                outfile.write(json.dumps(dict(zip(keys, x))) + "\n")
+                number_of_rows += 1
+        else:
+            writer = csv.writer(outfile)
+            writer.writerow(keys)
+            for x in rows:
+                writer.writerow(x)
+                number_of_rows += 1
+    return number_of_rows
+
+
 def create_example_profile(name="example.db", chance_of_checkoff=75):
     """
     Create example habit tracking data.
@@ -219,6 +1369,7 @@ def create_example_profile(name="example.db", chance_of_checkoff=75):
     param chance_of_checkoff: Probability of "check-offs" during the creation of the randomized tracking data
     return:
     """
+    import random
 
     ex_db = get_db(name)
 
@@ -228,32 +1379,32 @@ def create_example_profile(name="example.db", chance_of_checkoff=75):
     add_habit(ex_db, "Going into nature once a week", "weekly", "2022-09-06")
     add_habit(ex_db, "Going to the gym two times a week", "weekly", "2022-09-08")
 
-    habit_tasks = get_habit_tasks(ex_db)
+    cur = ex_db.cursor()
+    habits = cur.execute("SELECT task, periodicity, creation_date FROM habit").fetchall()
     number_of_tracking_days = 28
     number_of_tracking_weeks = 4
+    rows = []
 
     # In the following, randomized tracking data will be created for the example profile. Randomizing the tracking data
     # has a few advantages:
     # 1. It makes the example tracking data look more realistic.
     # 2. It can be used to test if the analytics functionality of the app works as expected not only for one, but
     # for all possible sets of tracking data.
-    for x in habit_tasks:
-        starting_date = date.fromisoformat(get_creation_date(ex_db, x))
-        if get_periodicity(ex_db, x) == "daily":
+    for x, periodicity, creation_date in habits:
+        starting_date = date.fromisoformat(creation_date)
+        if periodicity == "daily":
             number_of_periods = number_of_tracking_days
         else:
             number_of_periods = number_of_tracking_weeks
         for y in range(number_of_periods):
             random_number = random.randint(1, 100)
             if random_number <= chance_of_checkoff:
-                if get_periodicity(ex_db, x) == "daily":
+                if periodicity == "daily":
                     new_date = starting_date + (y*timedelta(1))
                     new_week = new_date.isocalendar()[1]
                 else:
                     new_week_date = starting_date + y * timedelta(7)
-                    while new_week_date.weekday() > 0:
-                        new_week_date = new_week_date - timedelta(1)
-                    first_weekday = new_week_date
+                    first_weekday = new_week_date - timedelta(new_week_date.weekday())
                     random_weekday_number = random.randint(0, 6)
                     new_date = first_weekday + random_weekday_number * timedelta(1)
                     new_week = new_date.isocalendar()[1]
@@ -269,6 +1420,7 @@ def create_example_profile(name="example.db", chance_of_checkoff=75):
                                            minute=random_minute, second=random_second)
                 new_time = random_datetime.strftime("%H:%M:%S")
 
-                check_off_task(ex_db, x, new_date, new_week, new_time)
+                rows.append((x, new_date, new_week, new_time))
 
+    check_off_many(ex_db, rows)
     ex_db.close()
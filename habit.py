@@ -1,31 +1,36 @@
 from datetime import date
-from db import check_off_task_today, add_habit, delete_habit
+from db import check_off_task_today, add_habit, delete_habit, get_habits
 
 
 class Habit:
+    # habits are loaded in bulk (see load_habits), so they are kept as compact as possible
+    __slots__ = ("task", "periodicity", "creation_date")
 
-    def __init__(self, task, periodicity):
+    def __init__(self, task, periodicity, creation_date=None):
         """
         Habit class, to create habits with a certain task, periodicity and creation date.
 
         param task: habit task (e.g. "Not using the phone in the morning")
         param periodicity: habit periodicity can be "daily" or "weekly"
+        param creation_date: habit creation date (None -> today)
         """
         self.task = task
         self.periodicity = periodicity
-        self.creation_date = date.today()
+        self.creation_date = date.today() if creation_date is None else creation_date
 
 
 class DBHabit(Habit):
+    __slots__ = ()
 
     def check_off(self, db):
         """
-        Check-off the task of a habit. Adds a new entry into the "tracking" table for the given habit.
+        Check-off the task of a habit. Adds a new entry into the "tracking" table for the given habit, unless the
+        task has already been checked-off in the current period.
 
         param db: an initialized sqlite3 database connection
-        return:
+        return: CheckOffResult of the check-off (see db.check_off_task_today)
         """
-        check_off_task_today(db, self.task)
+        return check_off_task_today(db, self.task)
 
     def store(self, db):
         """
@@ -44,3 +49,15 @@ class DBHabit(Habit):
         return:
         """
         delete_habit(db, self.task)
+
+
+def load_habits(db, periodicity=None):
+    """
+    Load all habits stored in the given database with a single query, optionally only the ones with the given
+    periodicity (filtered in SQL).
+
+    param db: an initialized sqlite3 database connection
+    param periodicity: periodicity of the habits (None -> all habits)
+    return: list of DBHabit objects, ordered by habit task
+    """
+    return [DBHabit(*x) for x in get_habits(db, periodicity)]
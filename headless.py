@@ -0,0 +1,245 @@
+import argparse
+import json
+import shlex
+import sqlite3
+import sys
+from db import get_db, get_databases, check_off_task, check_off_task_today, import_tracking_data, \
+    export_tracking_data, close_all_dbs, consolidate_profiles, split_profiles
+from habit import load_habits
+from analysis import get_all_streaks, get_overall_longest_streak, get_overall_longest_streak_all_databases, \
+    get_period_indices
+from leaderboard import get_top_habits, get_top_profiles, LEADERBOARD_METRICS
+from datetime import date
+
+
+def get_default_profile(config_file="config.json"):
+    """
+    Return the name of the default profile stored in the config file.
+
+    param config_file: path of the config file
+    return: name of the default profile (without ".db")
+    """
+    with open(config_file) as infile:
+        return json.load(infile)["default_profile"]
+
+
+def build_parser():
+    """
+    Build the argument parser of the non-interactive command line interface.
+
+    return: argparse.ArgumentParser
+    """
+    profile_options = argparse.ArgumentParser(add_help=False)
+    profile_options.add_argument("--profile", help="habit profile (default: the default profile of config.json)")
+    profile_options.add_argument("--directory", default="habit profiles", help="directory of the habit profiles")
+
+    parser = argparse.ArgumentParser(prog="main.py", description=("Run HabTrack commands without the interactive "
+                                                                  "menus. Every command prints its result as JSON."))
+    parser.add_argument("--instrument", action="store_true",
+                        help=("print a report of the calls, wall time, SQL statements and fetched rows of the db and "
+                              "analysis functions to stderr (also enabled by HABTRACK_INSTRUMENTATION=1)"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    checkoff = commands.add_parser("checkoff", parents=[profile_options], help="check-off habit tasks")
+    checkoff.add_argument("tasks", nargs="+", metavar="TASK")
+    checkoff.add_argument("--date", help="check-off date (YYYY-MM-DD) instead of today, also for back-dated "
+                                         "check-offs")
+    checkoff.add_argument("--time", help="check-off time (HH:MM:SS), only used together with --date")
+
+    report = commands.add_parser("report", parents=[profile_options], help="report habits and their run streaks")
+    report.add_argument("tasks", nargs="*", metavar="TASK", help="habit tasks to report (default: all habits)")
+    report.add_argument("--periodicity", choices=["daily", "weekly"])
+
+    window = commands.add_parser("window", parents=[profile_options],
+                                 help="check-offs, completion rates and run streaks of the habits within a date range")
+    window.add_argument("tasks", nargs="*", metavar="TASK", help="habit tasks to report (default: all habits)")
+    window.add_argument("--start", required=True, help="first date of the range (YYYY-MM-DD)")
+    window.add_argument("--end", help="last date of the range (YYYY-MM-DD, default: today)")
+    window.add_argument("--by", choices=["week", "month"],
+                        help="also report the completion rate of every week or month")
+    window.add_argument("--rolling", type=int, default=30, help="window (in days) of the rolling consistency")
+
+    leaderboard = commands.add_parser("leaderboard", help="longest run streak over all profiles")
+    leaderboard.add_argument("--directory", default="habit profiles", help="directory of the habit profiles")
+    leaderboard.add_argument("--workers", type=int, help="number of worker threads")
+    leaderboard.add_argument("--top", type=int, metavar="K",
+                             help="rank the top K habits from the leaderboard index instead")
+    leaderboard.add_argument("--metric", choices=LEADERBOARD_METRICS, default="longest_streak",
+                             help="ranking metric of --top")
+    leaderboard.add_argument("--profiles", action="store_true", help="rank profiles instead of habits with --top")
+
+    import_data = commands.add_parser("import", parents=[profile_options],
+                                      help="import tracking data from a .csv, .json or .ndjson file")
+    import_data.add_argument("file")
+
+    export_data = commands.add_parser("export", parents=[profile_options],
+                                      help="export tracking data into a .csv or .ndjson file")
+    export_data.add_argument("file")
+    export_data.add_argument("--task")
+    export_data.add_argument("--start", help="first check-off date (YYYY-MM-DD)")
+    export_data.add_argument("--end", help="last check-off date (YYYY-MM-DD)")
+
+    consolidate = commands.add_parser("consolidate", help="move all profiles of a directory into one database")
+    consolidate.add_argument("--directory", default="habit profiles", help="directory of the habit profiles")
+
+    split = commands.add_parser("split", help="move the profiles of a consolidated directory back into one file each")
+    split.add_argument("--directory", default="habit profiles", help="directory of the habit profiles")
+
+    batch = commands.add_parser("batch", help=("run many commands (one per line, e.g. \"checkoff --profile anna "
+                                               "Reading\") from a file or from stdin (\"-\") in one process"))
+    batch.add_argument("file")
+    return parser
+
+
+def run_command(args):
+    """
+    Run a single parsed command.
+
+    param args: parsed arguments of a command
+    return: JSON-serializable result of the command
+    """
+    if args.command == "leaderboard" and args.top is not None:
+        get_top = get_top_profiles if args.profiles else get_top_habits
+        return {"metric": args.metric, "top": get_top(args.directory, args.metric, args.top)}
+
+    elif args.command == "leaderboard":
+        longest_streak, longest_streak_habits_dbs = get_overall_longest_streak_all_databases(
+            args.directory, args.workers, use_disk_cache=True)
+        return {"longest_streak": longest_streak,
+                "holders": [{"profile": x[1], "habits": x[0]} for x in longest_streak_habits_dbs]}
+
+    elif args.command == "consolidate":
+        return {"directory": args.directory, "consolidated": consolidate_profiles(args.directory)}
+
+    elif args.command == "split":
+        return {"directory": args.directory, "split": split_profiles(args.directory)}
+
+    profile = args.profile or get_default_profile()
+    if profile not in get_databases(args.directory):
+        raise ValueError(f"There is no profile \"{profile}\".")
+    db = get_db(profile + ".db", args.directory)
+
+    if args.command == "checkoff":
+        results = []
+        for task in args.tasks:
+            if args.date is None:
+                result = check_off_task_today(db, task)
+                results.append({"task": task, "periodicity": result.periodicity, "checked_off": result.checked_off})
+            else:
+                check_off_task(db, task, args.date, None, args.time)
+                results.append({"task": task, "date": args.date, "checked_off": True})
+        return {"profile": profile, "check_offs": results}
+
+    elif args.command == "report":
+        streaks = get_all_streaks(db)
+        habits = [{"task": x.task, "periodicity": x.periodicity, "creation_date": str(x.creation_date),
+                   "last_streak": streaks[x.task][0], "longest_streak": streaks[x.task][1]}
+                  for x in load_habits(db, args.periodicity) if not args.tasks or x.task in args.tasks]
+        longest_streak, habits_with_longest_streak = get_overall_longest_streak(db)
+        return {"profile": profile, "habits": habits,
+                "longest_streak": {"streak": longest_streak, "habits": habits_with_longest_streak}}
+
+    elif args.command == "window":
+        end = args.end or str(date.today())
+        habits = []
+        for task, index in get_period_indices(db).items():
+            if args.tasks and task not in args.tasks:
+                continue
+            habit = {"task": task, "periodicity": index.periodicity,
+                     "check_offs": index.count_check_offs(args.start, end),
+                     "completion_rate": index.get_completion_rate(args.start, end),
+                     "longest_streak": index.get_longest_streak(args.start, end),
+                     "streak_at_end": index.get_streak_at(end),
+                     "rolling_consistency": index.get_rolling_consistency(end, args.rolling)}
+            if args.by:
+                habit[f"completion_rate_by_{args.by}"] = [
+                    {"start": str(x), "completion_rate": y} for x, y in index.get_completion_rates(args.start, end,
+                                                                                                  args.by)]
+            habits.append(habit)
+        return {"profile": profile, "start": args.start, "end": end, "habits": habits}
+
+    elif args.command == "import":
+        return {"profile": profile, "imported": import_tracking_data(db, args.file)}
+
+    elif args.command == "export":
+        return {"profile": profile, "exported": export_tracking_data(db, args.file, args.task, args.start, args.end)}
+
+
+def parse_args(parser, argv):
+    """
+    Parse the arguments of a single command, including the checks across options that argparse does not cover.
+
+    param parser: argument parser of build_parser()
+    param argv: command line arguments
+    return: parsed arguments
+    """
+    args = parser.parse_args(argv)
+    if args.command == "checkoff" and args.time is not None and args.date is None:
+        parser.error("--time can only be used together with --date")
+    return args
+
+
+def run_batch(parser, lines):
+    """
+    Run many commands in one process, so that process startup and profile connections are shared.
+    Empty lines and lines starting with "#" are skipped. A failing command does not stop the batch.
+
+    param parser: argument parser of build_parser()
+    param lines: command lines
+    return: list of results (or {"error": message}) of all commands
+    """
+    results = []
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            args = parse_args(parser, shlex.split(line))
+            if args.command == "batch":
+                raise ValueError("Batches can not be nested.")
+            results.append(run_command(args))
+        except SystemExit:
+            results.append({"error": f"Invalid command: {line.strip()}"})
+        except (OSError, KeyError, ValueError, sqlite3.DatabaseError) as error:
+            results.append({"error": str(error)})
+    return results
+
+
+def main(argv=None):
+    """
+    Run the non-interactive command line interface and print the result as JSON.
+
+    param argv: command line arguments (None -> sys.argv[1:])
+    return: exit code (0 -> success, 1 -> at least one command failed)
+    """
+    import instrumentation
+    parser = build_parser()
+    args = parse_args(parser, argv)
+    if args.instrument:
+        instrumentation.enable()
+    else:
+        instrumentation.enable_if_configured()
+    try:
+        if args.command == "batch":
+            if args.file == "-":
+                result = run_batch(parser, sys.stdin)
+            else:
+                with open(args.file) as infile:
+                    result = run_batch(parser, infile.readlines())
+            failed = any("error" in x for x in result)
+        else:
+            result = run_command(args)
+            failed = False
+    except (OSError, KeyError, ValueError, sqlite3.DatabaseError) as error:
+        result = {"error": str(error)}
+        failed = True
+    finally:
+        close_all_dbs()
+        if args.instrument:
+            instrumentation.print_report()
+            instrumentation.disable()
+    print(json.dumps(result))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
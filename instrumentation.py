@@ -0,0 +1,316 @@
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt-in instrumentation of the db and analysis modules: per function the calls, the wall time, the executed SQL
+# statements and the fetched rows, per SQL statement the number of executions and per habit task the time spent in
+# calls for that habit. It is enabled with the environment variable HABTRACK_INSTRUMENTATION=1, with
+# "instrumentation": true in config.json or with enable().
+
+ENVIRONMENT_VARIABLE = "HABTRACK_INSTRUMENTATION"
+INSTRUMENTED_MODULES = ("db", "analysis")
+
+# function name -> [calls, seconds, statements, rows]; statements and rows are counted for the innermost
+# instrumented function, seconds include the time of nested instrumented calls
+function_stats = {}
+# SQL statement -> number of executions
+statement_counts = Counter()
+# habit task -> [calls, seconds] of the instrumented calls with a "task" argument
+task_stats = {}
+stats_lock = threading.Lock()
+# stack of the instrumented functions running in the current thread
+local = threading.local()
+# module name -> {function name: original function} of the instrumented modules
+original_functions = {}
+
+
+def current_function():
+    """
+    Return the innermost instrumented function running in the current thread.
+
+    return: function name (None outside of instrumented functions)
+    """
+    stack = local.__dict__.get("stack")
+    return stack[-1] if stack else None
+
+
+def record_statement(statement):
+    """
+    Trace callback of instrumented connections (see sqlite3.Connection.set_trace_callback): count an executed SQL
+    statement.
+
+    param statement: SQL statement
+    return:
+    """
+    name = current_function()
+    statement = " ".join(statement.split())
+    with stats_lock:
+        statement_counts[statement] += 1
+        if name is not None:
+            function_stats[name][2] += 1
+
+
+def record_rows(number_of_rows):
+    """
+    Count fetched rows.
+
+    param number_of_rows: number of fetched rows
+    return:
+    """
+    name = current_function()
+    if name is not None and number_of_rows:
+        with stats_lock:
+            function_stats[name][3] += number_of_rows
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that counts the rows it fetches.
+    """
+
+    def fetchone(self):
+        row = super().fetchone()
+        record_rows(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        record_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        record_rows(1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection that counts its executed statements (with a trace callback) and opens InstrumentedCursors.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(record_statement)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+def instrument(function, name):
+    """
+    Wrap a function so that its calls and wall time are recorded under the given name.
+
+    param function: function to instrument
+    param name: name of the function in the report
+    return: instrumented function
+    """
+    parameters = list(inspect.signature(function).parameters)
+    task_index = parameters.index("task") if "task" in parameters else None
+
+    def record_call(seconds, args, kwargs, calls=1):
+        task = kwargs.get("task", args[task_index] if task_index is not None and len(args) > task_index else None)
+        with stats_lock:
+            function_stats[name][0] += calls
+            function_stats[name][1] += seconds
+            if isinstance(task, str):
+                stats = task_stats.setdefault(task, [0, 0.0])
+                stats[0] += calls
+                stats[1] += seconds
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # the time between two items is spent by the caller, so only the steps of the generator are recorded
+            generator = function(*args, **kwargs)
+            stack = local.__dict__.setdefault("stack", [])
+            calls = 1
+            while True:
+                stack.append(name)
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    stack.pop()
+                    record_call(time.perf_counter() - start, args, kwargs, calls)
+                    calls = 0
+                yield item
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = local.__dict__.setdefault("stack", [])
+            stack.append(name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stack.pop()
+                record_call(time.perf_counter() - start, args, kwargs)
+    return wrapper
+
+
+def is_enabled():
+    """
+    Return whether the instrumentation is enabled.
+
+    return: True if the instrumentation is enabled
+    """
+    return bool(original_functions)
+
+
+def enable():
+    """
+    Instrument all functions of the db and analysis modules. References to them that other HabTrack modules have
+    imported are replaced as well, and cached connections are closed, so that all connections opened from now on
+    are instrumented.
+
+    return:
+    """
+    import importlib
+    if is_enabled():
+        return
+    modules = [importlib.import_module(x) for x in INSTRUMENTED_MODULES]
+    modules[0].close_all_dbs()
+    modules[0].connection_factory = InstrumentedConnection
+    replacements = {}
+    for module in modules:
+        original_functions[module.__name__] = {}
+        for name, function in list(vars(module).items()):
+            if inspect.isfunction(function) and function.__module__ == module.__name__:
+                original_functions[module.__name__][name] = function
+                function_stats.setdefault(f"{module.__name__}.{name}", [0, 0, 0, 0])
+                replacements[function] = instrument(function, f"{module.__name__}.{name}")
+    replace_references(replacements)
+
+
+def disable():
+    """
+    Restore the original functions of the db and analysis modules. The recorded statistics are kept.
+
+    return:
+    """
+    import db
+    if not is_enabled():
+        return
+    replacements = {}
+    for module_name, functions in original_functions.items():
+        module = sys.modules[module_name]
+        for name, function in functions.items():
+            replacements[getattr(module, name)] = function
+    replace_references(replacements)
+    db.close_all_dbs()
+    db.connection_factory = sqlite3.Connection
+    original_functions.clear()
+
+
+def replace_references(replacements):
+    """
+    Replace functions in the namespaces of all loaded HabTrack modules.
+
+    param replacements: dictionary old function -> new function
+    return:
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in list(sys.modules.values()):
+        if os.path.dirname(os.path.abspath(getattr(module, "__file__", None) or "/")) != directory:
+            continue
+        for name, value in list(vars(module).items()):
+            if inspect.isfunction(value) and value in replacements:
+                setattr(module, name, replacements[value])
+
+
+def reset():
+    """
+    Discard all recorded statistics.
+
+    return:
+    """
+    with stats_lock:
+        for x in function_stats.values():
+            x[:] = [0, 0, 0, 0]
+        statement_counts.clear()
+        task_stats.clear()
+
+
+def get_report():
+    """
+    Return the recorded statistics.
+
+    return: dictionary with "functions" (name -> calls, seconds, statements, rows), "statements" (SQL statement ->
+    executions) and "tasks" (habit task -> calls, seconds), each sorted in descending order
+    """
+    with stats_lock:
+        functions = sorted(((x, *y) for x, y in function_stats.items() if y[0]), key=lambda x: -x[2])
+        return {"functions": {x[0]: dict(zip(("calls", "seconds", "statements", "rows"), x[1:])) for x in functions},
+                "statements": dict(statement_counts.most_common()),
+                "tasks": {x: {"calls": y[0], "seconds": y[1]}
+                          for x, y in sorted(task_stats.items(), key=lambda x: -x[1][1])}}
+
+
+def format_report(limit=15):
+    """
+    Format the recorded statistics as text. A high number of statements per call, or a statement with as many
+    executions as there are habits or check-offs, points to an N+1 query pattern.
+
+    param limit: maximum number of rows per section
+    return: report text
+    """
+    report = get_report()
+    lines = ["HabTrack instrumentation report", "",
+             f"{'function':<45} {'calls':>8} {'total ms':>11} {'mean ms':>9} {'SQL':>8} {'SQL/call':>9} "
+             f"{'rows':>9}"]
+    for name, x in list(report["functions"].items())[:limit]:
+        lines.append(f"{name:<45} {x['calls']:>8} {x['seconds'] * 1000:>11.3f} "
+                     f"{x['seconds'] * 1000 / x['calls']:>9.3f} {x['statements']:>8} "
+                     f"{x['statements'] / x['calls']:>9.1f} {x['rows']:>9}")
+    lines += ["", f"{'executions':>10}  most executed SQL statements"]
+    for statement, count in list(report["statements"].items())[:limit]:
+        lines.append(f"{count:>10}  {statement[:100]}")
+    lines += ["", f"{'calls':>10} {'total ms':>11}  slowest habits"]
+    for task, x in list(report["tasks"].items())[:limit]:
+        lines.append(f"{x['calls']:>10} {x['seconds'] * 1000:>11.3f}  {task}")
+    return "\n".join(lines)
+
+
+def print_report(file=None):
+    """
+    Print the report of format_report() to stderr (or to the given file).
+
+    param file: file object to print to (None -> sys.stderr)
+    return:
+    """
+    print(format_report(), file=file or sys.stderr)
+
+
+def enable_if_configured(config_file="config.json", report_at_exit=True):
+    """
+    Enable the instrumentation if the environment variable HABTRACK_INSTRUMENTATION is set (to anything but "0")
+    or if the config file holds "instrumentation": true.
+
+    param config_file: path of the config file
+    param report_at_exit: print the report to stderr when the interpreter exits
+    return: True if the instrumentation has been enabled
+    """
+    enabled = os.environ.get(ENVIRONMENT_VARIABLE, "0") not in ("", "0")
+    if not enabled and os.path.exists(config_file):
+        with open(config_file) as infile:
+            enabled = bool(json.load(infile).get("instrumentation"))
+    if enabled and not is_enabled():
+        enable()
+        if report_at_exit:
+            import atexit
+            atexit.register(print_report)
+    return enabled
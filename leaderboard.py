@@ -0,0 +1,240 @@
+import json
+import os
+from datetime import date
+from db import connect, get_databases, get_profile_path, get_readonly_db, is_consolidated, get_habit_summaries, \
+    get_store_habit_summaries, STORE_FILE
+from analysis import get_profile_signature
+from bitset import count_periods
+
+# Persisted leaderboard index of a profile directory (a SQLite file next to the profiles), which answers top-K
+# queries over the habits and profiles of the directory without opening the profiles. It holds one row per habit,
+# keyed by profile and habit task, with the streaks and the number of checked-off periods of the habit, and one row
+# per profile with the signature of the profile data (see analysis.get_profile_signature) from its last analysis.
+# Only profiles whose signature changed are analyzed again and rewritten in the index.
+LEADERBOARD_INDEX_FILE = "leaderboard_index.sqlite"
+LEADERBOARD_INDEX_VERSION = 1
+# "longest_streak" -> longest run streak
+# "current_streak" -> last run streak, if it is still running (checked-off in the current or the previous period)
+# "completion_rate" -> share of the periods since the creation of a habit in which it has been checked-off
+LEADERBOARD_METRICS = ("longest_streak", "current_streak", "completion_rate")
+
+
+def open_leaderboard_index(directory="habit profiles"):
+    """
+    Open the leaderboard index of a profile directory. The tables are created (or recreated, if the index has been
+    written by another version) on first use.
+
+    param directory: directory of the profiles
+    return: sqlite3 database connection of the index
+    """
+    index = connect(get_profile_path(LEADERBOARD_INDEX_FILE, directory), timeout=30)
+    index.execute("PRAGMA journal_mode = WAL;")
+    if index.execute("PRAGMA user_version").fetchone()[0] != LEADERBOARD_INDEX_VERSION:
+        index.executescript(f"""
+            DROP TABLE IF EXISTS profile;
+            DROP TABLE IF EXISTS entry;
+            CREATE TABLE profile (
+                name TEXT PRIMARY KEY,
+                signature TEXT,
+                longest_streak INTEGER);
+            CREATE INDEX profile_longest_streak ON profile (longest_streak DESC, name);
+            CREATE TABLE entry (
+                profile TEXT,
+                task TEXT,
+                periodicity TEXT,
+                longest_streak INTEGER,
+                last_streak INTEGER,
+                last_period INTEGER,
+                current_until INTEGER,
+                check_offs INTEGER,
+                first_period INTEGER,
+                PRIMARY KEY (profile, task));
+            CREATE INDEX entry_longest_streak ON entry (longest_streak DESC, profile, task);
+            CREATE INDEX entry_last_streak ON entry (last_streak DESC, profile, task);
+            PRAGMA user_version = {LEADERBOARD_INDEX_VERSION};""")
+    return index
+
+
+def get_entry(summary):
+    """
+    Convert the summary of a habit (see db.get_habit_summaries) into its row of the leaderboard index.
+
+    param summary: habit summary
+    return: (task, periodicity, longest run streak, last run streak, last checked-off period, last day ordinal on
+    which the last run streak is current, number of checked-off periods, first period) tuple
+    """
+    task, periodicity, last_streak, longest_streak, last_period, first_period, bits = summary
+    # the last run streak is current until the end of the period after the last checked-off period
+    if last_period is None:
+        current_until = None
+    elif periodicity == "weekly":
+        current_until = (last_period + 2) * 7
+    else:
+        current_until = last_period + 1
+    return (task, periodicity, longest_streak, last_streak, last_period, current_until,
+            count_periods(bits, first_period), first_period)
+
+
+def get_profile_entries(db_file, directory="habit profiles"):
+    """
+    Return the rows of the leaderboard index for the habits of a single profile. The profile is opened read-only.
+
+    param db_file: name of the profile (without ".db")
+    param directory: directory of the profile
+    return: list of index rows (see get_entry)
+    """
+    db = get_readonly_db(db_file + ".db", directory)
+    try:
+        return [get_entry(x) for x in get_habit_summaries(db)]
+    finally:
+        db.close()
+
+
+def update_leaderboard_index(directory="habit profiles", workers=None):
+    """
+    Bring the leaderboard index of a profile directory up to date. With one file per profile, only the profiles
+    whose files changed since their last analysis are analyzed again, in parallel. In a consolidated store, the
+    stored statistics of all habits are read with one query whenever the store changed, and only the profiles whose
+    rows differ are rewritten.
+
+    param directory: directory of the profiles
+    param workers: maximum number of worker threads (None -> default of concurrent.futures)
+    return: names of the profiles that have been added, updated or removed
+    """
+    index = open_leaderboard_index(directory)
+    try:
+        stored = dict(index.execute("SELECT name, signature FROM profile"))
+        if is_consolidated(directory):
+            signature = json.dumps(["store", *get_profile_signature(get_profile_path(STORE_FILE, directory))])
+            if stored and all(x == signature for x in stored.values()):
+                return []
+            entries = {x: [get_entry(y) for y in summaries]
+                       for x, summaries in get_store_habit_summaries(directory).items()}
+            signatures = dict.fromkeys(entries, signature)
+            indexed = {x: [] for x in stored}
+            for x in index.execute("SELECT * FROM entry ORDER BY profile, task"):
+                indexed[x[0]].append(tuple(x[1:]))
+            changed = [x for x in entries if x not in stored or indexed[x] != entries[x]]
+        else:
+            profiles = get_databases(directory)
+            signatures = {x: json.dumps(get_profile_signature(os.path.abspath(get_profile_path(x + ".db", directory))))
+                          for x in profiles}
+            changed = [x for x in profiles if stored.get(x) != signatures[x]]
+            entries = {}
+            if changed:
+                from concurrent.futures import ThreadPoolExecutor
+                from itertools import repeat
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    entries = dict(zip(changed, pool.map(get_profile_entries, changed,
+                                                         repeat(directory, len(changed)))))
+        removed = [x for x in stored if x not in signatures]
+
+        with index:
+            for x in removed + changed:
+                index.execute("DELETE FROM entry WHERE profile=?", (x,))
+                index.execute("DELETE FROM profile WHERE name=?", (x,))
+            for x in changed:
+                index.executemany("INSERT INTO entry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  [(x, *y) for y in entries[x]])
+                index.execute("INSERT INTO profile VALUES (?, ?, ?)",
+                              (x, signatures[x], max((y[2] for y in entries[x]), default=0)))
+            # unchanged profiles of a changed store
+            index.executemany("UPDATE profile SET signature=? WHERE name=? AND signature<>?",
+                              [(y, x, y) for x, y in signatures.items() if x not in changed])
+    finally:
+        index.close()
+    return sorted(changed + removed)
+
+
+def get_period_sql(day):
+    """
+    Return the SQL expression of the period ordinal of a day for the habit of an index row (see db.get_period).
+
+    param day: SQL expression of the day ordinal
+    return: SQL expression
+    """
+    return f"(CASE WHEN periodicity = 'weekly' THEN ({day} - 1) / 7 ELSE {day} END)"
+
+
+# SQL expressions of the metrics of an index row, :today being the day ordinal of the current day
+CURRENT_STREAK_SQL = "(CASE WHEN current_until >= :today THEN last_streak ELSE 0 END)"
+COMPLETION_RATE_SQL = (f"(CAST(check_offs AS REAL) / MAX(MAX({get_period_sql(':today')}, "
+                       f"COALESCE(last_period, {get_period_sql(':today')})) "
+                       f"- COALESCE(first_period, {get_period_sql(':today')}) + 1, 1))")
+
+
+def get_top_habits(directory="habit profiles", metric="longest_streak", k=10, today=None, update=True):
+    """
+    Return the top k habits over all profiles of a directory, ranked by the given metric (ties are ordered by
+    profile and habit task). Habits without a current run streak are not ranked by "current_streak".
+
+    param directory: directory of the profiles
+    param metric: one of LEADERBOARD_METRICS
+    param k: number of habits
+    param today: date (or "YYYY-MM-DD") of the current and completion rate metrics (None -> today)
+    param update: bring the leaderboard index up to date first (see update_leaderboard_index)
+    return: list of dictionaries with "profile", "task", "periodicity" and the metric
+    """
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"Unknown metric \"{metric}\". Choose one of {LEADERBOARD_METRICS}.")
+    if update:
+        update_leaderboard_index(directory)
+    parameters = {"today": get_today(today), "k": k}
+    if metric == "longest_streak":
+        sql = """SELECT profile, task, periodicity, longest_streak FROM entry
+            ORDER BY longest_streak DESC, profile, task LIMIT :k"""
+    elif metric == "current_streak":
+        sql = """SELECT profile, task, periodicity, last_streak FROM entry
+            WHERE current_until >= :today AND last_streak > 0 ORDER BY last_streak DESC, profile, task LIMIT :k"""
+    else:
+        sql = f"""SELECT profile, task, periodicity, {COMPLETION_RATE_SQL} AS completion_rate FROM entry
+            ORDER BY completion_rate DESC, profile, task LIMIT :k"""
+    index = open_leaderboard_index(directory)
+    try:
+        rows = index.execute(sql, parameters).fetchall()
+    finally:
+        index.close()
+    return [{"profile": x[0], "task": x[1], "periodicity": x[2], metric: x[3]} for x in rows]
+
+
+def get_top_profiles(directory="habit profiles", metric="longest_streak", k=10, today=None, update=True):
+    """
+    Return the top k profiles of a directory, ranked by the given metric over their habits: the longest of the longest
+    or current run streaks, or the mean completion rate of the habits (ties are ordered by profile name). Profiles
+    without habits are only ranked by "longest_streak".
+
+    param directory: directory of the profiles
+    param metric: one of LEADERBOARD_METRICS
+    param k: number of profiles
+    param today: date (or "YYYY-MM-DD") of the current and completion rate metrics (None -> today)
+    param update: bring the leaderboard index up to date first (see update_leaderboard_index)
+    return: list of dictionaries with "profile" and the metric
+    """
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"Unknown metric \"{metric}\". Choose one of {LEADERBOARD_METRICS}.")
+    if update:
+        update_leaderboard_index(directory)
+    parameters = {"today": get_today(today), "k": k}
+    if metric == "longest_streak":
+        sql = "SELECT name, longest_streak FROM profile ORDER BY longest_streak DESC, name LIMIT :k"
+    else:
+        value = f"MAX({CURRENT_STREAK_SQL})" if metric == "current_streak" else f"AVG({COMPLETION_RATE_SQL})"
+        sql = f"SELECT profile, {value} AS value FROM entry GROUP BY profile ORDER BY value DESC, profile LIMIT :k"
+    index = open_leaderboard_index(directory)
+    try:
+        rows = index.execute(sql, parameters).fetchall()
+    finally:
+        index.close()
+    return [{"profile": x[0], metric: x[1]} for x in rows]
+
+
+def get_today(today=None):
+    """
+    Return the day ordinal of the given date.
+
+    param today: date or "YYYY-MM-DD" (None -> today)
+    return: day ordinal
+    """
+    if today is None:
+        today = date.today()
+    return today.toordinal() if isinstance(today, date) else date.fromisoformat(today).toordinal()
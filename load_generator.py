@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import quote
+
+
+async def request(reader, writer, method, path, payload=None):
+    """
+    Send an HTTP/1.1 request over a keep-alive connection and read the JSON response.
+
+    param reader: asyncio.StreamReader of the connection
+    param writer: asyncio.StreamWriter of the connection
+    param method: HTTP method
+    param path: request path
+    param payload: JSON-serializable request body (None -> no body)
+    return: HTTP status and decoded response
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers.get("content-length", 0))))
+
+
+async def run_client(host, port, profile, tasks, n_requests, write_ratio, rng, latencies):
+    """
+    Send a mix of read and write requests from one client over one keep-alive connection.
+
+    param host: host of the server
+    param port: port of the server
+    param profile: profile to send the requests to
+    param tasks: habit tasks of the profile
+    param n_requests: number of requests
+    param write_ratio: share of check-off requests (0 -> only reads, 1 -> only writes)
+    param rng: random.Random instance
+    param latencies: list to append the request latencies (in s) to
+    return: number of failed requests
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    failed = 0
+    try:
+        for _ in range(n_requests):
+            task = quote(rng.choice(tasks), safe="")
+            if rng.random() < write_ratio:
+                method, path = "POST", f"/profiles/{profile}/habits/{task}/checkoffs"
+                payload = {"date": f"{rng.randint(2000, 2022)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}",
+                           "time": "12:00:00"}
+            else:
+                method, path = "GET", rng.choice([f"/profiles/{profile}/habits", f"/profiles/{profile}/streaks"])
+                payload = None
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, payload)
+            latencies.append(time.perf_counter() - start)
+            failed += status >= 400
+    finally:
+        writer.close()
+    return failed
+
+
+async def generate_load(host="127.0.0.1", port=8080, profiles=None, clients=50, n_requests=100, write_ratio=0.2,
+                        seed=0):
+    """
+    Run concurrent clients against a running HabTrack API and report throughput and latency percentiles.
+
+    param host: host of the server
+    param port: port of the server
+    param profiles: profiles to spread the clients over (None -> all profiles of the server)
+    param clients: number of concurrent clients
+    param n_requests: number of requests per client
+    param write_ratio: share of check-off requests
+    param seed: seed of the random number generator
+    return: dictionary with throughput (requests/s) and p50/p95/p99 latencies (ms)
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        if profiles is None:
+            profiles = (await request(reader, writer, "GET", "/profiles"))[1]
+        tasks = {x: [y["task"] for y in (await request(reader, writer, "GET", f"/profiles/{quote(x)}/habits"))[1]]
+                 for x in profiles}
+    finally:
+        writer.close()
+    profiles = [x for x in profiles if tasks[x]]
+
+    latencies = []
+    start = time.perf_counter()
+    failed = await asyncio.gather(*[run_client(host, port, quote(profiles[i % len(profiles)]),
+                                               tasks[profiles[i % len(profiles)]], n_requests, write_ratio,
+                                               random.Random(rng.random()), latencies) for i in range(clients)])
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+    return {"requests": len(latencies), "failed": sum(failed), "throughput": round(len(latencies) / duration, 1),
+            "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load generator for the HabTrack HTTP/JSON API (server.py).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--profile", action="append", dest="profiles", help="profile to load (default: all)")
+    parser.add_argument("--clients", type=int, default=50, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="number of requests per client")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of check-off requests")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    print(json.dumps(asyncio.run(generate_load(arguments.host, arguments.port, arguments.profiles, arguments.clients,
+                                               arguments.requests, arguments.write_ratio, arguments.seed))))
@@ -1,12 +1,10 @@
-import sqlite3
-from habit import DBHabit
-from db import get_db, get_db_name, get_databases, get_habit_tasks, get_creation_date, get_periodicity, \
-    get_tracking_data, create_example_profile
-from analysis import get_overall_longest_streak_all_databases, get_overall_longest_streak, \
-    print_currently_tracked_habits, get_last_and_longest_streak
-from prettytable import PrettyTable
-import questionary
-import json
+import sys
+
+# Only sys is imported at module level: the UI libraries and the habit modules are imported when cli() shows the
+# interactive menus, the non-interactive commands import only what they need (see headless.py).
+
+# number of check-offs shown at once in "Return all tracking data for a given habit"
+TRACKING_DATA_PAGE_SIZE = 50
 
 
 def cli():
@@ -15,11 +13,24 @@ def cli():
 
     return:
     """
+    import sqlite3
+    import json
+    from itertools import islice
+    import questionary
+    from prettytable import PrettyTable
+    import instrumentation
+    # before the habit modules are imported, so that the names imported below are the instrumented functions
+    instrumentation.enable_if_configured()
+    from habit import DBHabit, load_habits
+    from db import get_db, get_databases, iter_tracking_data, create_example_profile, delete_profile, \
+        import_tracking_data, export_tracking_data, verify_habit_stats, close_all_dbs
+    from analysis import get_overall_longest_streak_all_databases, get_overall_longest_streak, \
+        print_currently_tracked_habits, get_last_and_longest_streak
 
     with open("config.json") as outfile:
         config = json.load(outfile)
-    default_db = config["default_profile"] + ".db"
-    db = get_db(default_db)
+    # the connection of the loaded profile is opened on first use (get_db caches it)
+    db_file = config["default_profile"] + ".db"
 
     while True:
 
@@ -29,15 +40,17 @@ def cli():
 
             while True:
 
-                db_name = get_db_name(db)
-                db_name = db_name[0: (len(db_name) - 3)]
+                db = get_db(db_file)
+                db_name = db_file[0: (len(db_file) - 3)]
 
                 choice = questionary.select("Profile: " + db_name, choices=["Create new habit", "Delete habit",
-                                                                            "Check-off task", "Analyze", "EXIT"],
+                                                                            "Check-off task", "Analyze",
+                                                                            "Import tracking data",
+                                                                            "Export tracking data", "EXIT"],
                                             qmark="").ask()
 
                 if choice == "Create new habit":
-                    habit_tasks = get_habit_tasks(db)
+                    habit_tasks = [x.task for x in load_habits(db)]
                     while True:
                         task = questionary.text(("Please enter the habit task (e.g. \"Not using the phone in the "
                                                  "morning\"): ")).ask()
@@ -52,8 +65,8 @@ def cli():
                     print(f"The habit \"{task}\" has been created successfully. Have fun!")
 
                 elif choice == "Delete habit":
-                    habit_tasks = get_habit_tasks(db)
-                    habit_tasks.append("EXIT")
+                    habits = {x.task: x for x in load_habits(db)}
+                    habit_tasks = list(habits) + ["EXIT"]
                     habit_task = questionary.select("Which habit do you want to delete?",
                                                     choices=habit_tasks).ask()
                     if habit_task == "EXIT":
@@ -62,24 +75,29 @@ def cli():
                         confirmation = questionary.confirm(
                             "Do you really want to delete the habit \"" + habit_task + "\"?").ask()
                         if confirmation:
-                            new_habit = DBHabit(habit_task, "no periodicity")
-                            new_habit.delete(db)
-                            # upper two lines could be replaced by: delete_habit(db, habit_task)
+                            habits[habit_task].delete(db)
+                            # upper line could be replaced by: delete_habit(db, habit_task)
                             print(f"The habit \"{habit_task}\" has been deleted.")
                         else:
                             pass
 
                 elif choice == "Check-off task":
-                    habit_tasks = get_habit_tasks(db)
-                    habit_tasks.append("EXIT")
+                    habits = {x.task: x for x in load_habits(db)}
+                    habit_tasks = list(habits) + ["EXIT"]
                     habit_task = questionary.select("Which habit task do you want to check-off?",
                                                     choices=habit_tasks).ask()
                     if habit_task == "EXIT":
                         pass
                     else:
-                        new_habit = DBHabit(habit_task, "no periodicity")
-                        new_habit.check_off(db)
-                        # upper two lines could be replaced by: check_off_task_today(db, habit_task)
+                        check_off_result = habits[habit_task].check_off(db)
+                        # upper line could be replaced by: check_off_task_today(db, habit_task)
+                        period = "today" if check_off_result.periodicity == "daily" else "this week"
+                        if check_off_result.checked_off:
+                            print(f"\"{habit_task}\" has been checked-off for {period}. Good job!")
+                        elif check_off_result.periodicity == "daily":
+                            print("You already checked-off this task today.")
+                        else:
+                            print("You already checked-off this task for this week.")
                         last_streak = get_last_and_longest_streak(db, habit_task)[0]
                         if 3 < last_streak < 10:
                             print("You are on a run streak of " + str(last_streak) + "! Good job, keep going!")
@@ -102,21 +120,30 @@ def cli():
                                                                      "EXIT"], qmark="").ask()
 
                         if analyze_choice == "Return all tracking data for a given habit":
-                            habit_tasks = get_habit_tasks(db)
-                            habit_tasks.append("EXIT")
+                            habits = {x.task: x for x in load_habits(db)}
+                            habit_tasks = list(habits) + ["EXIT"]
                             habit_task = questionary.select("For which habit do you want to see the habit data?",
                                                             choices=habit_tasks).ask()
                             if habit_task == "EXIT":
                                 pass
                             else:
-                                tracking_data = get_tracking_data(db, habit_task)
-                                print("Habit: " + habit_task + " (periodicity: " + get_periodicity(db, habit_task) +
-                                      ", creation date: " + get_creation_date(db, habit_task) + ")")
+                                tracking_data = iter_tracking_data(db, habit_task)
+                                habit = habits[habit_task]
+                                print("Habit: " + habit_task + " (periodicity: " + habit.periodicity +
+                                      ", creation date: " + str(habit.creation_date) + ")")
                                 print("Tracking data: ")
-                                pretty_table = PrettyTable(['Week', 'Date', 'Time'])
-                                for x in tracking_data:
-                                    pretty_table.add_row(x[1:4])
-                                print(pretty_table)
+                                # the tracking data is shown page by page, so long histories show up immediately
+                                page = list(islice(tracking_data, TRACKING_DATA_PAGE_SIZE))
+                                while True:
+                                    pretty_table = PrettyTable(['Week', 'Date', 'Time'])
+                                    for x in page:
+                                        pretty_table.add_row(x[1:4])
+                                    print(pretty_table)
+                                    if len(page) < TRACKING_DATA_PAGE_SIZE:
+                                        break
+                                    page = list(islice(tracking_data, TRACKING_DATA_PAGE_SIZE))
+                                    if not page or not questionary.confirm("Show more tracking data?").ask():
+                                        break
 
                         elif analyze_choice == "Return a list of all currently tracked habits":
                             print_currently_tracked_habits(db, periodicity=None)
@@ -128,8 +155,7 @@ def cli():
                             print_currently_tracked_habits(db, periodicity=period_choice)
 
                         elif analyze_choice == "Return the last run streak for a given habit":
-                            habit_tasks = get_habit_tasks(db)
-                            habit_tasks.append("EXIT")
+                            habit_tasks = [x.task for x in load_habits(db)] + ["EXIT"]
                             habit_task = questionary.select(
                                 "For which habit do you want to get its last run streak?",
                                 choices=habit_tasks).ask()
@@ -138,8 +164,7 @@ def cli():
                                 last_streak))
 
                         elif analyze_choice == "Return the longest run streak for a given habit":
-                            habit_tasks = get_habit_tasks(db)
-                            habit_tasks.append("EXIT")
+                            habit_tasks = [x.task for x in load_habits(db)] + ["EXIT"]
                             habit_task = questionary.select(
                                 "For which habit do you want to get its longest run streak?",
                                 choices=habit_tasks).ask()
@@ -155,8 +180,8 @@ def cli():
                                 print(x)
 
                         elif analyze_choice == "Return the longest run streak of all defined habits over ALL profiles":
-                            longest_streak = get_overall_longest_streak_all_databases()[0]
-                            longest_streak_habits_dbs = get_overall_longest_streak_all_databases()[1]
+                            longest_streak, longest_streak_habits_dbs = \
+                                get_overall_longest_streak_all_databases(use_disk_cache=True)
                             # longest_streak_habits_dbs example:
                             # [[["habit1", "habit2"], "database1.db"], [["habit3"], "database3.db"]]
                             print("The longest run streak of all defined habits over ALL profiles is " +
@@ -171,6 +196,23 @@ def cli():
                         elif analyze_choice == "EXIT":
                             break
 
+                elif choice == "Import tracking data":
+                    file_path = questionary.path("Choose a .csv or .json file with tracking data: ").ask()
+                    try:
+                        number_of_rows = import_tracking_data(db, file_path)
+                        print(f"{number_of_rows} check-offs have been imported.")
+                    except (OSError, KeyError, ValueError, sqlite3.DatabaseError):
+                        print("The file could not be imported. Each record needs at least a \"task\" and a "
+                              "\"date\" (YYYY-MM-DD).")
+
+                elif choice == "Export tracking data":
+                    file_path = questionary.path("Choose a .csv or .ndjson file for the tracking data: ").ask()
+                    try:
+                        number_of_rows = export_tracking_data(db, file_path)
+                        print(f"{number_of_rows} check-offs have been exported.")
+                    except OSError:
+                        print("The tracking data could not be written to the chosen file.")
+
                 elif choice == "EXIT":
                     break
 
@@ -181,7 +223,9 @@ def cli():
                 profile_choice = questionary.select("What do you want to do?",
                                                     choices=["Create new profile", "Delete profile",
                                                              "Load existing profile",
-                                                             "Set default profile", "Create example profile", "EXIT"],
+                                                             "Set default profile", "Create example profile",
+                                                             "Check streak statistics", "Show performance report",
+                                                             "EXIT"],
                                                     qmark="").ask()
 
                 if profile_choice == "Create new profile":
@@ -193,7 +237,8 @@ def cli():
                         else:
                             new_db_ = new_db + ".db"
                             try:
-                                db = get_db(name=new_db_)
+                                get_db(name=new_db_)
+                                db_file = new_db_
                                 print(f"The profile \"{new_db}\" has been created and loaded. "
                                       f"Start your journey by creating some habits for your new profile. Good luck!")
                                 break
@@ -216,8 +261,9 @@ def cli():
                                 "Do you really want to delete the profile \"" + delete_db + "\"?").ask()
                             if confirmation:
                                 delete_db_ = delete_db + ".db"
-                                import os
-                                os.remove("habit profiles\\" + delete_db_)
+                                if delete_db_ == db_file:
+                                    raise PermissionError
+                                delete_profile(delete_db_)
                                 print("The profile \"" + delete_db + "\" has been deleted.")
                         except PermissionError:
                             print(("The profile you are trying to delete is currently in use. "
@@ -232,7 +278,7 @@ def cli():
                         pass
                     else:
                         loaded_db_ = loaded_db + ".db"
-                        db = get_db(name=loaded_db_)
+                        db_file = loaded_db_
                         print(f"The profile \"{loaded_db}\" has been loaded.")
                         break
 
@@ -248,7 +294,7 @@ def cli():
                     if default_db == "EXIT":
                         pass
                     else:
-                        config = {"default_profile": default_db}
+                        config["default_profile"] = default_db
                         with open("config.json", "w") as outfile:
                             json.dump(config, outfile)
                         print(f"The profile \"{default_db}\" has been set as the default profile. It is "
@@ -274,19 +320,46 @@ def cli():
                         try:
                             ex_db_ = ex_db + ".db"
                             create_example_profile(name=ex_db_, chance_of_checkoff=int(chance_of_checkoff))
-                            db = get_db(name=ex_db_)
+                            db_file = ex_db_
                             print(f"The example profile \"{ex_db}\" has been created and loaded.")
                             break
                         except sqlite3.OperationalError:
                             print("The profile name must not contain any special characters. Please try again with "
                                   "a different profile name.")
 
+                elif profile_choice == "Check streak statistics":
+                    db = get_db(db_file)
+                    mismatches = verify_habit_stats(db)
+                    if not mismatches:
+                        print("The stored run streaks of all habits match the tracking data.")
+                    else:
+                        print("The stored run streaks of the following habit(s) do not match the tracking data:")
+                        for x in mismatches:
+                            print(x)
+                        if questionary.confirm("Do you want to rebuild them?").ask():
+                            verify_habit_stats(db, repair=True)
+                            print("The run streaks have been rebuilt.")
+
+                elif profile_choice == "Show performance report":
+                    if instrumentation.is_enabled():
+                        print(instrumentation.format_report())
+                    else:
+                        print(("The instrumentation is disabled. Start HabTrack with the environment variable "
+                               f"{instrumentation.ENVIRONMENT_VARIABLE}=1 or set \"instrumentation\": true in "
+                               "config.json to record the calls, wall time and SQL statements of HabTrack."))
+
                 elif profile_choice == "EXIT":
                     break
 
         elif choice == "EXIT":
+            close_all_dbs()
             break
 
 
 if __name__ == '__main__':
+    # with arguments (e.g. "python main.py checkoff --profile anna Reading") HabTrack runs without the interactive
+    # menus, see headless.py
+    if len(sys.argv) > 1:
+        from headless import main
+        sys.exit(main())
     cli()
@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+from db import get_readonly_db, get_databases, profile_exists, add_habit, delete_habit, check_off_task, \
+    check_off_task_today, iter_tracking_data
+from habit import load_habits
+from write_queue import ProfileWriter
+from analysis import get_all_streaks, get_longest_streak_habits, get_overall_longest_streak_all_databases
+from leaderboard import get_top_habits, get_top_profiles, LEADERBOARD_METRICS
+
+STATUS_TEXTS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                409: "Conflict", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        """
+        Error that is returned to the client as JSON object {"error": message} with the given HTTP status.
+
+        param status: HTTP status code
+        param message: error message
+        """
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class HabTrackServer:
+
+    def __init__(self, directory="habit profiles", workers=8):
+        """
+        HTTP/JSON API for the habit profiles of a directory, for several concurrent users. Requests are handled by
+        an asyncio event loop, the blocking sqlite3 calls run in a bounded thread pool. Every worker thread reuses
+        one read-only connection per profile, writes to a profile are queued to the ProfileWriter of the profile, which
+        commits concurrent writes together.
+
+        param directory: directory of the habit profiles
+        param workers: number of worker threads for sqlite3 calls
+        """
+        self.directory = directory
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="habtrack-db")
+        self.writers = {}
+        self.local = threading.local()
+        self.read_connections = []
+        self.read_connections_lock = threading.Lock()
+
+    async def check_profile(self, profile):
+        """
+        Raise an HTTPError if the given profile does not exist. The profile is looked up in the thread pool, so that
+        the file system and sqlite3 calls do not block the event loop.
+
+        param profile: name of the profile (without ".db")
+        return:
+        """
+        if not profile or "/" in profile or "\\" in profile or profile.startswith("."):
+            raise HTTPError(400, f"Invalid profile name \"{profile}\".")
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(self.executor, profile_exists, profile + ".db", self.directory):
+            raise HTTPError(404, f"There is no profile \"{profile}\".")
+
+    def read_connection(self, profile):
+        """
+        Return the read-only connection of the calling worker thread for the given profile.
+
+        param profile: name of the profile (without ".db")
+        return: read-only sqlite3 database connection
+        """
+        connections = self.local.__dict__.setdefault("connections", {})
+        if profile not in connections:
+            # closed by close() in the main thread, used only by this worker thread until then
+            connections[profile] = get_readonly_db(profile + ".db", self.directory, check_same_thread=False)
+            with self.read_connections_lock:
+                self.read_connections.append(connections[profile])
+        return connections[profile]
+
+    async def read(self, profile, function, *args):
+        """
+        Run function(db, *args) with a read-only connection of the given profile in the thread pool.
+
+        param profile: name of the profile (without ".db")
+        param function: function to run
+        param args: further arguments of the function
+        return: result of the function
+        """
+        await self.check_profile(profile)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: function(self.read_connection(profile), *args))
+
+    async def write(self, profile, function, *args):
+        """
+        Run function(db, *args) in the next batch of the ProfileWriter of the given profile. The function must not
+        commit. Writes to the same profile are serialized, writes to different profiles run concurrently.
+
+        param profile: name of the profile (without ".db")
+        param function: function to run
+        param args: further arguments of the function
+        return: result of the function
+        """
+        await self.check_profile(profile)
+        if profile not in self.writers:
+            self.writers[profile] = ProfileWriter(profile + ".db", self.directory)
+        return await asyncio.wrap_future(self.writers[profile].submit(function, *args))
+
+    async def dispatch(self, method, target, body):
+        """
+        Route a request to its handler.
+
+        param method: HTTP method
+        param target: request target (path and query string)
+        param body: request body
+        return: HTTP status and JSON-serializable response
+        """
+        url = urlsplit(target)
+        parts = [unquote(x) for x in url.path.strip("/").split("/")]
+        query = {x: y[0] for x, y in parse_qs(url.query).items()}
+        data = json.loads(body) if body else {}
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The request body has to be a JSON object.")
+        loop = asyncio.get_running_loop()
+
+        if parts == ["profiles"] and method == "GET":
+            return 200, await loop.run_in_executor(self.executor, get_databases, self.directory)
+
+        elif parts == ["leaderboard"] and method == "GET" and "top" in query:
+            metric = query.get("metric", "longest_streak")
+            if metric not in LEADERBOARD_METRICS or not query["top"].isdigit():
+                raise HTTPError(400, f"\"top\" needs a number and \"metric\" one of {list(LEADERBOARD_METRICS)}.")
+            get_top = get_top_profiles if query.get("by") == "profiles" else get_top_habits
+            return 200, {"metric": metric, "top": await loop.run_in_executor(
+                self.executor, get_top, self.directory, metric, int(query["top"]))}
+
+        elif parts == ["leaderboard"] and method == "GET":
+            longest_streak, holders = await loop.run_in_executor(
+                self.executor, get_overall_longest_streak_all_databases, self.directory)
+            return 200, {"longest_streak": longest_streak,
+                         "holders": [{"profile": x[1], "habits": x[0]} for x in holders]}
+
+        elif len(parts) == 3 and parts[0] == "profiles" and parts[2] == "streaks" and method == "GET":
+            streaks = await self.read(parts[1], get_all_streaks)
+            # derived from the same read, so that a write in between can not make both parts disagree
+            longest_streak, habits = get_longest_streak_habits({x: y[1] for x, y in streaks.items()})
+            return 200, {"habits": {x: {"last_streak": y[0], "longest_streak": y[1]} for x, y in streaks.items()},
+                         "longest_streak": {"streak": longest_streak, "habits": habits}}
+
+        elif len(parts) == 3 and parts[0] == "profiles" and parts[2] == "habits":
+            if method == "GET":
+                return 200, await self.read(parts[1], list_habits, query.get("periodicity"))
+            elif method == "POST":
+                if not data.get("task") or data.get("periodicity") not in ("daily", "weekly"):
+                    raise HTTPError(400, "A habit needs a \"task\" and a \"periodicity\" (\"daily\" or \"weekly\").")
+                return 201, await self.write(parts[1], create_habit, data["task"], data["periodicity"],
+                                             data.get("creation_date"))
+
+        elif len(parts) == 4 and parts[0] == "profiles" and parts[2] == "habits" and method == "DELETE":
+            await self.write(parts[1], remove_habit, parts[3])
+            return 200, {"task": parts[3], "deleted": True}
+
+        elif len(parts) == 5 and parts[0] == "profiles" and parts[2] == "habits" and parts[4] == "checkoffs":
+            if method == "GET":
+                return 200, await self.read(parts[1], list_check_offs, parts[3], query.get("start"),
+                                            query.get("end"))
+            elif method == "POST":
+                return 201, await self.write(parts[1], check_off, parts[3], data.get("date"), data.get("time"))
+
+        else:
+            raise HTTPError(404, f"Unknown resource \"{url.path}\".")
+        raise HTTPError(405, f"Method {method} is not allowed for \"{url.path}\".")
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the HTTP/1.1 requests of a client connection (with keep-alive).
+
+        param reader: asyncio.StreamReader of the connection
+        param writer: asyncio.StreamWriter of the connection
+        return:
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {"error": error.message}
+                except (ValueError, KeyError) as error:
+                    status, payload = 400, {"error": str(error)}
+                except Exception as error:
+                    status, payload = 500, {"error": repr(error)}
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode()
+                writer.write((f"HTTP/1.1 {status} {STATUS_TEXTS[status]}\r\n"
+                              "Content-Type: application/json\r\n"
+                              f"Content-Length: {len(data)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """
+        Start listening for client connections.
+
+        param host: host to listen on
+        param port: port to listen on (0 -> any free port)
+        return: asyncio.Server
+        """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        """
+        Shut down the thread pool and the profile writers and close all connections.
+
+        return:
+        """
+        self.executor.shutdown(wait=True)
+        for x in self.writers.values():
+            x.close()
+        for x in self.read_connections:
+            x.close()
+        self.writers.clear()
+        self.read_connections.clear()
+
+
+def list_habits(db, periodicity=None):
+    """
+    Return all habits of a profile together with their run streaks.
+
+    param db: an initialized sqlite3 database connection
+    param periodicity: periodicity of the habits (None -> all habits)
+    return: list of habit dictionaries
+    """
+    streaks = get_all_streaks(db)
+    return [{"task": x.task, "periodicity": x.periodicity, "creation_date": str(x.creation_date),
+             "last_streak": streaks[x.task][0], "longest_streak": streaks[x.task][1]}
+            for x in load_habits(db, periodicity)]
+
+
+def create_habit(db, task, periodicity, creation_date=None):
+    """
+    Create a new habit (within the batch transaction of a ProfileWriter).
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param periodicity: habit periodicity
+    param creation_date: habit creation date (None -> today)
+    return: habit dictionary
+    """
+    from datetime import date
+    if db.execute("SELECT 1 FROM habit WHERE task=?", (task,)).fetchone():
+        raise HTTPError(409, f"The habit \"{task}\" already exists.")
+    creation_date = creation_date or str(date.today())
+    add_habit(db, task, periodicity, creation_date, commit=False)
+    return {"task": task, "periodicity": periodicity, "creation_date": creation_date}
+
+
+def remove_habit(db, task):
+    """
+    Delete a habit together with its tracking data (within the batch transaction of a ProfileWriter).
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    return:
+    """
+    if not db.execute("SELECT 1 FROM habit WHERE task=?", (task,)).fetchone():
+        raise HTTPError(404, f"There is no habit \"{task}\".")
+    delete_habit(db, task, commit=False)
+
+
+def check_off(db, task, check_off_date=None, check_off_time=None):
+    """
+    Check-off a habit task, either for the current period (at most once) or for the given date (within the batch
+    transaction of a ProfileWriter).
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param check_off_date: check-off date (None -> today, if not checked-off in the current period yet)
+    param check_off_time: check-off time (only used together with check_off_date)
+    return: check-off dictionary
+    """
+    try:
+        if check_off_date is None:
+            result = check_off_task_today(db, task, commit=False)
+            return {"task": task, "periodicity": result.periodicity, "checked_off": result.checked_off}
+        check_off_task(db, task, check_off_date, None, check_off_time, commit=False)
+        return {"task": task, "date": check_off_date, "checked_off": True}
+    except sqlite3.IntegrityError:
+        raise HTTPError(404, f"There is no habit \"{task}\".")
+
+
+def list_check_offs(db, task, start_date=None, end_date=None):
+    """
+    Return the check-offs of a habit task, optionally within a date range.
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task
+    param start_date: first check-off date (None -> no lower bound)
+    param end_date: last check-off date (None -> no upper bound)
+    return: list of check-off dictionaries
+    """
+    return [{"week": x[1], "date": x[2], "time": x[3]} for x in iter_tracking_data(db, task, start_date, end_date)]
+
+
+async def serve(host="127.0.0.1", port=8080, directory="habit profiles", workers=8):
+    """
+    Run the HabTrack HTTP API until it is interrupted.
+
+    param host: host to listen on
+    param port: port to listen on
+    param directory: directory of the habit profiles
+    param workers: number of worker threads for sqlite3 calls
+    return:
+    """
+    server = HabTrackServer(directory, workers)
+    try:
+        listener = await server.start(host, port)
+        print(f"HabTrack API listening on http://{host}:{port}")
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the HabTrack habit profiles.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--directory", default="habit profiles", help="directory of the habit profiles")
+    parser.add_argument("--workers", type=int, default=8, help="number of worker threads for sqlite3 calls")
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.directory, arguments.workers))
+    except KeyboardInterrupt:
+        pass
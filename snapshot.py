@@ -0,0 +1,324 @@
+import json
+import mmap
+import os
+import sys
+import threading
+from array import array
+from datetime import time
+from db import get_db_name, advance_streaks
+from analysis import get_profile_signature, import_numpy, calculate_streaks_numpy
+
+# A snapshot holds the tracking data of a profile as packed 32-bit integer arrays, so that the analytics can run on
+# a memory-mapped file without reading and parsing the TEXT columns of the tracking table. Layout of a snapshot file:
+# SNAPSHOT_MAGIC, the length of the JSON header (4 bytes, little endian), the JSON header, padding to a multiple of
+# 8 bytes and the arrays "habit_ids", "days" (day ordinals), "seconds" (seconds of the day, -1 for check-offs without
+# time, which older versions stored) and "offsets". The check-offs are sorted by habit, day and time, so the
+# check-offs of habit i are days[offsets[i]:offsets[i + 1]]. The habits (task, periodicity, creation date) are
+# listed in the header, sorted by task, the index of a habit in this list is its habit id.
+SNAPSHOT_MAGIC = b"HABSNAP1"
+SNAPSHOT_SUFFIX = ".snapshot"
+ARRAYS = ("habit_ids", "days", "seconds", "offsets")
+
+
+def get_snapshot_path(db):
+    """
+    Return the path of the snapshot of a profile: "<profile>.snapshot" in the directory of the profile.
+
+    param db: an initialized sqlite3 database connection
+    return: path of the snapshot file
+    """
+    source = db.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.join(os.path.dirname(source), get_db_name(db)[:-3] + SNAPSHOT_SUFFIX)
+
+
+def get_source_signature(db):
+    """
+    Return the signature (modification time and size) of the database file of a connection and of its write-ahead
+    log. A snapshot is only checked for new check-offs if this signature changed.
+
+    param db: an initialized sqlite3 database connection
+    return: list of modification times (in ns) and sizes
+    """
+    return get_profile_signature(db.execute("PRAGMA database_list").fetchone()[2])
+
+
+def get_seconds(check_off_time):
+    """
+    Return the seconds of the day of a check-off time.
+
+    param check_off_time: check-off time ("HH:MM:SS") or None
+    return: seconds of the day (-1 if the time is missing)
+    """
+    if not check_off_time:
+        return -1
+    parsed = time.fromisoformat(check_off_time)
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def read_check_offs(db, after_rowid=0):
+    """
+    Read the check-offs added after the given rowid, sorted by habit, day and time.
+
+    param db: an initialized sqlite3 database connection
+    param after_rowid: only check-offs with a greater rowid are read
+    return: dictionary habit task -> list of (day ordinal, seconds of the day), highest rowid read
+    """
+    check_offs = {}
+    last_rowid = after_rowid
+    cur = db.cursor()
+    cur.execute("SELECT rowid, habitTask, day, time FROM tracking WHERE rowid > ? ORDER BY habitTask, day, time",
+                (after_rowid,))
+    for rowid, task, day, check_off_time in cur:
+        check_offs.setdefault(task, []).append((day, get_seconds(check_off_time)))
+        last_rowid = max(last_rowid, rowid)
+    return check_offs, last_rowid
+
+
+def write_snapshot(path, header, arrays):
+    """
+    Write a snapshot file. The file is written next to its final path and then renamed, so readers never see a
+    partially written snapshot.
+
+    param path: path of the snapshot file
+    param header: JSON-serializable header
+    param arrays: dictionary array name (see ARRAYS) -> array("i")
+    return:
+    """
+    header = json.dumps({**header, "byteorder": sys.byteorder, "lengths": {x: len(arrays[x]) for x in ARRAYS}})
+    header = header.encode()
+    padding = -(len(SNAPSHOT_MAGIC) + 4 + len(header)) % 8
+    with open(path + ".tmp", "wb") as outfile:
+        outfile.write(SNAPSHOT_MAGIC + len(header).to_bytes(4, "little") + header + b" " * padding)
+        for x in ARRAYS:
+            arrays[x].tofile(outfile)
+    os.replace(path + ".tmp", path)
+
+
+class Snapshot:
+
+    def __init__(self, path):
+        """
+        Memory-mapped snapshot file. The arrays habit_ids, days, seconds and offsets are memoryviews of the mapped
+        file, so reading them does not copy or parse anything.
+
+        param path: path of the snapshot file
+        """
+        self.path = path
+        with open(path, "rb") as infile:
+            self.mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.mmap.close()
+            raise ValueError(f"\"{path}\" is not a HabTrack snapshot.")
+        start = len(SNAPSHOT_MAGIC) + 4
+        header_length = int.from_bytes(self.mmap[len(SNAPSHOT_MAGIC):start], "little")
+        self.header = json.loads(self.mmap[start:start + header_length])
+        self.habits = self.header["habits"]
+        self.views = [memoryview(self.mmap)]
+        offset = start + header_length + (-(start + header_length) % 8)
+        for x in ARRAYS:
+            length = self.header["lengths"][x]
+            view = self.views[0][offset:offset + 4 * length].cast("i")
+            self.views.append(view)
+            setattr(self, x, view)
+            offset += 4 * length
+
+    def get_days(self, habit_id):
+        """
+        Return the check-off days of a habit.
+
+        param habit_id: index of the habit in self.habits
+        return: memoryview of the ascending day ordinals
+        """
+        return self.days[self.offsets[habit_id]:self.offsets[habit_id + 1]]
+
+    def get_streaks(self, habit_id):
+        """
+        Calculate the last and longest run streak of a habit.
+
+        param habit_id: index of the habit in self.habits
+        return: last and longest run streak
+        """
+        days = self.get_days(habit_id)
+        if self.habits[habit_id][1] == "weekly":
+            # 0001-01-01 is a Monday, so days of the same week share the same value of (day - 1) // 7
+            return advance_streaks((x - 1) // 7 for x in days)[:2]
+        return advance_streaks(days)[:2]
+
+    def get_all_streaks(self):
+        """
+        Calculate the last and longest run streak of all habits, with NumPy (straight on the mapped arrays) if it
+        is installed.
+
+        return: dictionary habit task -> (last run streak, longest run streak)
+        """
+        np = import_numpy()
+        if np is None:
+            return {x[0]: self.get_streaks(i) for i, x in enumerate(self.habits)}
+        habit_ids = np.frombuffer(self.habit_ids, dtype=np.int32)
+        days = np.frombuffer(self.days, dtype=np.int32).astype(np.int64)
+        weekly = np.array([x[1] == "weekly" for x in self.habits], dtype=bool)
+        periods = np.where(weekly[habit_ids], (days - 1) // 7, days)
+        streaks = calculate_streaks_numpy(habit_ids, periods, len(self.habits))
+        return {x[0]: tuple(y) for x, y in zip(self.habits, streaks)}
+
+    def close(self):
+        """
+        Release the memoryviews and unmap the file.
+
+        return:
+        """
+        for x in reversed(self.views):
+            x.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_snapshot(db, path=None):
+    """
+    Write the snapshot of a profile from scratch.
+
+    param db: an initialized sqlite3 database connection
+    param path: path of the snapshot file (None -> get_snapshot_path(db))
+    return: path of the snapshot file
+    """
+    path = path or get_snapshot_path(db)
+    signature = get_source_signature(db)
+    habits = [list(x) for x in db.execute("SELECT task, periodicity, creation_date FROM habit ORDER BY task")]
+    check_offs, last_rowid = read_check_offs(db)
+    save_snapshot(db, path, habits, check_offs, last_rowid, signature)
+    return path
+
+
+def save_snapshot(db, path, habits, check_offs, last_rowid, signature):
+    """
+    Pack check-offs into arrays and write them as snapshot.
+
+    param db: an initialized sqlite3 database connection
+    param path: path of the snapshot file
+    param habits: list of [task, periodicity, creation date], sorted by task
+    param check_offs: dictionary habit task -> sorted list of (day ordinal, seconds of the day)
+    param last_rowid: highest rowid of the tracking table covered by the snapshot
+    param signature: signature of the database file (see get_source_signature)
+    return:
+    """
+    arrays = {x: array("i") for x in ARRAYS}
+    arrays["offsets"].append(0)
+    for i, (task, _, _) in enumerate(habits):
+        rows = check_offs.get(task, [])
+        arrays["habit_ids"].extend([i] * len(rows))
+        arrays["days"].extend(x[0] for x in rows)
+        arrays["seconds"].extend(x[1] for x in rows)
+        arrays["offsets"].append(len(arrays["days"]))
+    # COUNT and TOTAL(day) of the covered rows detect deleted (or replaced) check-offs
+    rows, day_sum = db.execute("SELECT COUNT(*), TOTAL(day) FROM tracking WHERE rowid <= ?", (last_rowid,)).fetchone()
+    write_snapshot(path, {"habits": habits, "last_rowid": last_rowid, "rows": rows, "day_sum": day_sum,
+                          "signature": signature}, arrays)
+
+
+def update_snapshot(db, path=None):
+    """
+    Bring the snapshot of a profile up to date. If the database file did not change, the snapshot is kept. If only
+    check-offs have been added since the snapshot was written, only the new check-offs are read and merged into the
+    snapshot. Otherwise (changed habits, deleted check-offs) the snapshot is written from scratch.
+
+    param db: an initialized sqlite3 database connection
+    param path: path of the snapshot file (None -> get_snapshot_path(db))
+    return: "unchanged", "incremental" or "full"
+    """
+    path = path or get_snapshot_path(db)
+    signature = get_source_signature(db)
+    try:
+        snapshot = Snapshot(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        build_snapshot(db, path)
+        return "full"
+    with snapshot:
+        header = snapshot.header
+        if header["signature"] == signature:
+            return "unchanged"
+        habits = [list(x) for x in db.execute("SELECT task, periodicity, creation_date FROM habit ORDER BY task")]
+        covered = db.execute("SELECT COUNT(*), TOTAL(day) FROM tracking WHERE rowid <= ?",
+                             (header["last_rowid"],)).fetchone()
+        if habits != header["habits"] or list(covered) != [header["rows"], header["day_sum"]] or \
+                header.get("byteorder") != sys.byteorder:
+            incremental = False
+        else:
+            incremental = True
+            new_check_offs, last_rowid = read_check_offs(db, header["last_rowid"])
+            check_offs = {}
+            for i, (task, _, _) in enumerate(habits):
+                start, end = snapshot.offsets[i], snapshot.offsets[i + 1]
+                rows = list(zip(snapshot.days[start:end], snapshot.seconds[start:end]))
+                new_rows = new_check_offs.get(task, [])
+                if rows and new_rows and new_rows[0] < rows[-1]:
+                    # back-dated check-offs are merged, all others are appended
+                    rows = sorted(rows + new_rows)
+                else:
+                    rows += new_rows
+                check_offs[task] = rows
+    if not incremental:
+        build_snapshot(db, path)
+        return "full"
+    save_snapshot(db, path, habits, check_offs, last_rowid, signature)
+    return "incremental"
+
+
+# open snapshots of get_snapshot(): snapshot path -> Snapshot
+open_snapshots = {}
+open_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db):
+    """
+    Return the up-to-date, memory-mapped snapshot of a profile. Snapshots stay mapped between calls and are only
+    mapped again after they have been updated. An outdated snapshot is not closed, since other threads may still read
+    its arrays: it is unmapped when its last user drops it (and it is garbage-collected).
+
+    param db: an initialized sqlite3 database connection
+    return: Snapshot
+    """
+    path = get_snapshot_path(db)
+    with open_snapshots_lock:
+        snapshot = open_snapshots.get(path)
+        if snapshot is not None and snapshot.header["signature"] == get_source_signature(db):
+            return snapshot
+        # dropped before the update, which replaces the snapshot file (a mapped file can not be replaced on Windows)
+        open_snapshots.pop(path, None)
+        del snapshot
+        update_snapshot(db, path)
+        open_snapshots[path] = Snapshot(path)
+        return open_snapshots[path]
+
+
+def close_snapshots():
+    """
+    Unmap all snapshots opened by get_snapshot().
+
+    return:
+    """
+    with open_snapshots_lock:
+        while open_snapshots:
+            open_snapshots.popitem()[1].close()
+
+
+def get_snapshot_streaks(db, task=None):
+    """
+    Calculate the last and longest run streak of one or all habits from the snapshot of a profile (the "snapshot"
+    streak backend of the analysis module).
+
+    param db: an initialized sqlite3 database connection
+    param task: habit task (None -> all habits)
+    return: dictionary habit task -> (last run streak, longest run streak)
+    """
+    snapshot = get_snapshot(db)
+    if task is None:
+        return snapshot.get_all_streaks()
+    for i, x in enumerate(snapshot.habits):
+        if x[0] == task:
+            return {task: snapshot.get_streaks(i)}
+    return {}
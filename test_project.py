@@ -1,9 +1,30 @@
-from habit import Habit, DBHabit
+from habit import Habit, DBHabit, load_habits
 from db import get_tracking_data, get_db, add_habit, delete_habit, check_off_task, get_db_name, \
-    get_databases, get_creation_date, get_periodicity, get_habit_tasks
+    get_databases, get_creation_date, get_periodicity, get_habit_tasks, get_profile_path, SCHEMA_VERSION, \
+    check_off_many, import_tracking_data, check_off_task_today, delete_check_off, verify_habit_stats, \
+    get_readonly_db, close_all_dbs, iter_tracking_data, export_tracking_data, delete_profile, consolidate_profiles, \
+    get_habit_bits, get_all_habit_bits, MAX_CACHED_CONNECTIONS
 from analysis import get_overall_longest_streak_all_databases, \
-    get_last_and_longest_streak, get_overall_longest_streak
+    get_last_and_longest_streak, get_overall_longest_streak, calculate_streaks, profile_streak_cache, \
+    get_all_streaks, set_streak_backend, print_currently_tracked_habits, get_period_index, get_period_indices, \
+    count_check_offs, get_overall_longest_streak_parallel, get_habit_range_longest_streak
+from headless import main as headless_main
+from server import HabTrackServer
+from write_queue import ProfileWriter
+from leaderboard import update_leaderboard_index, get_top_habits, get_top_profiles
+from async_db import AsyncProfile, get_async_profile, close_async_profiles
+from load_generator import generate_load
+from benchmark import get_import_times, STARTUP_BUDGET_MS, LAZY_MODULES, generate_profile, run_benchmark_suite, \
+    compare_benchmark_results
 from datetime import date
+import asyncio
+import bitset
+import http.client
+import json
+import os
+import shutil
+import threading
+import sqlite3
 
 
 class TestHabit:
@@ -28,11 +49,18 @@ class TestHabit:
         # A copy of "example.db" is kept in the "habit profiles"-folder for usage
         # in HabTrack, e.g. to play around with the analytics functions.
 
-    def test_db(self):
+    def test_db(self, tmp_path):
         db_name = get_db_name(self.db)
         assert db_name == "test.db"
         databases = get_databases("habit profiles\\profiles for testing")
         assert len(databases) == 2
+        # connections dropped from the connection cache stay usable for their holders
+        first = get_db("a.db", str(tmp_path))
+        for x in range(MAX_CACHED_CONNECTIONS + 1):
+            get_db(f"profile_{x}.db", str(tmp_path))
+        add_habit(first, "Reading", "daily", "2022-09-01")
+        assert get_habit_tasks(get_db("a.db", str(tmp_path))) == ["Reading"]
+        first.close()
 
     def test_habit(self):
         habit = Habit("Going for a 30min walk every day", "daily")
@@ -76,6 +104,615 @@ class TestHabit:
         test_habit_2.delete(self.db)
         assert len(habit_data) == 3
 
+    def test_streak_engine(self):
+        assert calculate_streaks([]) == (0, 0)
+        assert calculate_streaks([1, 2, 2, 3, 5, 6]) == (2, 3)
+        # a back-filled check-off closes the gap in the "Gardening" streak
+        check_off_task(self.db, "Gardening for 30min every day", "2022-09-09", "36", "09:00:00")
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (5, 5)
+        # check-offs 2022-09-07 and 2022-09-20 are two weeks apart, 2022-09-20 and 2022-09-29 are in adjacent weeks
+        assert get_last_and_longest_streak(self.db, "Practice Calisthenics in a park once a week") == (2, 2)
+
+    def test_schema_migration(self):
+        legacy_db = sqlite3.connect(get_profile_path("profiles for testing\\legacy.db"))
+        legacy_db.execute("CREATE TABLE habit (task TEXT PRIMARY KEY, periodicity TEXT, creation_date TEXT)")
+        legacy_db.execute("CREATE TABLE tracking (habitTask TEXT, week TEXT, date TEXT, time TEXT)")
+        legacy_db.execute("INSERT INTO habit VALUES ('Reading', 'daily', '2022-09-01')")
+        legacy_db.executemany("INSERT INTO tracking VALUES ('Reading', '35', ?, '10:00:00')",
+                              [("2022-09-03",), ("2022-09-01",), ("2022-09-02",)])
+        legacy_db.commit()
+        legacy_db.close()
+
+        migrated_db = get_db("profiles for testing\\legacy.db")
+        assert migrated_db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert [x[2] for x in get_tracking_data(migrated_db)] == ["2022-09-01", "2022-09-02", "2022-09-03"]
+        assert get_last_and_longest_streak(migrated_db, "Reading") == (3, 3)
+        migrated_db.close()
+        import os
+        os.remove(get_profile_path("profiles for testing\\legacy.db"))
+
+    def test_bulk_import(self, tmp_path):
+        rows = [("Gardening for 30min every day", "2022-09-11"), ("Gardening for 30min every day", "2022-09-12")]
+        assert check_off_many(self.db, rows, chunk_size=1) == 2
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (3, 3)
+
+        csv_file = tmp_path / "import.csv"
+        csv_file.write_text("task,periodicity,date,time\n"
+                            "Meditating,daily,2022-09-02,07:00:00\n"
+                            "Meditating,daily,2022-09-01,07:10:00\n"
+                            "Gardening for 30min every day,,2022-09-13,\n")
+        assert import_tracking_data(self.db, str(csv_file)) == 3
+        assert get_creation_date(self.db, "Meditating") == "2022-09-01"
+        assert get_last_and_longest_streak(self.db, "Meditating") == (2, 2)
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (4, 4)
+        assert get_tracking_data(self.db, "Gardening for 30min every day")[-1][1] == "37"
+        # check-offs without time get the current time
+        assert None not in get_tracking_data(self.db, "Gardening for 30min every day")[-1]
+
+        # a malformed record is rejected before anything is written
+        for lines in ("Swimming,daily,2022-09-01,\nSwimming,daily,notadate,\n",
+                      "Swimming,daily,01/09/2022,\n", ",daily,2022-09-01,\n", "Swimming,monthly,2022-09-01,\n"):
+            csv_file.write_text("task,periodicity,date,time\n" + lines)
+            try:
+                import_tracking_data(self.db, str(csv_file))
+                assert False
+            except ValueError:
+                pass
+            assert "Swimming" not in get_habit_tasks(self.db)
+        assert verify_habit_stats(self.db) == []
+
+    def test_check_off_today(self):
+        first_check_off = check_off_task_today(self.db, "Gardening for 30min every day")
+        assert first_check_off == ("Gardening for 30min every day", "daily", True)
+        assert not check_off_task_today(self.db, "Gardening for 30min every day").checked_off
+        # a check-off earlier this week blocks another check-off of a weekly habit
+        monday = date.fromordinal(date.today().toordinal() - date.today().weekday())
+        check_off_task(self.db, "Practice Calisthenics in a park once a week", str(monday), "0", "10:00:00")
+        assert not check_off_task_today(self.db, "Practice Calisthenics in a park once a week").checked_off
+        assert len(get_tracking_data(self.db, "Practice Calisthenics in a park once a week")) == 4
+
+    def test_habit_stats(self):
+        assert verify_habit_stats(self.db) == []
+        check_off_task(self.db, "Gardening for 30min every day", "2022-09-11", "36", "10:00:00")
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (2, 3)
+        assert delete_check_off(self.db, "Gardening for 30min every day", "2022-09-07") == 1
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (2, 2)
+        self.db.execute("UPDATE habit_stats SET longest_streak = 9")
+        assert len(verify_habit_stats(self.db, repair=True)) == 2
+        assert verify_habit_stats(self.db) == []
+
+    def test_habit_bits(self, tmp_path):
+        assert get_habit_bits(self.db, "Gardening for 30min every day") == (
+            "daily", date(2022, 9, 5).toordinal(), 0b101110)
+        # weekly habits have one bit per week
+        assert get_habit_bits(self.db, "Practice Calisthenics in a park once a week")[2] == 0b1101
+        assert bitset.get_streaks(0b1101) == (2, 2)
+        assert count_check_offs(self.db, "Gardening for 30min every day", "2022-09-07", "2022-09-10") == 3
+
+        # check-offs before the creation date move the first period of the bitset
+        check_off_task(self.db, "Gardening for 30min every day", "2022-09-03")
+        check_off_many(self.db, [("Gardening for 30min every day", "2022-09-09")])
+        assert get_habit_bits(self.db, "Gardening for 30min every day")[1:] == (
+            date(2022, 9, 3).toordinal(), 0b11111001)
+        assert delete_check_off(self.db, "Gardening for 30min every day", "2022-09-07") == 1
+        assert get_habit_bits(self.db, "Gardening for 30min every day")[2] == 0b11101001
+        # the week of a deleted check-off stays checked-off while it holds another check-off
+        check_off_task(self.db, "Practice Calisthenics in a park once a week", "2022-09-21")
+        delete_check_off(self.db, "Practice Calisthenics in a park once a week", "2022-09-20")
+        assert get_habit_bits(self.db, "Practice Calisthenics in a park once a week")[2] == 0b1101
+        delete_check_off(self.db, "Practice Calisthenics in a park once a week", "2022-09-21")
+        assert get_habit_bits(self.db, "Practice Calisthenics in a park once a week")[2] == 0b1001
+        assert verify_habit_stats(self.db) == []
+        self.db.execute("UPDATE habit_bits SET bits = NULL")
+        assert len(verify_habit_stats(self.db, repair=True)) == 2
+        assert verify_habit_stats(self.db) == []
+
+        # the consolidated store keeps the bitsets, also of stores created before the bitsets
+        close_all_dbs()
+        directory = str(tmp_path)
+        shutil.copy(get_profile_path("profiles for testing\\test.db"), directory)
+        expected = get_all_habit_bits(get_db("test.db", directory))
+        assert len(expected) == 2
+        consolidate_profiles(directory)
+        store = sqlite3.connect(os.path.join(directory, "profiles.sqlite"))
+        store.execute("DELETE FROM store_habit_bits")
+        store.execute("PRAGMA user_version = 2")
+        store.commit()
+        store.close()
+        db = get_db("test.db", directory)
+        assert get_all_habit_bits(db) == expected
+        add_habit(db, "Reading", "daily", "2022-09-20")
+        assert check_off_task_today(db, "Reading").checked_off
+        assert not check_off_task_today(db, "Reading").checked_off
+        assert get_last_and_longest_streak(db, "Reading", "bitset") == (1, 1)
+        delete_habit(db, "Reading")
+        assert get_habit_bits(db, "Reading") == (None, None, 0)
+        assert db.execute("SELECT COUNT(*) FROM store_habit_bits").fetchone()[0] == 2
+        # deleting a check-off in the store clears its period
+        assert delete_check_off(db, "Gardening for 30min every day", "2022-09-10") == 1
+        assert verify_habit_stats(db) == []
+        assert get_last_and_longest_streak(db, "Gardening for 30min every day", "bitset") == \
+            get_last_and_longest_streak(db, "Gardening for 30min every day", "stats") == (2, 2)
+
+    def test_leaderboard_cache(self, tmp_path):
+        for x in ["anna", "ben"]:
+            profile = get_db(x + ".db", str(tmp_path))
+            add_habit(profile, "Running", "daily", "2022-09-01")
+            check_off_many(profile, [("Running", "2022-09-01"), ("Running", "2022-09-02")])
+            profile.close()
+        assert get_overall_longest_streak_all_databases(str(tmp_path), use_disk_cache=True)[0] == 2
+        assert (tmp_path / "leaderboard_cache.json").exists()
+
+        profile = get_db("ben.db", str(tmp_path))
+        check_off_task(profile, "Running", "2022-09-03", "35", "10:00:00")
+        profile.close()
+        profile_streak_cache.clear()
+        leaderboard = get_overall_longest_streak_all_databases(str(tmp_path), use_disk_cache=True)
+        assert leaderboard == (3, [[["Running"], "ben"]])
+
+    def test_streak_backends(self):
+        check_off_task(self.db, "Practice Calisthenics in a park once a week", "2022-10-04", "40", "10:00:00")
+        check_off_task(self.db, "Practice Calisthenics in a park once a week", "2022-10-05", "40", "10:00:00")
+        example_db = get_readonly_db("profiles for testing\\example.db")
+        for profile in [self.db, example_db]:
+            expected = get_all_streaks(profile, backend="python")
+            assert get_all_streaks(profile, backend="sql") == expected
+            assert get_all_streaks(profile, backend="stats") == expected
+            assert get_all_streaks(profile, backend="numpy") == expected
+            assert get_all_streaks(profile, backend="bitset") == expected
+            for x in get_habit_tasks(profile):
+                assert get_last_and_longest_streak(profile, x, backend="sql") == expected[x]
+                assert get_last_and_longest_streak(profile, x, backend="numpy") == expected[x]
+                assert get_last_and_longest_streak(profile, x, backend="bitset") == expected[x]
+            assert get_overall_longest_streak(profile, backend="sql") == get_overall_longest_streak(profile)
+        example_db.close()
+        set_streak_backend("sql")
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day") == (1, 3)
+        set_streak_backend("stats")
+
+    def test_parallel_analysis(self):
+        directory = "habit profiles\\profiles for testing"
+        example_db = get_readonly_db("example.db", directory)
+        expected = get_overall_longest_streak(example_db)
+        example_db.close()
+        for workers in (1, 2):
+            assert get_overall_longest_streak_parallel("example", directory, workers) == expected
+        # more ranges than habits and a range without the longest streak
+        assert get_overall_longest_streak_parallel("example", directory, 2, chunks_per_worker=10) == expected
+        assert get_habit_range_longest_streak("example", directory, "Going", "Reading") == (
+            6, ["Not using the phone in the morning"])
+        # ties between habits of different ranges are all reported
+        check_off_task(self.db, "Practice Calisthenics in a park once a week", "2022-10-04")
+        assert get_overall_longest_streak_parallel("test", directory, 2) == (
+            3, ["Gardening for 30min every day", "Practice Calisthenics in a park once a week"])
+
+    def test_habit_repository(self, capsys):
+        habits = load_habits(self.db, "weekly")
+        assert [(x.task, x.periodicity, x.creation_date) for x in habits] == \
+               [("Practice Calisthenics in a park once a week", "weekly", "2022-09-07")]
+        assert not hasattr(habits[0], "__dict__")
+        assert [x.task for x in load_habits(self.db)] == get_habit_tasks(self.db)
+        print_currently_tracked_habits(self.db, "daily")
+        assert capsys.readouterr().out == ("Your currently tracked daily habits:\n"
+                                           "1. Gardening for 30min every day (daily, since 2022-09-05)\n")
+
+    def test_streaming_export(self, tmp_path):
+        rows = iter_tracking_data(self.db, start_date="2022-09-07", end_date="2022-09-20", batch_size=2)
+        assert [x[2] for x in rows] == ["2022-09-07", "2022-09-08", "2022-09-10", "2022-09-07", "2022-09-20"]
+        assert len(list(iter_tracking_data(self.db, "Gardening for 30min every day", "2022-09-08"))) == 2
+
+        for file_name in ["export.csv", "export.ndjson"]:
+            assert export_tracking_data(self.db, str(tmp_path / file_name)) == 7
+            copy_db = get_db(file_name + ".db", str(tmp_path))
+            add_habit(copy_db, "Practice Calisthenics in a park once a week", "weekly", "2022-09-07")
+            assert import_tracking_data(copy_db, str(tmp_path / file_name)) == 7
+            assert get_tracking_data(copy_db) == get_tracking_data(self.db)
+            assert get_overall_longest_streak(copy_db) == get_overall_longest_streak(self.db)
+
+    def test_headless_cli(self, tmp_path, capsys):
+        directory = "habit profiles\\profiles for testing"
+        assert headless_main(["checkoff", "--profile", "test", "--directory", directory,
+                              "Gardening for 30min every day"]) == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result["check_offs"] == [{"task": "Gardening for 30min every day", "periodicity": "daily",
+                                         "checked_off": True}]
+
+        batch_file = tmp_path / "batch.txt"
+        batch_file.write_text(f"checkoff --profile test --directory '{directory}' 'Gardening for 30min every day'\n"
+                              f"checkoff --profile test --directory '{directory}' --date 2022-09-09 dummy\n"
+                              f"report --profile test --directory '{directory}' --periodicity weekly\n"
+                              f"export --profile test --directory '{directory}' {tmp_path / 'export.csv'}\n"
+                              f"leaderboard --directory '{directory}'\n")
+        assert headless_main(["batch", str(batch_file)]) == 1
+        results = json.loads(capsys.readouterr().out)
+        assert results[0]["check_offs"][0]["checked_off"] is False
+        assert "error" in results[1]
+        assert results[2]["habits"] == [{"task": "Practice Calisthenics in a park once a week",
+                                         "periodicity": "weekly", "creation_date": "2022-09-07", "last_streak": 2,
+                                         "longest_streak": 2}]
+        assert results[3]["exported"] == 8
+        assert results[4]["longest_streak"] == 8
+
+        # a back-dated check-off stores the ISO week of its date and the current time
+        assert headless_main(["checkoff", "--profile", "test", "--directory", directory, "--date", "2022-09-11",
+                              "Gardening for 30min every day"]) == 0
+        capsys.readouterr()
+        db = get_db("profiles for testing\\test.db")
+        rows = [x for x in get_tracking_data(db, "Gardening for 30min every day") if x[2] == "2022-09-11"]
+        assert len(rows) == 1 and rows[0][1] == "36" and None not in rows[0]
+        try:
+            headless_main(["checkoff", "--profile", "test", "--directory", directory, "--time", "10:00:00",
+                           "Gardening for 30min every day"])
+            assert False
+        except SystemExit:
+            pass
+
+    def test_period_index(self, capsys):
+        index = get_period_index(self.db, "Gardening for 30min every day")
+        assert index.count_check_offs("2022-09-01", "2022-09-30") == 4
+        assert index.get_completion_rate("2022-09-01", "2022-09-11") == 4 / 7  # created on 2022-09-05
+        assert index.get_completion_rate("2022-08-01", "2022-08-31") is None
+        assert index.get_longest_streak("2022-09-01", "2022-09-30") == 3
+        assert index.get_longest_streak("2022-09-07", "2022-09-10") == 2
+        assert index.get_longest_streak("2022-09-09", "2022-09-09") == 0
+        assert [index.get_streak_at(f"2022-09-{x:02}") for x in range(5, 12)] == [0, 1, 2, 3, 0, 1, 0]
+        assert index.get_rolling_consistency("2022-09-10", window=5) == 4 / 5
+        assert index.get_completion_rates("2022-09-01", "2022-09-30", "week")[:3] == [
+            (date(2022, 8, 29), None), (date(2022, 9, 5), 4 / 7), (date(2022, 9, 12), 0.0)]
+        indices = get_period_indices(self.db)
+        weekly = indices["Practice Calisthenics in a park once a week"]
+        assert weekly.get_longest_streak("2022-09-01", "2022-09-30") == 2
+        # the week from 2022-09-26 to 2022-10-02 belongs to both months
+        assert weekly.get_completion_rates("2022-09-01", "2022-10-31", "month") == [
+            (date(2022, 9, 1), 3 / 4), (date(2022, 10, 1), 1 / 6)]
+
+        # the index agrees with the streak engine on every range
+        check_off_task(self.db, "Gardening for 30min every day", "2022-09-13")
+        check_off_task(self.db, "Gardening for 30min every day", "2022-09-14")
+        periods = get_tracking_data(self.db, "Gardening for 30min every day")
+        index = get_period_index(self.db, "Gardening for 30min every day")
+        days = sorted(date.fromisoformat(x[2]).toordinal() for x in periods)
+        for start in range(days[0] - 1, days[-1] + 2):
+            for end in range(start, days[-1] + 2):
+                expected = calculate_streaks([x for x in days if start <= x <= end])[1]
+                assert index.get_longest_streak(date.fromordinal(start), date.fromordinal(end)) == expected
+
+        assert headless_main(["window", "--profile", "test", "--directory", "habit profiles\\profiles for testing",
+                              "--start", "2022-09-01", "--end", "2022-09-30", "--by", "month",
+                              "Gardening for 30min every day"]) == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result["habits"] == [{"task": "Gardening for 30min every day", "periodicity": "daily",
+                                     "check_offs": 6, "completion_rate": 6 / 26, "longest_streak": 3,
+                                     "streak_at_end": 0, "rolling_consistency": 6 / 26,
+                                     "completion_rate_by_month": [{"start": "2022-09-01",
+                                                                   "completion_rate": 6 / 26}]}]
+
+    def test_startup_time(self):
+        # the import time budgets are checked by the benchmark suite (see benchmark.py)
+        for module in STARTUP_BUDGET_MS:
+            assert not [x for x in get_import_times(module) if x.startswith(LAZY_MODULES)]
+
+    def test_server(self):
+        self.db.close()
+        close_all_dbs()
+        server = HabTrackServer("habit profiles\\profiles for testing", workers=4)
+        loop = asyncio.new_event_loop()
+        listener = loop.run_until_complete(server.start(port=0))
+        port = listener.sockets[0].getsockname()[1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+
+            def call(method, path, payload=None):
+                connection.request(method, path, json.dumps(payload) if payload is not None else None)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read())
+
+            status, profiles = call("GET", "/profiles")
+            assert status == 200 and "test" in profiles
+            assert call("GET", "/profiles/../test/habits")[0] == 404
+            assert call("GET", "/profiles/missing/habits")[0] == 404
+            assert call("POST", "/profiles/test/habits", {"task": "Reading", "periodicity": "daily",
+                                                          "creation_date": "2022-09-05"})[0] == 201
+            assert call("POST", "/profiles/test/habits", {"task": "Reading", "periodicity": "daily"})[0] == 409
+            assert call("POST", "/profiles/test/habits", {"task": "Reading"})[0] == 400
+            assert call("POST", "/profiles/test/habits", [])[0] == 400
+            assert call("POST", "/profiles/test/habits/Reading/checkoffs", {"date": "2022-09-05"})[0] == 201
+            assert call("POST", "/profiles/test/habits/Reading/checkoffs", {"date": "2022-09-06"})[0] == 201
+            assert call("POST", "/profiles/test/habits/missing/checkoffs", {"date": "2022-09-06"})[0] == 404
+            status, check_offs = call("GET", "/profiles/test/habits/Reading/checkoffs?start=2022-09-06")
+            assert [x["date"] for x in check_offs] == ["2022-09-06"]
+            # check-offs with a date store the ISO week of the date
+            db = get_readonly_db("test.db", "habit profiles\\profiles for testing")
+            assert [x[1] for x in get_tracking_data(db, "Reading")] == ["36", "36"]
+            db.close()
+            status, streaks = call("GET", "/profiles/test/streaks")
+            assert streaks["habits"]["Reading"] == {"last_streak": 2, "longest_streak": 2}
+            assert streaks["longest_streak"] == {"streak": 3, "habits": ["Gardening for 30min every day"]}
+            assert call("DELETE", "/profiles/test/habits/Reading")[0] == 200
+            assert call("DELETE", "/profiles/test/habits/Reading")[0] == 404
+            assert call("GET", "/leaderboard")[1]["longest_streak"] == 8
+            connection.close()
+
+            report = asyncio.run(generate_load(port=port, profiles=["test"], clients=10, n_requests=20))
+            assert report["requests"] == 200 and report["failed"] == 0
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            listener.close()
+            loop.run_until_complete(listener.wait_closed())
+            loop.close()
+            server.close()
+
+    def test_write_queue(self):
+        writer = ProfileWriter("profiles for testing\\test.db", max_batch_size=50, max_delay_ms=50)
+        # the writes are queued while the writer is held, so that they form exactly one batch
+        held, release = threading.Event(), threading.Event()
+        writer.submit(lambda db: held.set() or release.wait())
+        held.wait()
+        futures = [writer.add_habit("Reading", "weekly", "2022-09-05")]
+        futures += [writer.check_off_today("Reading") for _ in range(20)]
+        futures += [writer.check_off("missing", "2022-09-06"), writer.check_off("Reading", "2022-09-06")]
+        futures += [writer.check_off_today("Gardening for 30min every day") for _ in range(20)]
+        release.set()
+        assert [x.result().checked_off for x in futures[1:21]] == [True] + [False] * 19
+        assert [x.result().checked_off for x in futures[23:]] == [True] + [False] * 19
+        try:
+            futures[21].result()
+            assert False
+        except sqlite3.IntegrityError:
+            pass
+        assert futures[22].result() is None
+        writer.close()
+        assert writer.batches == 2
+        assert [x[2] for x in get_tracking_data(self.db, "Reading")] == ["2022-09-06", str(date.today())]
+        assert get_last_and_longest_streak(self.db, "Gardening for 30min every day")[0] == 1
+        assert verify_habit_stats(self.db) == []
+
+    def test_async_facade(self):
+        directory = "habit profiles\\profiles for testing"
+        endless_query = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+        async def scenario():
+            async with AsyncProfile("test.db", directory, max_pending=2) as profile:
+                assert await profile.check_off_task_today("Gardening for 30min every day") == (
+                    "Gardening for 30min every day", "daily", True)
+                assert len(await profile.get_tracking_data("Gardening for 30min every day")) == 5
+                assert await profile.get_overall_longest_streak() == (3, ["Gardening for 30min every day"])
+
+                # a running query is interrupted, a queued call is dropped, further calls are rejected
+                running = asyncio.ensure_future(profile.call(lambda db: db.execute(endless_query).fetchone()))
+                await asyncio.sleep(0.05)
+                queued = asyncio.ensure_future(profile.check_off_task("Gardening for 30min every day", "2022-09-09"))
+                await asyncio.sleep(0)
+                try:
+                    await profile.call(get_habit_tasks, wait=False)
+                    assert False
+                except asyncio.QueueFull:
+                    pass
+                queued.cancel()
+                running.cancel()
+                for x in (queued, running):
+                    try:
+                        await x
+                        assert False
+                    except asyncio.CancelledError:
+                        pass
+                assert await profile.get_last_and_longest_streak("Gardening for 30min every day") == (1, 3)
+
+            profile = get_async_profile("test.db", directory)
+            assert get_async_profile("test.db", directory) is profile
+            await profile.add_habit("Reading", "daily", "2022-09-01")
+            assert "Reading" in await profile.get_habit_tasks()
+            await close_async_profiles()
+
+        asyncio.run(scenario())
+
+    def test_consolidated_store(self, tmp_path, capsys):
+        self.db.close()
+        close_all_dbs()
+        directory = str(tmp_path)
+        for x in ("test.db", "example.db"):
+            shutil.copy(get_profile_path("profiles for testing\\" + x), directory)
+        expected = {x: get_all_streaks(get_db(x + ".db", directory)) for x in ("test", "example")}
+        expected_leaderboard = get_overall_longest_streak_all_databases(directory)
+        expected_tracking = get_tracking_data(get_db("test.db", directory))
+
+        assert headless_main(["consolidate", "--directory", directory]) == 0
+        assert sorted(json.loads(capsys.readouterr().out)["consolidated"]) == ["example", "test"]
+        assert sorted(os.listdir(directory)) == ["profiles.sqlite"]
+        assert get_databases(directory) == ["example", "test"]
+        for x in ("test", "example"):
+            db = get_db(x + ".db", directory)
+            assert get_db_name(db) == x + ".db"
+            for backend in ("stats", "python", "sql"):
+                assert get_all_streaks(db, backend) == expected[x]
+        assert get_overall_longest_streak_all_databases(directory) == expected_leaderboard
+        db = get_readonly_db("test.db", directory)
+        assert get_tracking_data(db) == expected_tracking
+        db.close()
+
+        db = get_db("test.db", directory)
+        assert check_off_task_today(db, "Gardening for 30min every day").checked_off
+        assert not check_off_task_today(db, "Gardening for 30min every day").checked_off
+        try:
+            check_off_task(db, "missing", "2022-09-06")
+            assert False
+        except sqlite3.IntegrityError:
+            pass
+        assert check_off_many(db, [("Gardening for 30min every day", "2022-09-11"),
+                                   ("Gardening for 30min every day", "2022-09-12")]) == 2
+        assert check_off_many(db, [("Gardening for 30min every day", "2022-09-13")], chunk_size=1) == 1
+        assert delete_check_off(db, "Gardening for 30min every day", "2022-09-12") == 1
+        assert delete_check_off(db, "Gardening for 30min every day", "2022-09-12") == 0
+        delete_habit(db, "Practice Calisthenics in a park once a week")
+        assert verify_habit_stats(db) == []
+        add_habit(get_db("new.db", directory), "Reading", "daily", "2022-09-05")
+        assert get_databases(directory) == ["example", "new", "test"]
+        delete_profile("new.db", directory)
+        assert get_databases(directory) == ["example", "test"]
+
+        assert headless_main(["split", "--directory", directory]) == 0
+        assert sorted(os.listdir(directory)) == ["example.db", "test.db"]
+        db = get_db("test.db", directory)
+        assert get_habit_tasks(db) == ["Gardening for 30min every day"]
+        assert len(get_tracking_data(db)) == len(expected_tracking) - 3 + 1 + 2
+        assert verify_habit_stats(db) == []
+        assert get_all_streaks(get_db("example.db", directory)) == expected["example"]
+
+    def test_leaderboard_index(self, tmp_path, capsys):
+        self.db.close()
+        close_all_dbs()
+        directory = str(tmp_path)
+        for x in ("test.db", "example.db"):
+            shutil.copy(get_profile_path("profiles for testing\\" + x), directory)
+        assert update_leaderboard_index(directory) == ["example", "test"]
+        assert update_leaderboard_index(directory) == []
+
+        assert get_top_habits(directory, "longest_streak", 2) == [
+            {"profile": "example", "task": "Completing one Duolingo French session every day", "periodicity": "daily",
+             "longest_streak": 8},
+            {"profile": "example", "task": "Not using the phone in the morning", "periodicity": "daily",
+             "longest_streak": 6}]
+        assert get_top_habits(directory, "current_streak", 3, "2022-10-04")[2] == {
+            "profile": "test", "task": "Practice Calisthenics in a park once a week", "periodicity": "weekly",
+            "current_streak": 2}
+        assert get_top_habits(directory, "current_streak", 3, "2023-01-01") == []
+        assert get_top_profiles(directory, "longest_streak") == [{"profile": "example", "longest_streak": 8},
+                                                                 {"profile": "test", "longest_streak": 3}]
+        # test: 4 of 30 days and 3 of 5 weeks
+        assert get_top_profiles(directory, "completion_rate", 2, "2022-10-04")[1] == {
+            "profile": "test", "completion_rate": (4 / 30 + 3 / 5) / 2}
+
+        # only changed profiles are analyzed again
+        check_off_task(get_db("test.db", directory), "Gardening for 30min every day", "2022-09-11")
+        close_all_dbs()
+        assert update_leaderboard_index(directory) == ["test"]
+        assert get_top_profiles(directory, "longest_streak")[1] == {"profile": "test", "longest_streak": 3}
+        assert {"profile": "test", "task": "Gardening for 30min every day", "periodicity": "daily",
+                "current_streak": 2} in get_top_habits(directory, "current_streak", 10, "2022-09-12")
+        expected = [get_top_habits(directory, x, 5, "2022-10-04") for x in ("longest_streak", "completion_rate")]
+
+        # a consolidated store is read with one query, unchanged profiles are not rewritten
+        consolidate_profiles(directory)
+        assert update_leaderboard_index(directory) == []
+        assert [get_top_habits(directory, x, 5, "2022-10-04") for x in ("longest_streak", "completion_rate")] == \
+            expected
+        delete_check_off(get_db("test.db", directory), "Gardening for 30min every day", "2022-09-11")
+        close_all_dbs()
+        assert update_leaderboard_index(directory) == ["test"]
+        delete_profile("test.db", directory)
+        close_all_dbs()
+        assert update_leaderboard_index(directory) == ["test"]
+        assert get_top_profiles(directory, "longest_streak") == [{"profile": "example", "longest_streak": 8}]
+
+        assert headless_main(["leaderboard", "--directory", directory, "--top", "1", "--metric", "current_streak",
+                              "--profiles"]) == 0
+        assert json.loads(capsys.readouterr().out)["metric"] == "current_streak"
+        try:
+            get_top_habits(directory, "streak")
+            assert False
+        except ValueError:
+            pass
+
+    def test_benchmark_suite(self, tmp_path):
+        for x in ("a", "b"):
+            (tmp_path / x).mkdir()
+            assert generate_profile("profile.db", str(tmp_path / x), 20, 200, 70, "bursty", seed=1) > 0
+        data = [get_tracking_data(get_db("profile.db", str(tmp_path / x))) for x in ("a", "b")]
+        assert data[0] == data[1]
+        generate_profile("weekends.db", str(tmp_path), 20, 200, gap_pattern="weekends", weekly_share=0)
+        weekdays = {date.fromisoformat(x[2]).weekday() for x in get_tracking_data(get_db("weekends.db", str(tmp_path)))}
+        assert weekdays == {0, 1, 2, 3, 4}
+
+        suite = run_benchmark_suite("tiny", str(tmp_path / "results.json"))
+        assert json.loads((tmp_path / "results.json").read_text()) == suite
+        assert "get_overall_longest_streak_all_databases" in suite["results"]
+        assert compare_benchmark_results(str(tmp_path / "results.json"), suite) == {}
+        slower = {**suite, "results": {x: y * 2 for x, y in suite["results"].items()}}
+        assert set(compare_benchmark_results(suite, slower)) == set(suite["results"])
+
+    def test_instrumentation(self, capsys):
+        import instrumentation
+        import db
+        original_get_db = db.get_db
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            assert db.get_db is not original_get_db
+            connection = db.get_db("profiles for testing\\test.db")
+            for x in db.get_habit_tasks(connection):
+                db.check_off_task_today(connection, x)
+            assert len(list(db.iter_tracking_data(connection, batch_size=2))) == 9
+            report = instrumentation.get_report()
+        finally:
+            instrumentation.disable()
+        assert db.get_db is original_get_db
+        assert report["functions"]["db.check_off_task_today"]["calls"] == 2
+        assert report["functions"]["db.check_off_task"]["statements"] > 0
+        assert report["functions"]["db.iter_tracking_data"] == {"calls": 1, "seconds": report["functions"][
+            "db.iter_tracking_data"]["seconds"], "statements": 1, "rows": 9}
+        assert report["functions"]["db.get_habit_tasks"]["rows"] == 2
+        assert set(report["tasks"]) == {"Gardening for 30min every day", "Practice Calisthenics in a park once a week"}
+        assert any(x.startswith("INSERT INTO tracking") for x in report["statements"])
+        assert "db.check_off_task_today" in instrumentation.format_report()
+
+        instrumentation.reset()
+        assert headless_main(["--instrument", "report", "--profile", "test", "--directory",
+                              "habit profiles\\profiles for testing"]) == 0
+        output = capsys.readouterr()
+        assert json.loads(output.out)["profile"] == "test"
+        assert "analysis.get_all_streaks" in output.err
+        assert not instrumentation.is_enabled()
+
+    def test_snapshot(self, tmp_path):
+        from snapshot import update_snapshot, get_snapshot, close_snapshots, Snapshot
+        self.db.close()
+        close_all_dbs()
+        directory = str(tmp_path)
+        shutil.copy(get_profile_path("profiles for testing\\test.db"), directory)
+        db = get_db("test.db", directory)
+        try:
+            assert update_snapshot(db) == "full"
+            assert update_snapshot(db) == "unchanged"
+            with Snapshot(str(tmp_path / "test.snapshot")) as snapshot:
+                assert [x[0] for x in snapshot.habits] == get_habit_tasks(db)
+                assert list(snapshot.offsets) == [0, 4, 7]
+                assert list(snapshot.get_days(0)) == [date(2022, 9, x).toordinal() for x in (6, 7, 8, 10)]
+                assert snapshot.seconds[0] == 14 * 3600 + 45 * 60 + 3
+            task = "Gardening for 30min every day"
+            # appended check-off, back-dated check-off, deleted check-off, new habit
+            for changes, mode in [(lambda: check_off_task(db, task, "2022-09-11"), "incremental"),
+                                  (lambda: check_off_task(db, task, "2022-09-09"), "incremental"),
+                                  (lambda: delete_check_off(db, task, "2022-09-07"), "full"),
+                                  (lambda: add_habit(db, "Reading", "weekly", "2022-09-05"), "full")]:
+                changes()
+                assert update_snapshot(db) == mode
+                assert get_all_streaks(db, "snapshot") == get_all_streaks(db, "python")
+            check_off_task(db, "Reading", "2022-09-12")
+            snapshot = get_snapshot(db)
+            assert get_snapshot(db) is snapshot
+            assert get_last_and_longest_streak(db, "Reading", "snapshot") == (1, 1)
+            assert get_last_and_longest_streak(db, "missing", "snapshot") == (0, 0)
+            # an outdated snapshot stays readable for its users
+            days = snapshot.get_days(len(snapshot.habits) - 1)
+            check_off_task(db, "Reading", "2022-09-19")
+            assert get_snapshot(db) is not snapshot
+            assert list(days) == [date(2022, 9, 12).toordinal()]
+            assert snapshot.get_streaks(len(snapshot.habits) - 1) == (1, 1)
+            del days, snapshot
+            close_snapshots()
+
+            close_all_dbs()
+            consolidate_profiles(directory)
+            db = get_db("test.db", directory)
+            assert get_all_streaks(db, "snapshot") == get_all_streaks(db, "python")
+            check_off_task(db, "Reading", "2022-09-26")
+            assert get_all_streaks(db, "snapshot") == get_all_streaks(db, "python")
+        finally:
+            close_snapshots()
+
     def test_example_data(self):
         self.db = get_db("profiles for testing\\example.db")
         habit_tasks = get_habit_tasks(self.db)
@@ -108,10 +745,14 @@ class TestHabit:
         assert longest_streak_over_all_databases[0] == 8
         assert longest_streak_over_all_databases[1][0][0][0] == "Completing one Duolingo French session every day"
         assert longest_streak_over_all_databases[1][0][1] + ".db" == "example.db"
+        profile_streak_cache.clear()
+        assert get_overall_longest_streak_all_databases(directory="habit profiles\\profiles for testing", workers=2,
+                                                        use_processes=True) == longest_streak_over_all_databases
 
     def teardown_method(self):
         self.db.close()
+        close_all_dbs()
         import os
-        os.remove("habit profiles\\profiles for testing\\test.db")
-        # since the database "example.db" is not altered during the testing,
-        # there is no need to reset it after every testing run.
+        os.remove(get_profile_path("profiles for testing\\test.db"))
+        # since the data of the database "example.db" is not altered during the testing (it is only migrated to
+        # the current schema version when it is opened), there is no need to reset it after every testing run.
@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from db import open_db, add_habit, delete_habit, check_off_task, check_off_task_today
+
+
+class ProfileWriter:
+
+    def __init__(self, name, directory="habit profiles", max_batch_size=100, max_delay_ms=0):
+        """
+        Writer of a habit profile that commits pending writes together ("group commit"). All writes are executed
+        by one writer thread with its own connection. Writes that are queued while a batch is committed form the next
+        batch, which can be extended by waiting max_delay_ms for further writes. A batch holds at most max_batch_size
+        writes and is committed in a single transaction.
+        Every write runs in its own savepoint, so a failing write does not affect the other writes of its batch, and
+        sees the writes before it, so the de-duplication of check_off_today() also holds within a batch.
+
+        param name: name of the db-file
+        param directory: directory of the database
+        param max_batch_size: maximum number of writes per transaction
+        param max_delay_ms: time (in ms) a batch waits for further writes (0 -> no waiting)
+        """
+        self.name = name
+        self.directory = directory
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.thread = threading.Thread(target=self.run, name=f"habtrack-writer-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        """
+        Queue function(db, *args) to be run in the next batch. The function must not commit.
+
+        param function: function to run
+        param args: further arguments of the function
+        return: concurrent.futures.Future with the result of the function, set once its batch has been committed
+        """
+        future = Future()
+        self.pending.put((function, args, future))
+        return future
+
+    def add_habit(self, task, periodicity, creation_date):
+        """
+        Queue the creation of a habit (see db.add_habit).
+
+        return: Future
+        """
+        return self.submit(add_habit, task, periodicity, creation_date, False)
+
+    def delete_habit(self, task):
+        """
+        Queue the deletion of a habit (see db.delete_habit).
+
+        return: Future
+        """
+        return self.submit(delete_habit, task, False)
+
+    def check_off(self, task, check_off_date=None, check_off_week=None, check_off_time=None):
+        """
+        Queue a check-off of a habit task (see db.check_off_task).
+
+        return: Future
+        """
+        return self.submit(check_off_task, task, check_off_date, check_off_week, check_off_time, False)
+
+    def check_off_today(self, task):
+        """
+        Queue a check-off of a habit task in the current period (see db.check_off_task_today).
+
+        return: Future with the CheckOffResult
+        """
+        return self.submit(check_off_task_today, task, False)
+
+    def next_batch(self):
+        """
+        Wait for the next batch of pending writes.
+
+        return: list of pending writes (None at the end marks a closed writer)
+        """
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_delay
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            try:
+                # writes queued while the previous batch was committed are taken without waiting
+                timeout = deadline - time.monotonic()
+                batch.append(self.pending.get(timeout=timeout) if timeout > 0 else self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Main loop of the writer thread: execute and commit the pending writes batch by batch.
+
+        return:
+        """
+        db = open_db(self.name, self.directory)
+        try:
+            while True:
+                batch = self.next_batch()
+                writes = [x for x in batch if x is not None]
+                if writes:
+                    self.execute(db, writes)
+                if batch[-1] is None:
+                    break
+        finally:
+            db.close()
+
+    def execute(self, db, writes):
+        """
+        Execute a batch of writes in a single transaction.
+
+        param db: connection of the writer thread
+        param writes: list of (function, args, future)
+        return:
+        """
+        results = []
+        cur = db.cursor()
+        try:
+            cur.execute("BEGIN")
+            for function, args, future in writes:
+                cur.execute("SAVEPOINT write")
+                try:
+                    results.append((future, function(db, *args), None))
+                except Exception as error:
+                    cur.execute("ROLLBACK TO write")
+                    results.append((future, None, error))
+                cur.execute("RELEASE write")
+            db.commit()
+        except Exception as error:
+            if db.in_transaction:
+                db.rollback()
+            results = [(x[2], None, error) for x in writes]
+        self.batches += 1
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """
+        Commit all pending writes and stop the writer thread.
+
+        return:
+        """
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()